@@ -0,0 +1,40 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+class AsyncKeyValueStore(ABC):
+    @abstractmethod
+    async def put(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        # With a ttl in seconds, the key reads as deleted once it passes.
+        pass
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        pass
+
+    async def multi_get(self, keys: Iterable[str]) -> Dict[str, Optional[bytes]]:
+        keys = list(keys)
+        values = await asyncio.gather(*(self.get(key) for key in keys))
+        return dict(zip(keys, values))
+
+    @abstractmethod
+    async def write_batch(self, operations: List[Tuple[str, str, Optional[bytes]]]) -> None:
+        # ("put", key, value) and ("delete", key, None), applied atomically;
+        # ("put", key, value, ttl) for a put that expires.
+        pass
+
+    @abstractmethod
+    def scan(self, start: Optional[str] = None, end: Optional[str] = None,
+             limit: Optional[int] = None) -> AsyncIterator[Tuple[str, bytes]]:
+        # Live keys in order from start (inclusive) to end (exclusive).
+        pass
+
+    async def prefix(self, prefix: str) -> AsyncIterator[Tuple[str, bytes]]:
+        async for key, value in self.scan(start=prefix):
+            if not key.startswith(prefix):
+                return
+            yield key, value
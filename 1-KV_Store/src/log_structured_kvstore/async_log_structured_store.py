@@ -0,0 +1,173 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+from .async_key_value_store import AsyncKeyValueStore
+from .expiry import with_ttl
+from .log_structured_store import MAX_FROZEN_MEMTABLES, LogStructuredStore, check_key, check_operations
+from .metrics import Metrics
+from .config import Config
+
+# Entries fetched per executor hop while scanning.
+SCAN_CHUNK = 256
+
+class AsyncLogStructuredStore(AsyncKeyValueStore):
+    # Runs a LogStructuredStore without ever blocking the event loop. Reads
+    # that the memtables can answer stay on the loop; segment reads go to a
+    # bounded pool. Writes from all coroutines are queued and handed to one
+    # writer thread as a single batch, so they share a WAL record and its
+    # fsync, and a slow fsync never ties up more than that one thread.
+    # Memtable flushes run as a background task on their own thread.
+    def __init__(self, store: LogStructuredStore, io_workers: Optional[int] = None):
+        self.store = store
+        store.auto_flush = False
+        self._reads = ThreadPoolExecutor(io_workers or store.config.async_io_workers, "kv-read")
+        self._writes = ThreadPoolExecutor(1, "kv-write")
+        self._flushes = ThreadPoolExecutor(1, "kv-flush")
+        self._pending: List[Tuple[List[Tuple[str, str, Optional[bytes]]], asyncio.Future]] = []
+        self._writer: Optional[asyncio.Task] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self.last_flush_error: Optional[BaseException] = None
+
+    @classmethod
+    async def open(cls, directory: str, config: Config) -> 'AsyncLogStructuredStore':
+        # Opening replays the WAL, which is file I/O too.
+        store = await asyncio.get_running_loop().run_in_executor(None, LogStructuredStore, directory, config)
+        return cls(store)
+
+    async def put(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        # The expiry is fixed now, not when the queued write is applied.
+        check_key(key)
+        await self._submit([("put", key, with_ttl(value, ttl, self.store.clock()))])
+
+    async def get(self, key: str) -> Optional[bytes]:
+        # A memtable hit is answered here, so it is timed here too; misses
+        # are timed by the store's own get().
+        started = time.perf_counter_ns()
+        found, value = self.store.lookup_memtables(key)
+        if found:
+            self.store.metrics.record("get", started, key=key)
+            return value
+        return await self._read(self.store.get, key)
+
+    async def delete(self, key: str) -> None:
+        check_key(key)
+        await self._submit([("delete", key, None)])
+
+    async def multi_get(self, keys: Iterable[str]) -> Dict[str, Optional[bytes]]:
+        return await self._read(self.store.multi_get, list(keys))
+
+    async def write_batch(self, operations: List[Tuple[str, str, Optional[bytes]]]) -> None:
+        operations = list(operations)
+        # Checked here so one bad batch cannot fail the others it is queued with.
+        check_operations(operations)
+        # As in put(), expiries are fixed on submission, not once the queue
+        # reaches the batch.
+        now = self.store.clock()
+        operations = [operation if len(operation) == 3 else (operation[0], operation[1],
+                                                             with_ttl(operation[2], operation[3], now))
+                      for operation in operations]
+        if operations:
+            await self._submit(operations)
+
+    async def scan(self, start: Optional[str] = None, end: Optional[str] = None,
+                   limit: Optional[int] = None) -> AsyncIterator[Tuple[str, bytes]]:
+        entries = self.store.scan(start, end, limit)
+        while True:
+            chunk = await self._read(_take, entries, SCAN_CHUNK)
+            for entry in chunk:
+                yield entry
+            if len(chunk) < SCAN_CHUNK:
+                return
+
+    async def flush(self) -> None:
+        await self._drain()
+        await asyncio.get_running_loop().run_in_executor(self._flushes, self.store.flush)
+        self._raise_flush_error()
+
+    async def compact(self) -> None:
+        await self.flush()
+        await self._read(self.store.compact)
+
+    async def ingest_segments(self, paths: Iterable[str], move: bool = False) -> None:
+        # Queued writes land first, so the ingested files are newer than them.
+        await self._drain()
+        await self._read(self.store.ingest_segments, list(paths), move)
+
+    async def wait_for_compaction(self) -> None:
+        await self._read(self.store.wait_for_compaction)
+
+    def get_statistics(self) -> Dict[str, any]:
+        return self.store.get_statistics()
+
+    @property
+    def metrics(self) -> Metrics:
+        return self.store.metrics
+
+    async def close(self) -> None:
+        await self._drain()
+        if self._flusher is not None:
+            await self._flusher
+        await self._read(self.store.close)
+        for executor in (self._reads, self._writes, self._flushes):
+            executor.shutdown()
+        self._raise_flush_error()
+
+    async def _read(self, function: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._reads, function, *args)
+
+    async def _submit(self, operations: List[Tuple[str, str, Optional[bytes]]]) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((operations, future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.get_running_loop().create_task(self._write_pending())
+        await future
+
+    async def _write_pending(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            batch, self._pending = self._pending, []
+            operations = [operation for request, _ in batch for operation in request]
+            try:
+                await loop.run_in_executor(self._writes, self.store.write_batch, operations)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+            self._schedule_flush()
+            if self.store.pending_flushes > MAX_FROZEN_MEMTABLES:
+                # Flushing has fallen behind; hold further writes until it
+                # catches up rather than letting memtables pile up.
+                await asyncio.shield(self._flusher)
+
+    async def _drain(self) -> None:
+        while self._writer is not None and not self._writer.done():
+            await asyncio.shield(self._writer)
+
+    def _schedule_flush(self) -> None:
+        if self.store.pending_flushes and (self._flusher is None or self._flusher.done()):
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_in_background())
+
+    async def _flush_in_background(self) -> None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._flushes, self.store.flush_frozen)
+        except Exception as e:
+            # The memtables stay frozen and readable; the next flush retries.
+            self.last_flush_error = e
+
+    def _raise_flush_error(self) -> None:
+        if self.last_flush_error is not None:
+            error, self.last_flush_error = self.last_flush_error, None
+            raise error
+
+def _take(entries: Iterable[Tuple[str, bytes]], count: int) -> List[Tuple[str, bytes]]:
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) == count:
+            break
+    return chunk
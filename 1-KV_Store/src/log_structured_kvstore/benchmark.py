@@ -0,0 +1,391 @@
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+from .key_value_store import KeyValueStore
+from .log_structured_store import LogStructuredStore
+from .sharded_store import ShardedStore
+from .config import Config
+
+# A YCSB-style load generator. Each workload is a mix of operations over a
+# key space that is loaded first (record_count keys) and then exercised for
+# operation_count operations spread across threads. Results are plain dicts
+# so they can be dumped as JSON and compared against an earlier run.
+
+OPERATIONS = ("read", "update", "insert", "scan", "read_modify_write")
+DISTRIBUTIONS = ("zipfian", "uniform", "latest")
+ZIPFIAN_CONSTANT = 0.99
+FNV_OFFSET_BASIS = 0xCBF29CE484222325
+FNV_PRIME = 0x100000001B3
+
+class Workload(NamedTuple):
+    name: str
+    # Proportions of each operation; they need not add up to exactly 1.
+    read: float = 0.0
+    update: float = 0.0
+    insert: float = 0.0
+    scan: float = 0.0
+    read_modify_write: float = 0.0
+    # How existing keys are picked for reads, updates and scans.
+    distribution: str = "zipfian"
+    # Whether record_count keys are loaded before the timed run.
+    load: bool = True
+    # Inserts in key order (fillseq) rather than scattered over the key space.
+    ordered_keys: bool = False
+
+WORKLOADS: Dict[str, Workload] = {workload.name: workload for workload in (
+    Workload("ycsb-a", read=0.5, update=0.5),
+    Workload("ycsb-b", read=0.95, update=0.05),
+    Workload("ycsb-c", read=1.0),
+    Workload("ycsb-d", read=0.95, insert=0.05, distribution="latest"),
+    Workload("ycsb-e", scan=0.95, insert=0.05),
+    Workload("ycsb-f", read=0.5, read_modify_write=0.5),
+    Workload("fillseq", insert=1.0, load=False, ordered_keys=True),
+    # Overwrites random keys of an empty store, so the run also measures
+    # how compaction copes with updates.
+    Workload("fillrandom", update=1.0, distribution="uniform", load=False),
+    Workload("readrandom", read=1.0, distribution="uniform"),
+    Workload("seekrandom", scan=1.0, distribution="uniform"),
+)}
+
+class BenchmarkOptions(NamedTuple):
+    record_count: int = 10000
+    operation_count: int = 10000
+    key_size: int = 24
+    value_size: int = 100
+    threads: int = 1
+    # Overrides the workload's own distribution when set.
+    distribution: Optional[str] = None
+    # Scans read between 1 and max_scan_length keys.
+    max_scan_length: int = 100
+    seed: int = 0
+
+def fnv_hash(number: int) -> int:
+    # 64-bit FNV-1a over the bytes of number, as YCSB scatters its keys.
+    hashed = FNV_OFFSET_BASIS
+    for _ in range(8):
+        hashed = ((hashed ^ (number & 0xFF)) * FNV_PRIME) & 0xFFFFFFFFFFFFFFFF
+        number >>= 8
+    return hashed
+
+def format_key(number: int, key_size: int, ordered: bool = False) -> str:
+    # key_size is a minimum: scattered keys never shrink below their 20
+    # hash digits, so distinct numbers keep distinct keys.
+    digits = str(number) if ordered else str(fnv_hash(number))
+    return "user" + digits.zfill(key_size - 4)
+
+class ZipfianGenerator:
+    # Item numbers in [0, items) where item i is picked with probability
+    # proportional to 1 / (i + 1) ** theta (Gray et al., "Quickly generating
+    # billion-record synthetic databases"). With scrambled set, the popular
+    # items are hashed across the range instead of crowding at its start.
+    def __init__(self, items: int, theta: float = ZIPFIAN_CONSTANT, scrambled: bool = True):
+        if items < 1:
+            raise ValueError("A zipfian distribution needs at least one item")
+        self.items = items
+        self.theta = theta
+        self.scrambled = scrambled
+        self.zeta = sum(1.0 / (i ** theta) for i in range(1, items + 1))
+        self.alpha = 1.0 / (1.0 - theta)
+        zeta2 = 1.0 + 0.5 ** theta
+        self.eta = (1.0 - (2.0 / items) ** (1.0 - theta)) / (1.0 - zeta2 / self.zeta)
+        self._second = zeta2
+
+    def next(self, rng: random.Random) -> int:
+        u = rng.random()
+        uz = u * self.zeta
+        if uz < 1.0:
+            item = 0
+        elif uz < self._second:
+            item = 1
+        else:
+            item = min(self.items - 1, int(self.items * (self.eta * u - self.eta + 1.0) ** self.alpha))
+        return fnv_hash(item) % self.items if self.scrambled else item
+
+class _KeySpace:
+    # The key numbers written so far: loaded keys are 0..loaded-1 and each
+    # insert takes the next number.
+    def __init__(self, loaded: int):
+        self.count = loaded
+        self._lock = threading.Lock()
+
+    def insert(self) -> int:
+        with self._lock:
+            number = self.count
+            self.count += 1
+            return number
+
+class _Runner:
+    def __init__(self, store: KeyValueStore, workload: Workload, options: BenchmarkOptions, key_space: _KeySpace):
+        self.store = store
+        self.workload = workload
+        self.options = options
+        self.key_space = key_space
+        self.distribution = options.distribution or workload.distribution
+        if self.distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown distribution {self.distribution!r}; expected one of {DISTRIBUTIONS}")
+        self.choices = [operation for operation in OPERATIONS if getattr(workload, operation) > 0]
+        if not self.choices:
+            raise ValueError(f"Workload {workload.name} has no operations")
+        self.weights = [getattr(workload, operation) for operation in self.choices]
+        self.zipfian = ZipfianGenerator(max(1, options.record_count), scrambled=self.distribution == "zipfian")
+        # Values are slices of one random buffer, so generating them costs
+        # next to nothing next to the store operations being measured.
+        self.values = os.urandom(max(1 << 20, 2 * options.value_size))
+        self.written = set()
+        self.user_bytes = 0
+        self._lock = threading.Lock()
+
+    def key(self, number: int) -> str:
+        return format_key(number, self.options.key_size, self.workload.ordered_keys)
+
+    def value(self, rng: random.Random) -> bytes:
+        start = rng.randrange(len(self.values) - self.options.value_size + 1)
+        return self.values[start:start + self.options.value_size]
+
+    def existing(self, rng: random.Random) -> int:
+        count = max(1, self.key_space.count)
+        if self.distribution == "uniform":
+            # Without a load phase the whole key space is fair game.
+            return rng.randrange(count if self.workload.load else max(1, self.options.record_count))
+        if self.distribution == "latest":
+            return max(0, count - 1 - self.zipfian.next(rng))
+        return self.zipfian.next(rng)
+
+    def write(self, number: int, rng: random.Random) -> None:
+        key = self.key(number)
+        value = self.value(rng)
+        self.store.put(key, value)
+        with self._lock:
+            self.written.add(number)
+            self.user_bytes += len(key) + len(value)
+
+    def operate(self, operation: str, rng: random.Random) -> None:
+        if operation == "read":
+            self.store.get(self.key(self.existing(rng)))
+        elif operation == "update":
+            self.write(self.existing(rng), rng)
+        elif operation == "insert":
+            self.write(self.key_space.insert(), rng)
+        elif operation == "scan":
+            length = rng.randint(1, self.options.max_scan_length)
+            for _ in self.store.scan(start=self.key(self.existing(rng)), limit=length):
+                pass
+        else:
+            number = self.existing(rng)
+            self.store.get(self.key(number))
+            self.write(number, rng)
+
+    def run(self, thread: int, operations: int, latencies: Dict[str, List[int]]) -> None:
+        rng = random.Random(self.options.seed * 1000003 + thread)
+        for operation in rng.choices(self.choices, self.weights, k=operations):
+            start = time.perf_counter_ns()
+            self.operate(operation, rng)
+            latencies[operation].append(time.perf_counter_ns() - start)
+
+def percentile(ordered: List[int], fraction: float) -> int:
+    # Nearest-rank percentile of an already sorted list.
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))]
+
+def summarize_latencies(latencies: List[int]) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "mean_us": sum(ordered) / len(ordered) / 1000,
+        "p50_us": percentile(ordered, 0.5) / 1000,
+        "p99_us": percentile(ordered, 0.99) / 1000,
+        "p999_us": percentile(ordered, 0.999) / 1000,
+        "max_us": ordered[-1] / 1000,
+    }
+
+def _statistics(store: KeyValueStore) -> Dict[str, Any]:
+    get_statistics = getattr(store, "get_statistics", None)
+    return get_statistics() if get_statistics is not None else {}
+
+def _directory_bytes(directory: str) -> int:
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                # Compaction removed it between the listing and the stat.
+                pass
+    return total
+
+def _phase(operations: int, seconds: float) -> Dict[str, float]:
+    return {"operations": operations, "seconds": seconds, "throughput": operations / seconds if seconds else 0.0}
+
+def run_benchmark(store: KeyValueStore, workload: Workload,
+                  options: BenchmarkOptions = BenchmarkOptions()) -> Dict[str, Any]:
+    if options.threads < 1:
+        raise ValueError("threads must be at least 1")
+    if options.key_size < 5 or options.value_size < 1:
+        raise ValueError("key_size must be at least 5 and value_size at least 1")
+    before = _statistics(store)
+    key_space = _KeySpace(options.record_count if workload.load else 0)
+    runner = _Runner(store, workload, options, key_space)
+    result: Dict[str, Any] = {
+        "workload": workload.name,
+        "store": type(store).__name__,
+        "distribution": runner.distribution,
+        "options": options._asdict(),
+        "load": None,
+    }
+
+    if workload.load:
+        rng = random.Random(options.seed)
+        start = time.perf_counter()
+        for number in range(options.record_count):
+            runner.write(number, rng)
+        result["load"] = _phase(options.record_count, time.perf_counter() - start)
+
+    latencies = [{operation: [] for operation in runner.choices} for _ in range(options.threads)]
+    shares = [options.operation_count // options.threads + (thread < options.operation_count % options.threads)
+              for thread in range(options.threads)]
+    errors = []
+
+    def work(thread: int) -> None:
+        try:
+            runner.run(thread, shares[thread], latencies[thread])
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(thread,)) for thread in range(options.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result["run"] = _phase(options.operation_count, time.perf_counter() - start)
+    if errors:
+        raise errors[0]
+
+    result["latency"] = {}
+    for operation in runner.choices:
+        merged = [latency for per_thread in latencies for latency in per_thread[operation]]
+        if merged:
+            result["latency"][operation] = summarize_latencies(merged)
+    result["amplification"] = _amplification(store, runner, before)
+    return result
+
+def _amplification(store: KeyValueStore, runner: _Runner, before: Dict[str, Any]) -> Dict[str, Any]:
+    # Write amplification is what the store wrote to disk (WAL, flushes,
+    # compactions, value logs) per byte the benchmark wrote; space
+    # amplification is the store's size on disk per byte of live data.
+    after = _statistics(store)
+    written = None
+    if "disk_bytes_written" in after:
+        written = after["disk_bytes_written"] - before.get("disk_bytes_written", 0)
+    live = len(runner.written) * (len(runner.key(0)) + runner.options.value_size)
+    directory = getattr(store, "directory", None)
+    disk = _directory_bytes(directory) if directory is not None else None
+    return {
+        "user_bytes_written": runner.user_bytes,
+        "disk_bytes_written": written,
+        "write": written / runner.user_bytes if written is not None and runner.user_bytes else None,
+        "live_bytes": live,
+        "disk_bytes": disk,
+        "space": disk / live if disk is not None and live else None,
+    }
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    # Ratios of this run to the baseline for every workload both ran:
+    # throughput above 1 and latency below 1 are improvements.
+    earlier = {result["workload"]: result for result in baseline}
+    comparison = {}
+    for result in results:
+        old = earlier.get(result["workload"])
+        if old is None:
+            continue
+        entry = {"throughput": _ratio(result["run"]["throughput"], old["run"]["throughput"]), "p99": {}}
+        for operation, latency in result["latency"].items():
+            if operation in old["latency"]:
+                entry["p99"][operation] = _ratio(latency["p99_us"], old["latency"][operation]["p99_us"])
+        comparison[result["workload"]] = entry
+    return comparison
+
+def _ratio(new: float, old: float) -> Optional[float]:
+    return new / old if old else None
+
+def open_store(directory: str, config: Config) -> KeyValueStore:
+    if config.shard_count > 1:
+        return ShardedStore(directory, config)
+    return LogStructuredStore(directory, config)
+
+def run_workloads(names: List[str], directory: str, config: Config, options: BenchmarkOptions,
+                  store_factory: Callable[[str, Config], KeyValueStore] = open_store) -> List[Dict[str, Any]]:
+    # Every workload starts from an empty store in its own subdirectory.
+    results = []
+    for name in names:
+        if name not in WORKLOADS:
+            raise ValueError(f"Unknown workload {name!r}; expected one of {tuple(WORKLOADS)}")
+        store = store_factory(os.path.join(directory, name), config)
+        try:
+            results.append(run_benchmark(store, WORKLOADS[name], options))
+        finally:
+            store.close()
+    return results
+
+def main(argv: Optional[List[str]] = None) -> None:
+    defaults = BenchmarkOptions()
+    parser = argparse.ArgumentParser(description="YCSB-style benchmark for the log-structured key-value store")
+    parser.add_argument("--workloads", type=str, default="ycsb-a,ycsb-b,ycsb-c,ycsb-d,ycsb-e,ycsb-f",
+                        help=f"Comma-separated workloads out of {', '.join(WORKLOADS)}")
+    parser.add_argument("--records", type=int, default=defaults.record_count, help="Keys loaded before each run")
+    parser.add_argument("--operations", type=int, default=defaults.operation_count,
+                        help="Operations in each timed run")
+    parser.add_argument("--threads", type=int, default=defaults.threads, help="Client threads")
+    parser.add_argument("--key-size", type=int, default=defaults.key_size, help="Key size in bytes")
+    parser.add_argument("--value-size", type=int, default=defaults.value_size, help="Value size in bytes")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, help="Override every workload's key distribution")
+    parser.add_argument("--max-scan-length", type=int, default=defaults.max_scan_length,
+                        help="Longest scan in scan workloads")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="Random seed")
+    parser.add_argument("--directory", type=str, help="Where to create the stores (default: a temporary directory)")
+    parser.add_argument("--output", type=str, help="Write the JSON results here instead of to stdout")
+    parser.add_argument("--baseline", type=str, help="JSON results of an earlier run to compare against")
+    parser.add_argument("--config", type=str, help="Path to configuration file")
+    parser.add_argument("--segment-size", type=int, help="Segment size in bytes")
+    parser.add_argument("--max-memtable-size", type=int, help="Memtable size in bytes")
+    parser.add_argument("--wal-sync-policy", type=str, help="When the WAL is fsynced: always, batch or never")
+    parser.add_argument("--shard-count", type=int, help="Number of shards (sub-stores) keys are spread across")
+    args = parser.parse_args(argv)
+
+    config = Config.from_args(args)
+    options = BenchmarkOptions(args.records, args.operations, args.key_size, args.value_size, args.threads,
+                               args.distribution, args.max_scan_length, args.seed)
+    names = [name.strip() for name in args.workloads.split(",") if name.strip()]
+    unknown = [name for name in names if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"unknown workloads {', '.join(unknown)}; expected some of {', '.join(WORKLOADS)}")
+    if args.directory is not None and any(os.path.exists(os.path.join(args.directory, name)) for name in names):
+        parser.error(f"{args.directory} already holds a store for one of the workloads")
+
+    directory = args.directory if args.directory is not None else tempfile.mkdtemp(prefix="kvstore-bench-")
+    try:
+        results = run_workloads(names, directory, config, options)
+    finally:
+        if args.directory is None:
+            shutil.rmtree(directory, ignore_errors=True)
+    report: Dict[str, Any] = {"results": results}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(results, json.load(f)["results"])
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
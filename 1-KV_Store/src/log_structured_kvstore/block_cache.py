@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# Bookkeeping charged per cached block on top of its payload.
+BLOCK_OVERHEAD = 64
+
+class BlockCache:
+    # Segmented LRU shared by all segments. A block enters the probationary
+    # segment and is only promoted to the protected one when it is hit again,
+    # so a long scan that touches every block once can flush probation but
+    # never the hot set in protected.
+    def __init__(self, capacity: int, protected_ratio: float = 0.8):
+        self.capacity = capacity
+        self.protected_capacity = int(capacity * protected_ratio)
+        self._probation: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._protected: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._probation_bytes = 0
+        self._protected_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._protected.get(key)
+            if entry is not None:
+                self._protected.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            entry = self._probation.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._probation_bytes -= entry[1]
+            self._protected[key] = entry
+            self._protected_bytes += entry[1]
+            while self._protected_bytes > self.protected_capacity and len(self._protected) > 1:
+                # Demote rather than evict: the block gets another chance.
+                demoted, (value, size) = self._protected.popitem(last=False)
+                self._protected_bytes -= size
+                self._probation[demoted] = (value, size)
+                self._probation_bytes += size
+            self._evict()
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int) -> None:
+        size += BLOCK_OVERHEAD
+        if size > self.capacity:
+            return
+        with self._lock:
+            if key in self._protected or key in self._probation:
+                return
+            self._probation[key] = (value, size)
+            self._probation_bytes += size
+            self._evict()
+
+    def discard(self, owner: Hashable) -> None:
+        # Drops every block whose key starts with owner, e.g. a removed segment.
+        with self._lock:
+            for table in (self._probation, self._protected):
+                for key in [key for key in table if key[0] == owner]:
+                    _, size = table.pop(key)
+                    if table is self._probation:
+                        self._probation_bytes -= size
+                    else:
+                        self._protected_bytes -= size
+
+    @property
+    def size(self) -> int:
+        return self._probation_bytes + self._protected_bytes
+
+    def __len__(self) -> int:
+        return len(self._probation) + len(self._protected)
+
+    def get_statistics(self) -> Dict[str, int]:
+        return {
+            "block_cache_hits": self.hits,
+            "block_cache_misses": self.misses,
+            "block_cache_evictions": self.evictions,
+            "block_cache_bytes": self.size,
+            "block_cache_blocks": len(self),
+        }
+
+    def _evict(self) -> None:
+        while self.size > self.capacity:
+            table = self._probation if self._probation else self._protected
+            _, (_, size) = table.popitem(last=False)
+            if table is self._probation:
+                self._probation_bytes -= size
+            else:
+                self._protected_bytes -= size
+            self.evictions += 1
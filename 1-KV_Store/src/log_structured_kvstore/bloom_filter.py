@@ -1,12 +1,53 @@
+import hashlib
+import math
+import struct
+
+# bit count, hash count
+_HEADER = struct.Struct("<QB")
+DEFAULT_NUM_HASHES = 7
+
 class BloomFilter:
-    def __init__(self, size: int):
-        # TODO: Initialize Bloom filter with given size
-        pass
+    def __init__(self, size: int, num_hashes: int = DEFAULT_NUM_HASHES):
+        self.size = max(size, 8)
+        self.num_hashes = num_hashes
+        self.bits = bytearray((self.size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, expected_items: int, false_positive_rate: float) -> 'BloomFilter':
+        # Standard sizing: m = -n ln p / (ln 2)^2 bits and k = (m / n) ln 2 hashes.
+        expected_items = max(expected_items, 1)
+        size = math.ceil(-expected_items * math.log(false_positive_rate) / math.log(2) ** 2)
+        num_hashes = max(1, round(size / expected_items * math.log(2)))
+        return cls(size, num_hashes)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'BloomFilter':
+        size, num_hashes = _HEADER.unpack_from(data, 0)
+        bloom = cls(size, num_hashes)
+        bits = data[_HEADER.size:]
+        if len(bits) != len(bloom.bits):
+            raise ValueError(f"Bloom filter of {size} bits needs {len(bloom.bits)} bytes, got {len(bits)}")
+        bloom.bits[:] = bits
+        return bloom
+
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(self.size, self.num_hashes) + bytes(self.bits)
 
     def add(self, key: str) -> None:
-        # TODO: Add key to Bloom filter
-        pass
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
 
     def may_contain(self, key: str) -> bool:
-        # TODO: Check if key may be in Bloom filter
-        pass
\ No newline at end of file
+        for position in self._positions(key):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def _positions(self, key: str):
+        # Kirsch-Mitzenmacher double hashing: two independent 64-bit hashes
+        # from one digest stand in for k hash functions, g_i = h1 + i * h2.
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        h2 |= 1  # an even stride could cycle through only part of the table
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.size
@@ -1,5 +1,6 @@
 from .key_value_store import KeyValueStore
 from .config import Config
+from .metrics import export_prometheus
 from typing import List
 
 class CLI:
@@ -29,6 +30,8 @@ class CLI:
                     self.handle_list()
                 elif command == "stats":
                     self.handle_stats()
+                elif command == "metrics":
+                    self.handle_metrics()
                 elif command == "compact":
                     self.handle_compact()
                 else:
@@ -43,6 +46,7 @@ class CLI:
         print("  delete  - Delete a key-value pair")
         print("  list    - List all keys in the store")
         print("  stats   - Show store statistics")
+        print("  metrics - Show statistics and latency histograms in Prometheus format")
         print("  compact - Trigger log compaction")
         print("  help    - Show this help message")
         print("  exit    - Exit the program")
@@ -50,7 +54,8 @@ class CLI:
     def handle_put(self) -> None:
         key = input("Enter key: ").strip()
         value = input("Enter value: ").encode()
-        self.store.put(key, value)
+        ttl = input("Expire after how many seconds (blank to keep): ").strip()
+        self.store.put(key, value, float(ttl) if ttl else None)
         print(f"Stored key '{key}' with value '{value.decode()}'")
 
     def handle_get(self) -> None:
@@ -81,17 +86,13 @@ class CLI:
         for key, value in stats.items():
             print(f"  {key}: {value}")
 
+    def handle_metrics(self) -> None:
+        print(export_prometheus(self.store), end="")
+
     def handle_compact(self) -> None:
         print("Triggering log compaction...")
         self.store.compact()
         print("Log compaction completed.")
 
     def get_all_keys(self) -> List[str]:
-        # This method assumes that the store has a way to iterate over all keys.
-        # If not, you may need to implement this functionality in the LogStructuredStore class.
-        # For now, we'll return an empty list as a placeholder.
-        return []
-
-# Note: The actual implementation of get_all_keys() will depend on how
-# the LogStructuredStore is implemented. Students will need to add this
-# functionality to the LogStructuredStore class.
\ No newline at end of file
+        return [key for key, _ in self.store.scan()]
\ No newline at end of file
@@ -0,0 +1,78 @@
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+from .server import encode_command
+
+Argument = Union[str, bytes]
+
+class ServerError(Exception):
+    pass
+
+class Client:
+    # A small asyncio client for the server. pipeline() sends any number of
+    # commands in one write and reads their replies in order.
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+
+    @classmethod
+    async def connect(cls, host: str = "127.0.0.1", port: int = 7379) -> 'Client':
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def pipeline(self, commands: Iterable[Sequence[Argument]]) -> List[Any]:
+        # Error replies come back as ServerError instances rather than being
+        # raised, so one failed command does not hide the others' replies.
+        commands = list(commands)
+        self._writer.write(b"".join(encode_command(*map(_encode, command)) for command in commands))
+        await self._writer.drain()
+        return [await self._read_reply() for _ in commands]
+
+    async def execute(self, *arguments: Argument) -> Any:
+        reply = (await self.pipeline([arguments]))[0]
+        if isinstance(reply, ServerError):
+            raise reply
+        return reply
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.execute("GET", key)
+
+    async def put(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            await self.execute("SET", key, value)
+        else:
+            # Sent in milliseconds, so fractional seconds survive.
+            await self.execute("SET", key, value, "PX", str(max(1, round(ttl * 1000))))
+
+    async def delete(self, key: str) -> None:
+        await self.execute("DEL", key)
+
+    async def multi_get(self, keys: Iterable[str]) -> Dict[str, Optional[bytes]]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        return dict(zip(keys, await self.execute("MGET", *keys)))
+
+    async def close(self) -> None:
+        self._writer.close()
+        await self._writer.wait_closed()
+
+    async def _read_reply(self) -> Any:
+        line = await self._reader.readuntil(b"\r\n")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            return ServerError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            return (await self._reader.readexactly(length + 2))[:-2]
+        if kind == b"*":
+            return [await self._read_reply() for _ in range(int(body))]
+        raise ServerError(f"Unexpected reply {line!r}")
+
+def _encode(argument: Argument) -> bytes:
+    return argument.encode() if isinstance(argument, str) else argument
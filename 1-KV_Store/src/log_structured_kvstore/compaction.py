@@ -0,0 +1,282 @@
+import bisect
+import heapq
+import itertools
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from .config import Config
+from .expiry import ExpiringValue
+from .segment import Segment
+
+def merge_segments(segments: List[Segment]) -> Iterator[Tuple[str, int, Optional[memoryview]]]:
+    return merge_versions([segment.iterate_versions() for segment in segments])
+
+def merge_entries(streams: List[Iterator[Tuple[str, Any]]]) -> Iterator[Tuple[str, Any]]:
+    # Streaming k-way merge of sorted streams: one entry per input is held at
+    # a time, so memory use does not depend on input size. For duplicate keys
+    # the newest stream (the highest position in the list) wins.
+    ranked = [_ranked(stream, rank) for rank, stream in enumerate(streams)]
+    last_key = None
+    for key, _, value in heapq.merge(*ranked, key=lambda entry: entry[:2]):
+        if key != last_key:
+            last_key = key
+            yield key, value
+
+def merge_versions(streams: List[Iterator[Tuple[str, int, Any]]]) -> Iterator[Tuple[str, int, Any]]:
+    # The same merge for (key, sequence, value) streams: every version is
+    # kept, ordered by key and then oldest first. A version present in more
+    # than one stream is yielded once.
+    last = None
+    for entry in heapq.merge(*streams, key=lambda entry: entry[:2]):
+        if entry[:2] != last:
+            last = entry[:2]
+            yield entry
+
+def visible_versions(versions: Iterator[Tuple[str, int, Any]], snapshots: List[int],
+                     drop_tombstones: bool = False, now: Optional[int] = None) -> Iterator[Tuple[str, int, Any]]:
+    # Garbage-collects merged versions: keeps each key's newest version and,
+    # for every live snapshot, the newest version at or below it. Tombstones
+    # that would be the oldest thing left for a key can go when nothing
+    # older outside the inputs can hold the key. Given the time, values
+    # expired by then become tombstones: they still shadow older versions.
+    snapshots = sorted(snapshots)
+    for key, group in itertools.groupby(versions, key=lambda entry: entry[0]):
+        group = list(group)
+        if now is not None:
+            group = [(key, sequence, None if isinstance(value, ExpiringValue) and value.expires_at <= now else value)
+                     for _, sequence, value in group]
+        keep = {len(group) - 1}
+        if snapshots:
+            sequences = [sequence for _, sequence, _ in group]
+            for snapshot in snapshots:
+                position = bisect.bisect_right(sequences, snapshot) - 1
+                if position >= 0:
+                    keep.add(position)
+        kept = [group[position] for position in sorted(keep)]
+        if drop_tombstones:
+            while kept and kept[0][2] is None:
+                kept.pop(0)
+        yield from kept
+
+def versions_at(versions: Iterator[Tuple[str, int, Any]], sequence: Optional[int] = None) -> Iterator[Tuple[str, Any]]:
+    # Collapses merged versions to what a reader at sequence sees: the newest
+    # version at or below it per key, tombstones included.
+    for key, group in itertools.groupby(versions, key=lambda entry: entry[0]):
+        visible = None
+        for _, version_sequence, value in group:
+            if sequence is not None and version_sequence > sequence:
+                break
+            visible = (key, value)
+        if visible is not None:
+            yield visible
+
+def _ranked(stream: Iterator[Tuple[str, Any]], rank: int) -> Iterator[Tuple[str, int, Any]]:
+    for key, value in stream:
+        yield key, -rank, value
+
+class RateLimiter:
+    # Caps compaction I/O so foreground reads and writes keep their share of
+    # the disk (and of the GIL). A rate of 0 disables throttling.
+    def __init__(self, bytes_per_second: int):
+        self.bytes_per_second = bytes_per_second
+        self._start = time.monotonic()
+        self._consumed = 0
+
+    def consume(self, nbytes: int) -> None:
+        if self.bytes_per_second <= 0:
+            return
+        self._consumed += nbytes
+        ahead = self._consumed / self.bytes_per_second - (time.monotonic() - self._start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+class CompactionTask(NamedTuple):
+    # Inputs in store order (oldest first), the level the output lands on,
+    # whether tombstones can be dropped (nothing older outside the inputs can
+    # hold the key) and the size at which output segments are split.
+    inputs: List[Segment]
+    output_level: int
+    drop_tombstones: bool
+    max_output_size: Optional[int] = None
+
+class CompactionStrategy(ABC):
+    name = ""
+
+    def __init__(self, config: Config):
+        self.config = config
+
+    @abstractmethod
+    def pick(self, segments: List[Segment]) -> Optional[CompactionTask]:
+        pass
+
+    @abstractmethod
+    def full_compaction(self, segments: List[Segment]) -> Optional[CompactionTask]:
+        pass
+
+    def order(self, segments: List[Segment]) -> List[Segment]:
+        # Puts a segment list back into newest-wins order after a swap.
+        return segments
+
+    def ingest_level(self, segments: List[Segment], segment: Segment) -> int:
+        # The level for an ingested segment, which is newer than everything
+        # in segments. Level 0 at the end of the list is always correct.
+        return 0
+
+    @abstractmethod
+    def sorted_runs(self, segments: List[Segment]) -> int:
+        # How many segments a point lookup may have to consult in the worst case.
+        pass
+
+    @abstractmethod
+    def bottom_bytes(self, segments: List[Segment]) -> int:
+        # Size of the oldest, fully merged data; the rest is overhead that
+        # compaction has yet to reclaim.
+        pass
+
+    def amplification(self, segments: List[Segment], flushed_bytes: int, compacted_bytes: int) -> Dict[str, float]:
+        total = sum(segment.offset for segment in segments)
+        return {
+            "write_amplification": (flushed_bytes + compacted_bytes) / flushed_bytes if flushed_bytes else 0.0,
+            "read_amplification": float(self.sorted_runs(segments)),
+            "space_amplification": total / self.bottom_bytes(segments) if segments else 0.0,
+        }
+
+class SizeTieredStrategy(CompactionStrategy):
+    # Merges runs of similarly sized segments: every byte is rewritten about
+    # once per tier, which keeps ingest cheap, at the cost of more segments
+    # to search and duplicate data waiting in the larger tiers.
+    name = "size_tiered"
+    bucket_low = 0.5
+    bucket_high = 1.5
+    max_inputs = 32
+
+    def pick(self, segments: List[Segment]) -> Optional[CompactionTask]:
+        # Only adjacent segments may be merged: the output takes their place
+        # in the newest-wins order, so it must not jump over anything.
+        best: Optional[Tuple[int, int]] = None
+        start = 0
+        while start < len(segments):
+            end = start + 1
+            total = segments[start].offset
+            while end < len(segments) and end - start < self.max_inputs:
+                average = total / (end - start)
+                if not self.bucket_low * average <= segments[end].offset <= self.bucket_high * average:
+                    break
+                total += segments[end].offset
+                end += 1
+            if end - start >= self.config.compaction_threshold:
+                if best is None or end - start > best[1] - best[0]:
+                    best = (start, end)
+            start = end
+        if best is None:
+            return None
+        start, end = best
+        return CompactionTask(segments[start:end], 0, drop_tombstones=start == 0)
+
+    def full_compaction(self, segments: List[Segment]) -> Optional[CompactionTask]:
+        if not segments:
+            return None
+        return CompactionTask(list(segments), 0, drop_tombstones=True)
+
+    def sorted_runs(self, segments: List[Segment]) -> int:
+        return len(segments)
+
+    def bottom_bytes(self, segments: List[Segment]) -> int:
+        return max(segments[0].offset, 1)
+
+class LeveledStrategy(CompactionStrategy):
+    # Level 0 holds fresh flushes. Every deeper level is one sorted run of
+    # non-overlapping segments, each level `level_size_multiplier` times
+    # larger than the one above. A lookup consults every level-0 segment plus
+    # at most one segment per deeper level.
+    name = "leveled"
+
+    def __init__(self, config: Config):
+        super().__init__(config)
+        # Where the last compaction out of each level stopped, so successive
+        # compactions sweep the whole key space round-robin.
+        self._cursors: Dict[int, str] = {}
+
+    def level_limit(self, level: int) -> int:
+        base = self.config.segment_size * self.config.compaction_threshold
+        return base * self.config.level_size_multiplier ** (level - 1)
+
+    def pick(self, segments: List[Segment]) -> Optional[CompactionTask]:
+        levels = _group_by_level(segments)
+        level_zero = levels.get(0, [])
+        if len(level_zero) >= self.config.compaction_threshold:
+            return self._task(segments, levels, level_zero, 1)
+        for level in sorted(levels):
+            if level == 0 or sum(s.offset for s in levels[level]) <= self.level_limit(level):
+                continue
+            candidates = sorted(levels[level], key=lambda s: s.min_key)
+            cursor = self._cursors.get(level)
+            chosen = next((s for s in candidates if cursor is None or s.min_key > cursor), candidates[0])
+            self._cursors[level] = chosen.max_key
+            return self._task(segments, levels, [chosen], level + 1)
+        return None
+
+    def full_compaction(self, segments: List[Segment]) -> Optional[CompactionTask]:
+        if not segments:
+            return None
+        bottom = max(1, max(segment.level for segment in segments))
+        return CompactionTask(list(segments), bottom, drop_tombstones=True,
+                              max_output_size=self.config.segment_size)
+
+    def order(self, segments: List[Segment]) -> List[Segment]:
+        # Deeper levels hold older data, so they go first. The sort is
+        # stable, keeping level 0 in flush order; segments within a deeper
+        # level never overlap, so their relative order does not matter.
+        return sorted(segments, key=lambda segment: -segment.level)
+
+    def ingest_level(self, segments: List[Segment], segment: Segment) -> int:
+        # As deep as possible, so a bulk load is not compacted all over again:
+        # every segment at or above the level must miss the ingested key
+        # range, since the order puts those after it and they would shadow
+        # it. Otherwise the bottom level, or a new one below it if the bottom
+        # has no room left.
+        levels = _group_by_level(segments)
+        overlapping = [s.level for s in segments if s.min_key <= segment.max_key and s.max_key >= segment.min_key]
+        level = max(levels, default=1) or 1
+        while sum(s.offset for s in levels.get(level, [])) + segment.offset > self.level_limit(level):
+            level += 1
+        if overlapping:
+            level = min(level, min(overlapping) - 1)
+        return max(level, 0)
+
+    def sorted_runs(self, segments: List[Segment]) -> int:
+        levels = _group_by_level(segments)
+        return len(levels.get(0, [])) + sum(1 for level in levels if level > 0)
+
+    def bottom_bytes(self, segments: List[Segment]) -> int:
+        levels = _group_by_level(segments)
+        return max(sum(segment.offset for segment in levels[max(levels)]), 1)
+
+    def _task(self, segments: List[Segment], levels: Dict[int, List[Segment]],
+              sources: List[Segment], output_level: int) -> CompactionTask:
+        low = min(segment.min_key for segment in sources)
+        high = max(segment.max_key for segment in sources)
+        overlapping = [s for s in levels.get(output_level, []) if s.min_key <= high and s.max_key >= low]
+        chosen = set(map(id, sources + overlapping))
+        inputs = [segment for segment in segments if id(segment) in chosen]
+        deepest = max(levels)
+        return CompactionTask(inputs, output_level, drop_tombstones=output_level >= deepest,
+                              max_output_size=self.config.segment_size)
+
+def _group_by_level(segments: List[Segment]) -> Dict[int, List[Segment]]:
+    levels: Dict[int, List[Segment]] = {}
+    for segment in segments:
+        levels.setdefault(segment.level, []).append(segment)
+    return levels
+
+COMPACTION_STRATEGIES = {
+    SizeTieredStrategy.name: SizeTieredStrategy,
+    LeveledStrategy.name: LeveledStrategy,
+}
+
+def create_strategy(config: Config) -> CompactionStrategy:
+    try:
+        return COMPACTION_STRATEGIES[config.compaction_strategy](config)
+    except KeyError:
+        raise ValueError(f"Unknown compaction strategy {config.compaction_strategy!r}; "
+                         f"expected one of {sorted(COMPACTION_STRATEGIES)}") from None
@@ -0,0 +1,34 @@
+import bz2
+import lzma
+import zlib
+from typing import Callable, Dict, NamedTuple
+
+class Codec(NamedTuple):
+    # id is what a segment header records; 0 means blocks are stored raw.
+    id: int
+    name: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+def _identity(data: bytes) -> bytes:
+    return data
+
+CODECS: Dict[str, Codec] = {codec.name: codec for codec in (
+    Codec(0, "none", _identity, _identity),
+    Codec(1, "zlib", zlib.compress, zlib.decompress),
+    Codec(2, "lzma", lzma.compress, lzma.decompress),
+    Codec(3, "bz2", bz2.compress, bz2.decompress),
+)}
+_BY_ID = {codec.id: codec for codec in CODECS.values()}
+# What the decompressors raise for damaged input.
+DECOMPRESSION_ERRORS = (zlib.error, lzma.LZMAError, OSError, EOFError, ValueError)
+
+def codec_by_name(name: str) -> Codec:
+    if name not in CODECS:
+        raise ValueError(f"Unknown compression {name!r}; expected one of {tuple(CODECS)}")
+    return CODECS[name]
+
+def codec_by_id(codec_id: int) -> Codec:
+    if codec_id not in _BY_ID:
+        raise ValueError(f"Unknown compression codec id {codec_id}")
+    return _BY_ID[codec_id]
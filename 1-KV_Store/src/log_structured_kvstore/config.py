@@ -1,29 +1,76 @@
 import configparser
 import argparse
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 class Config:
-    def __init__(self):
+    def __init__(self, config_file: Optional[str] = None):
         self.segment_size: int = 1024 * 1024  # Default: 1MB
         self.compaction_threshold: int = 4  # Default: compact after 4 segments
-        self.bloom_filter_size: int = 10000  # Default: 10,000 bits
+        self.bloom_filter_size: int = 10000  # Default: 10,000 bits (only for segments of unknown key count)
         self.max_memtable_size: int = 1024 * 1024  # Default: 1MB
         self.wal_directory: str = "wal"  # Default: 'wal' subdirectory
+        self.index_interval: int = 4096  # Default: one sparse index entry per 4KB of segment
+        self.wal_sync_policy: str = "always"  # Default: fsync before acknowledging each write
+        self.wal_sync_interval_ms: int = 5  # Default: batch mode syncs at least every 5ms
+        self.wal_sync_bytes: int = 1024 * 1024  # Default: or as soon as 1MB is pending
+        self.wal_file_size: int = 1024 * 1024  # Default: start a new WAL file every 1MB
+        self.background_compaction: bool = True  # Default: compact in a background thread
+        self.compaction_rate_limit: int = 0  # Default: no cap on compaction write rate
+        self.compaction_strategy: str = "size_tiered"  # Default: merge runs of similarly sized segments
+        self.level_size_multiplier: int = 10  # Default: each level is 10x the one above (leveled only)
+        self.bloom_false_positive_rate: float = 0.01  # Default: 1% false positives per segment Bloom filter
+        self.block_cache_size: int = 8 * 1024 * 1024  # Default: 8MB of decoded segment blocks (0 disables); one cache shared by all shards
+        self.async_io_workers: int = 4  # Default: 4 threads for the asyncio front end's file reads
+        self.shard_count: int = 1  # Default: a single store, no sharding
+        self.process_pool_workers: int = 0  # Default: flush and compact in-process
+        self.server_host: str = "127.0.0.1"  # Default: the TCP server (main --serve) only accepts local clients
+        self.server_port: int = 7379  # Default: port 7379, clear of a local Redis on 6379
+        self.server_max_connections: int = 1024  # Default: clients beyond 1024 are turned away with an error
+        self.compression: str = "none"  # Default: blocks are stored raw; zlib, lzma or bz2 compress each sparse-index block
+        self.value_log_threshold: int = 64 * 1024  # Default: values over 64KB live in a value log, segments hold a pointer (0 disables)
+        self.value_log_gc_ratio: float = 0.5  # Default: value log files are rewritten once half their bytes are garbage
+        self.block_restart_interval: int = 16  # Default: every 16th key of a block is stored in full, the rest as a suffix
+        self.metrics_port: int = 0  # Default: no HTTP /metrics endpoint for Prometheus
+
+        if config_file is not None:
+            self._load_file(config_file)
 
     @classmethod
     def from_file(cls, config_file: str) -> 'Config':
-        config = cls()
+        return cls(config_file)
+
+    def _load_file(self, config_file: str) -> None:
         parser = configparser.ConfigParser()
         parser.read(config_file)
 
         if 'DEFAULT' in parser:
-            config.segment_size = parser.getint('DEFAULT', 'segment_size', fallback=config.segment_size)
-            config.compaction_threshold = parser.getint('DEFAULT', 'compaction_threshold', fallback=config.compaction_threshold)
-            config.bloom_filter_size = parser.getint('DEFAULT', 'bloom_filter_size', fallback=config.bloom_filter_size)
-            config.max_memtable_size = parser.getint('DEFAULT', 'max_memtable_size', fallback=config.max_memtable_size)
-            config.wal_directory = parser.get('DEFAULT', 'wal_directory', fallback=config.wal_directory)
-
-        return config
+            self.segment_size = parser.getint('DEFAULT', 'segment_size', fallback=self.segment_size)
+            self.compaction_threshold = parser.getint('DEFAULT', 'compaction_threshold', fallback=self.compaction_threshold)
+            self.bloom_filter_size = parser.getint('DEFAULT', 'bloom_filter_size', fallback=self.bloom_filter_size)
+            self.max_memtable_size = parser.getint('DEFAULT', 'max_memtable_size', fallback=self.max_memtable_size)
+            self.wal_directory = parser.get('DEFAULT', 'wal_directory', fallback=self.wal_directory)
+            self.index_interval = parser.getint('DEFAULT', 'index_interval', fallback=self.index_interval)
+            self.wal_sync_policy = parser.get('DEFAULT', 'wal_sync_policy', fallback=self.wal_sync_policy)
+            self.wal_sync_interval_ms = parser.getint('DEFAULT', 'wal_sync_interval_ms', fallback=self.wal_sync_interval_ms)
+            self.wal_sync_bytes = parser.getint('DEFAULT', 'wal_sync_bytes', fallback=self.wal_sync_bytes)
+            self.wal_file_size = parser.getint('DEFAULT', 'wal_file_size', fallback=self.wal_file_size)
+            self.background_compaction = parser.getboolean('DEFAULT', 'background_compaction', fallback=self.background_compaction)
+            self.compaction_rate_limit = parser.getint('DEFAULT', 'compaction_rate_limit', fallback=self.compaction_rate_limit)
+            self.compaction_strategy = parser.get('DEFAULT', 'compaction_strategy', fallback=self.compaction_strategy)
+            self.level_size_multiplier = parser.getint('DEFAULT', 'level_size_multiplier', fallback=self.level_size_multiplier)
+            self.bloom_false_positive_rate = parser.getfloat('DEFAULT', 'bloom_false_positive_rate', fallback=self.bloom_false_positive_rate)
+            self.block_cache_size = parser.getint('DEFAULT', 'block_cache_size', fallback=self.block_cache_size)
+            self.async_io_workers = parser.getint('DEFAULT', 'async_io_workers', fallback=self.async_io_workers)
+            self.shard_count = parser.getint('DEFAULT', 'shard_count', fallback=self.shard_count)
+            self.process_pool_workers = parser.getint('DEFAULT', 'process_pool_workers', fallback=self.process_pool_workers)
+            self.server_host = parser.get('DEFAULT', 'server_host', fallback=self.server_host)
+            self.server_port = parser.getint('DEFAULT', 'server_port', fallback=self.server_port)
+            self.server_max_connections = parser.getint('DEFAULT', 'server_max_connections', fallback=self.server_max_connections)
+            self.compression = parser.get('DEFAULT', 'compression', fallback=self.compression)
+            self.value_log_threshold = parser.getint('DEFAULT', 'value_log_threshold', fallback=self.value_log_threshold)
+            self.value_log_gc_ratio = parser.getfloat('DEFAULT', 'value_log_gc_ratio', fallback=self.value_log_gc_ratio)
+            self.block_restart_interval = parser.getint('DEFAULT', 'block_restart_interval', fallback=self.block_restart_interval)
+            self.metrics_port = parser.getint('DEFAULT', 'metrics_port', fallback=self.metrics_port)
 
     @classmethod
     def from_dict(cls, config_dict: Dict[str, Any]) -> 'Config':
@@ -33,6 +80,28 @@ class Config:
         config.bloom_filter_size = config_dict.get('bloom_filter_size', config.bloom_filter_size)
         config.max_memtable_size = config_dict.get('max_memtable_size', config.max_memtable_size)
         config.wal_directory = config_dict.get('wal_directory', config.wal_directory)
+        config.index_interval = config_dict.get('index_interval', config.index_interval)
+        config.wal_sync_policy = config_dict.get('wal_sync_policy', config.wal_sync_policy)
+        config.wal_sync_interval_ms = config_dict.get('wal_sync_interval_ms', config.wal_sync_interval_ms)
+        config.wal_sync_bytes = config_dict.get('wal_sync_bytes', config.wal_sync_bytes)
+        config.wal_file_size = config_dict.get('wal_file_size', config.wal_file_size)
+        config.background_compaction = config_dict.get('background_compaction', config.background_compaction)
+        config.compaction_rate_limit = config_dict.get('compaction_rate_limit', config.compaction_rate_limit)
+        config.compaction_strategy = config_dict.get('compaction_strategy', config.compaction_strategy)
+        config.level_size_multiplier = config_dict.get('level_size_multiplier', config.level_size_multiplier)
+        config.bloom_false_positive_rate = config_dict.get('bloom_false_positive_rate', config.bloom_false_positive_rate)
+        config.block_cache_size = config_dict.get('block_cache_size', config.block_cache_size)
+        config.async_io_workers = config_dict.get('async_io_workers', config.async_io_workers)
+        config.shard_count = config_dict.get('shard_count', config.shard_count)
+        config.process_pool_workers = config_dict.get('process_pool_workers', config.process_pool_workers)
+        config.server_host = config_dict.get('server_host', config.server_host)
+        config.server_port = config_dict.get('server_port', config.server_port)
+        config.server_max_connections = config_dict.get('server_max_connections', config.server_max_connections)
+        config.compression = config_dict.get('compression', config.compression)
+        config.value_log_threshold = config_dict.get('value_log_threshold', config.value_log_threshold)
+        config.value_log_gc_ratio = config_dict.get('value_log_gc_ratio', config.value_log_gc_ratio)
+        config.block_restart_interval = config_dict.get('block_restart_interval', config.block_restart_interval)
+        config.metrics_port = config_dict.get('metrics_port', config.metrics_port)
         return config
 
     @classmethod
@@ -51,6 +120,50 @@ class Config:
             config.max_memtable_size = args.max_memtable_size
         if hasattr(args, 'wal_directory') and args.wal_directory is not None:
             config.wal_directory = args.wal_directory
+        if hasattr(args, 'index_interval') and args.index_interval is not None:
+            config.index_interval = args.index_interval
+        if hasattr(args, 'wal_sync_policy') and args.wal_sync_policy is not None:
+            config.wal_sync_policy = args.wal_sync_policy
+        if hasattr(args, 'wal_sync_interval_ms') and args.wal_sync_interval_ms is not None:
+            config.wal_sync_interval_ms = args.wal_sync_interval_ms
+        if hasattr(args, 'wal_sync_bytes') and args.wal_sync_bytes is not None:
+            config.wal_sync_bytes = args.wal_sync_bytes
+        if hasattr(args, 'wal_file_size') and args.wal_file_size is not None:
+            config.wal_file_size = args.wal_file_size
+        if hasattr(args, 'background_compaction') and args.background_compaction is not None:
+            config.background_compaction = args.background_compaction
+        if hasattr(args, 'compaction_rate_limit') and args.compaction_rate_limit is not None:
+            config.compaction_rate_limit = args.compaction_rate_limit
+        if hasattr(args, 'compaction_strategy') and args.compaction_strategy is not None:
+            config.compaction_strategy = args.compaction_strategy
+        if hasattr(args, 'level_size_multiplier') and args.level_size_multiplier is not None:
+            config.level_size_multiplier = args.level_size_multiplier
+        if hasattr(args, 'bloom_false_positive_rate') and args.bloom_false_positive_rate is not None:
+            config.bloom_false_positive_rate = args.bloom_false_positive_rate
+        if hasattr(args, 'block_cache_size') and args.block_cache_size is not None:
+            config.block_cache_size = args.block_cache_size
+        if hasattr(args, 'async_io_workers') and args.async_io_workers is not None:
+            config.async_io_workers = args.async_io_workers
+        if hasattr(args, 'shard_count') and args.shard_count is not None:
+            config.shard_count = args.shard_count
+        if hasattr(args, 'process_pool_workers') and args.process_pool_workers is not None:
+            config.process_pool_workers = args.process_pool_workers
+        if hasattr(args, 'server_host') and args.server_host is not None:
+            config.server_host = args.server_host
+        if hasattr(args, 'server_port') and args.server_port is not None:
+            config.server_port = args.server_port
+        if hasattr(args, 'server_max_connections') and args.server_max_connections is not None:
+            config.server_max_connections = args.server_max_connections
+        if hasattr(args, 'compression') and args.compression is not None:
+            config.compression = args.compression
+        if hasattr(args, 'value_log_threshold') and args.value_log_threshold is not None:
+            config.value_log_threshold = args.value_log_threshold
+        if hasattr(args, 'value_log_gc_ratio') and args.value_log_gc_ratio is not None:
+            config.value_log_gc_ratio = args.value_log_gc_ratio
+        if hasattr(args, 'block_restart_interval') and args.block_restart_interval is not None:
+            config.block_restart_interval = args.block_restart_interval
+        if hasattr(args, 'metrics_port') and args.metrics_port is not None:
+            config.metrics_port = args.metrics_port
 
         return config
 
@@ -60,7 +173,29 @@ class Config:
             'compaction_threshold': self.compaction_threshold,
             'bloom_filter_size': self.bloom_filter_size,
             'max_memtable_size': self.max_memtable_size,
-            'wal_directory': self.wal_directory
+            'wal_directory': self.wal_directory,
+            'index_interval': self.index_interval,
+            'wal_sync_policy': self.wal_sync_policy,
+            'wal_sync_interval_ms': self.wal_sync_interval_ms,
+            'wal_sync_bytes': self.wal_sync_bytes,
+            'wal_file_size': self.wal_file_size,
+            'background_compaction': self.background_compaction,
+            'compaction_rate_limit': self.compaction_rate_limit,
+            'compaction_strategy': self.compaction_strategy,
+            'level_size_multiplier': self.level_size_multiplier,
+            'bloom_false_positive_rate': self.bloom_false_positive_rate,
+            'block_cache_size': self.block_cache_size,
+            'async_io_workers': self.async_io_workers,
+            'shard_count': self.shard_count,
+            'process_pool_workers': self.process_pool_workers,
+            'server_host': self.server_host,
+            'server_port': self.server_port,
+            'server_max_connections': self.server_max_connections,
+            'compression': self.compression,
+            'value_log_threshold': self.value_log_threshold,
+            'value_log_gc_ratio': self.value_log_gc_ratio,
+            'block_restart_interval': self.block_restart_interval,
+            'metrics_port': self.metrics_port
         }
 
     def __str__(self) -> str:
@@ -70,6 +205,28 @@ class Config:
     Bloom Filter Size: {self.bloom_filter_size} bits
     Max MemTable Size: {self.max_memtable_size} bytes
     WAL Directory: {self.wal_directory}
+    Index Interval: {self.index_interval} bytes
+    WAL Sync Policy: {self.wal_sync_policy}
+    WAL Sync Interval: {self.wal_sync_interval_ms} ms
+    WAL Sync Bytes: {self.wal_sync_bytes} bytes
+    WAL File Size: {self.wal_file_size} bytes
+    Background Compaction: {self.background_compaction}
+    Compaction Rate Limit: {self.compaction_rate_limit} bytes/s
+    Compaction Strategy: {self.compaction_strategy}
+    Level Size Multiplier: {self.level_size_multiplier}x
+    Bloom False-Positive Rate: {self.bloom_false_positive_rate}
+    Block Cache Size: {self.block_cache_size} bytes
+    Async I/O Workers: {self.async_io_workers}
+    Shard Count: {self.shard_count}
+    Process Pool Workers: {self.process_pool_workers}
+    Server Host: {self.server_host}
+    Server Port: {self.server_port}
+    Server Max Connections: {self.server_max_connections}
+    Compression: {self.compression}
+    Value Log Threshold: {self.value_log_threshold} bytes
+    Value Log GC Ratio: {self.value_log_gc_ratio}
+    Block Restart Interval: {self.block_restart_interval} keys
+    Metrics Port: {self.metrics_port}
 """
 
 def create_argument_parser() -> argparse.ArgumentParser:
@@ -77,9 +234,31 @@ def create_argument_parser() -> argparse.ArgumentParser:
     parser.add_argument("--config", type=str, help="Path to configuration file")
     parser.add_argument("--segment-size", type=int, help="Segment size in bytes")
     parser.add_argument("--compaction-threshold", type=int, help="Number of segments before compaction")
-    parser.add_argument("--bloom-filter-size", type=int, help="Size of Bloom filter in bits")
+    parser.add_argument("--bloom-filter-size", type=int, help="Bloom filter size in bits for segments whose key count is not known up front")
     parser.add_argument("--max-memtable-size", type=int, help="Maximum size of MemTable in bytes")
     parser.add_argument("--wal-directory", type=str, help="Directory for Write-Ahead Log files")
+    parser.add_argument("--index-interval", type=int, help="Segment bytes covered by each sparse index entry")
+    parser.add_argument("--wal-sync-policy", type=str, help="WAL sync policy: always, batch or never")
+    parser.add_argument("--wal-sync-interval-ms", type=int, help="Maximum delay before a batched WAL sync, in milliseconds")
+    parser.add_argument("--wal-sync-bytes", type=int, help="Pending WAL bytes that force a batched sync")
+    parser.add_argument("--wal-file-size", type=int, help="Size at which the WAL rolls over to a new file")
+    parser.add_argument("--no-background-compaction", dest="background_compaction", action="store_false", default=None, help="Only compact when asked to")
+    parser.add_argument("--compaction-rate-limit", type=int, help="Maximum compaction write rate in bytes per second (0 = unlimited)")
+    parser.add_argument("--compaction-strategy", type=str, help="Compaction strategy: size_tiered or leveled")
+    parser.add_argument("--level-size-multiplier", type=int, help="Size ratio between adjacent levels for leveled compaction")
+    parser.add_argument("--bloom-false-positive-rate", type=float, help="Target false-positive rate of per-segment Bloom filters")
+    parser.add_argument("--block-cache-size", type=int, help="Block cache budget in bytes, across all shards (0 disables the cache)")
+    parser.add_argument("--async-io-workers", type=int, help="Threads the asyncio front end uses for file reads")
+    parser.add_argument("--shard-count", type=int, help="Number of shards (sub-stores) keys are spread across")
+    parser.add_argument("--process-pool-workers", type=int, help="Worker processes for flushes and compactions (0 = in-process)")
+    parser.add_argument("--server-host", type=str, help="Address the TCP server listens on")
+    parser.add_argument("--server-port", type=int, help="Port the TCP server listens on")
+    parser.add_argument("--server-max-connections", type=int, help="Maximum number of concurrent client connections")
+    parser.add_argument("--compression", type=str, help="Codec for newly written segment blocks (none, zlib, lzma, bz2)")
+    parser.add_argument("--value-log-threshold", type=int, help="Values longer than this many bytes go to the value log (0 disables)")
+    parser.add_argument("--value-log-gc-ratio", type=float, help="Fraction of a value log file that must be garbage before it is collected")
+    parser.add_argument("--block-restart-interval", type=int, help="Keys between restart points in a segment block; restart points are binary searched")
+    parser.add_argument("--metrics-port", type=int, help="Port the server exposes Prometheus metrics over HTTP on (0: off)")
     return parser
 
 # Example usage
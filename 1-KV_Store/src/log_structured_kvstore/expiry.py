@@ -0,0 +1,35 @@
+import struct
+import time
+from typing import Any, NamedTuple, Optional, Union
+
+# Values written with a time to live carry the wall-clock time they expire
+# at, in milliseconds since the epoch. An expired value reads like a
+# tombstone; flushes and compactions turn it into one (or drop it), so
+# expiry costs no extra writes.
+
+# Stored ahead of the value in WAL and segment records.
+EXPIRY = struct.Struct("<Q")
+
+class ExpiringValue(NamedTuple):
+    # value is bytes, a view of a segment record or a ValuePointer.
+    value: Any
+    expires_at: int
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+def expiry_for(ttl: float, now: int) -> int:
+    # ttl is in seconds; anything that would round to 0ms still gets 1ms.
+    if not ttl > 0:
+        raise ValueError(f"ttl must be a positive number of seconds, got {ttl!r}")
+    return now + max(1, round(ttl * 1000))
+
+def with_ttl(value: bytes, ttl: Optional[float], now: int) -> Union[bytes, ExpiringValue]:
+    return value if ttl is None else ExpiringValue(value, expiry_for(ttl, now))
+
+def live_value(value: Any, now: int) -> Any:
+    # What a reader at time now sees: None for tombstones and expired values,
+    # the plain value otherwise.
+    if isinstance(value, ExpiringValue):
+        return value.value if value.expires_at > now else None
+    return value
@@ -0,0 +1,81 @@
+import os
+import struct
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+# A hint file sits next to a sealed segment and lists, for every record, the
+# key, where the record starts, how long it is and whether it is a tombstone.
+# Opening a segment from its hints never touches the values in the data file.
+HINT_MAGIC = b"LSKH"
+HINT_VERSION = 1
+HINT_SUFFIX = ".hint"
+# magic, version, reserved
+HINT_HEADER = struct.Struct("<4sHH")
+# record offset, record size, flags, key length
+HINT_ENTRY = struct.Struct("<QIBH")
+# size of the data file described, entry count, crc32 of everything before
+HINT_TRAILER = struct.Struct("<QQI")
+HINT_TOMBSTONE = 0x01
+
+def hint_path(segment_path: str) -> str:
+    return segment_path + HINT_SUFFIX
+
+class HintFileWriter:
+    def __init__(self, segment_path: str):
+        self.file_path = hint_path(segment_path)
+        self._file = open(self.file_path, "wb")
+        self._crc = 0
+        self._entry_count = 0
+        self._write(HINT_HEADER.pack(HINT_MAGIC, HINT_VERSION, 0))
+
+    def add(self, key: bytes, offset: int, size: int, tombstone: bool) -> None:
+        self._write(HINT_ENTRY.pack(offset, size, HINT_TOMBSTONE if tombstone else 0, len(key)) + key)
+        self._entry_count += 1
+
+    def close(self, data_size: int) -> None:
+        self._file.write(HINT_TRAILER.pack(data_size, self._entry_count, self._crc))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def discard(self) -> None:
+        self._file.close()
+        os.remove(self.file_path)
+
+    def rename(self, segment_path: str) -> None:
+        new_path = hint_path(segment_path)
+        os.replace(self.file_path, new_path)
+        self.file_path = new_path
+
+    def _write(self, data: bytes) -> None:
+        self._file.write(data)
+        self._crc = zlib.crc32(data, self._crc)
+
+def read_hint_file(segment_path: str, data_size: int) -> Optional[List[Tuple[str, int, int, bool]]]:
+    # Returns (key, offset, size, tombstone) per record, or None when the hint
+    # file is missing, damaged or describes a different version of the data
+    # file; the caller then falls back to scanning the segment itself.
+    path = hint_path(segment_path)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    if len(data) < HINT_HEADER.size + HINT_TRAILER.size:
+        return None
+    magic, version, _ = HINT_HEADER.unpack_from(data, 0)
+    body_end = len(data) - HINT_TRAILER.size
+    described_size, entry_count, crc = HINT_TRAILER.unpack_from(data, body_end)
+    if (magic != HINT_MAGIC or version != HINT_VERSION or described_size != data_size
+            or zlib.crc32(memoryview(data)[:body_end]) != crc):
+        return None
+    entries = list(_iterate_entries(data, body_end))
+    return entries if len(entries) == entry_count else None
+
+def _iterate_entries(data: bytes, end: int) -> Iterator[Tuple[str, int, int, bool]]:
+    position = HINT_HEADER.size
+    while position < end:
+        offset, size, flags, key_length = HINT_ENTRY.unpack_from(data, position)
+        key_start = position + HINT_ENTRY.size
+        yield data[key_start:key_start + key_length].decode(), offset, size, bool(flags & HINT_TOMBSTONE)
+        position = key_start + key_length
@@ -0,0 +1,85 @@
+import bisect
+from array import array
+from typing import Iterator, List
+
+# Every FENCE_INTERVAL-th key is also kept as a bytes object, so a search
+# bisects those in C and only finishes within one group in Python.
+FENCE_INTERVAL = 16
+
+class KeyArray:
+    # An append-only sequence of strings packed into one buffer, with the
+    # end of each in an array('Q'): about len(key) + 8 bytes per key, where
+    # a list of str costs some 60 bytes of object overhead on top. Indexing
+    # decodes a copy. Searches compare encoded keys, which sort like the
+    # strings since UTF-8 preserves code point order; they assume the keys
+    # were appended in order.
+    def __init__(self):
+        self._blob = bytearray()
+        self._ends = array("Q")
+        self._fences: List[bytes] = []
+
+    def append(self, key: str) -> None:
+        encoded = key.encode()
+        if len(self._ends) % FENCE_INTERVAL == 0:
+            self._fences.append(encoded)
+        self._blob += encoded
+        self._ends.append(len(self._blob))
+
+    def bisect_left(self, key: str) -> int:
+        target = key.encode()
+        group = bisect.bisect_left(self._fences, target) - 1
+        if group < 0:
+            return 0
+        # The group's first key sorts before target, so the answer is past it.
+        blob, ends = self._blob, self._ends
+        low = group * FENCE_INTERVAL + 1
+        high = min(low - 1 + FENCE_INTERVAL, len(ends))
+        while low < high:
+            middle = (low + high) // 2
+            if blob[ends[middle - 1]:ends[middle]] < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def bisect_right(self, key: str) -> int:
+        target = key.encode()
+        group = bisect.bisect_right(self._fences, target) - 1
+        if group < 0:
+            return 0
+        blob, ends = self._blob, self._ends
+        low = group * FENCE_INTERVAL + 1
+        high = min(low - 1 + FENCE_INTERVAL, len(ends))
+        while low < high:
+            middle = (low + high) // 2
+            if target < blob[ends[middle - 1]:ends[middle]]:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def __len__(self) -> int:
+        return len(self._ends)
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self._ends)
+        end = self._ends[index]
+        start = self._ends[index - 1] if index else 0
+        return self._blob[start:end].decode()
+
+    def __iter__(self) -> Iterator[str]:
+        start = 0
+        for end in self._ends:
+            yield self._blob[start:end].decode()
+            start = end
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, KeyArray):
+            return NotImplemented
+        return self._ends == other._ends and self._blob == other._blob
+
+    @property
+    def nbytes(self) -> int:
+        return (len(self._blob) + self._ends.itemsize * len(self._ends)
+                + sum(len(fence) for fence in self._fences))
@@ -1,9 +1,10 @@
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 class KeyValueStore(ABC):
     @abstractmethod
-    def put(self, key: str, value: bytes) -> None:
+    def put(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        # With a ttl in seconds, the key reads as deleted once it passes.
         pass
 
     @abstractmethod
@@ -12,4 +13,25 @@ class KeyValueStore(ABC):
 
     @abstractmethod
     def delete(self, key: str) -> None:
-        pass
\ No newline at end of file
+        pass
+
+    def multi_get(self, keys: Iterable[str]) -> Dict[str, Optional[bytes]]:
+        return {key: self.get(key) for key in keys}
+
+    @abstractmethod
+    def write_batch(self, operations: List[Tuple[str, str, Optional[bytes]]]) -> None:
+        # ("put", key, value) and ("delete", key, None), applied atomically;
+        # ("put", key, value, ttl) for a put that expires.
+        pass
+
+    @abstractmethod
+    def scan(self, start: Optional[str] = None, end: Optional[str] = None,
+             limit: Optional[int] = None) -> Iterator[Tuple[str, bytes]]:
+        # Live keys in order from start (inclusive) to end (exclusive).
+        pass
+
+    def prefix(self, prefix: str) -> Iterator[Tuple[str, bytes]]:
+        for key, value in self.scan(start=prefix):
+            if not key.startswith(prefix):
+                return
+            yield key, value
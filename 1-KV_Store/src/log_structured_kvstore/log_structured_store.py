@@ -1,44 +1,979 @@
-from typing import Dict, Optional
+import math
+import os
+import shutil
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 from .key_value_store import KeyValueStore
-from .bloom_filter import BloomFilter
+from .memtable import MemTable
+from .segment import FILE_HEADER, MAX_KEY_SIZE, Segment
+from .block_cache import BlockCache
+from .compression import codec_by_name
+from .expiry import live_value, now_ms, with_ttl
+from .hint_file import HINT_SUFFIX, hint_path
+from .manifest import Manifest
+from .metrics import Metrics, Tracer
+from .compaction import (CompactionTask, RateLimiter, create_strategy, merge_segments, merge_versions,
+                         versions_at, visible_versions)
+from .segment_writer import SegmentOptions, compact_to_files, flush_to_files, write_segments, write_separated
+from .value_log import VALUE_LOG_PREFIX, ValueLog, ValueLogWriter, ValuePointer, separate_values, value_log_path
 from .write_ahead_log import WriteAheadLog
 from .config import Config
 
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".seg"
+# Writers only wait for a flush once this many memtables are frozen.
+MAX_FROZEN_MEMTABLES = 2
+
+class StoreVersion(NamedTuple):
+    # Everything a read needs, published as one reference. A new version is
+    # installed for every flush and compaction; readers take whichever is
+    # current and never wait. Only the live memtable changes in place, and
+    # only from the writer: a dict insert is atomic, so a reader sees each
+    # key either before or after.
+    memtable: MemTable
+    # Frozen memtables waiting for their segment, oldest first.
+    frozen: Tuple[MemTable, ...]
+    # Oldest to newest; later segments shadow earlier ones.
+    segments: List[Segment]
+    # The value log files the segments point into, by file id.
+    value_logs: Dict[int, ValueLog]
+
+class Snapshot:
+    # A read-only view of the store as of one sequence number. Writes,
+    # flushes and compactions carry on underneath, keeping every version the
+    # view can see until it is released.
+    def __init__(self, store: 'LogStructuredStore', sequence: int):
+        self.store = store
+        self.sequence = sequence
+        self.released = False
+
+    def get(self, key: str) -> Optional[bytes]:
+        self._check()
+        return self.store.get(key, self.sequence)
+
+    def multi_get(self, keys: Iterable[str]) -> Dict[str, Optional[bytes]]:
+        self._check()
+        return self.store.multi_get(keys, self.sequence)
+
+    def scan(self, start: Optional[str] = None, end: Optional[str] = None,
+             limit: Optional[int] = None) -> Iterator[Tuple[str, bytes]]:
+        self._check()
+        return self.store.scan(start, end, limit, self.sequence)
+
+    def prefix(self, prefix: str) -> Iterator[Tuple[str, bytes]]:
+        for key, value in self.scan(start=prefix):
+            if not key.startswith(prefix):
+                return
+            yield key, value
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.store._release_snapshot(self.sequence)
+
+    def __enter__(self) -> 'Snapshot':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+    def _check(self) -> None:
+        if self.released:
+            raise ValueError("Snapshot has been released")
+
+class _PendingWrite:
+    def __init__(self, operations: List[Tuple[str, str, Optional[bytes]]]):
+        self.operations = operations
+        self.done = False
+        self.error: Optional[BaseException] = None
+
 class LogStructuredStore(KeyValueStore):
-    def __init__(self, directory: str, config: Config):
+    def __init__(self, directory: str, config: Config, executor: Optional[Executor] = None,
+                 block_cache: Optional[BlockCache] = None):
         self.directory = directory
         self.config = config
-        self.index: Dict[str, int] = {}
-        self.active_segment = None
-        self.active_segment_offset = 0
-        self.bloom_filter = BloomFilter(config.bloom_filter_size)
-        self.wal = WriteAheadLog(directory)
+        os.makedirs(directory, exist_ok=True)
+        # Flushes and compactions write their segments in this executor when
+        # there is one, so merging and checksumming run outside the GIL.
+        self._owns_executor = executor is None and config.process_pool_workers > 0
+        if self._owns_executor:
+            executor = ProcessPoolExecutor(config.process_pool_workers)
+        self.executor = executor
+        # Unknown codecs are rejected here rather than at the first flush.
+        codec_by_name(config.compression)
+        self.segment_options = SegmentOptions(config.index_interval, config.bloom_false_positive_rate,
+                                              config.bloom_filter_size, config.compression,
+                                              config.value_log_threshold, config.block_restart_interval)
+        # A flushed memtable becomes exactly one segment, so it may outgrow
+        # neither the memory budget nor the segment size.
+        self.memtable_limit = min(config.max_memtable_size, config.segment_size)
+        self._version = StoreVersion(MemTable(self.memtable_limit), (), [], {})
+        self.next_segment_id = 0
+        self.manifest = Manifest(directory)
+        # Every write gets the next sequence number; last_sequence is the
+        # newest one logged. Live snapshots are counted per sequence.
+        self.last_sequence = 0
+        self._snapshots: Counter = Counter()
+        self._snapshot_lock = threading.Lock()
+        self.strategy = create_strategy(config)
+        # A cache passed in is shared with other stores (e.g. sibling shards).
+        if block_cache is None and config.block_cache_size > 0:
+            block_cache = BlockCache(config.block_cache_size)
+        self.block_cache = block_cache
+        # Guards installing versions and the manifest. Readers never take it;
+        # compaction only takes it to pick its inputs and to swap in the result.
+        self._lock = threading.RLock()
+        # Writes queue up and whoever holds the write mutex drains the queue,
+        # logging everything queued as one WAL record: a single writer at a
+        # time, with callers that arrive during an fsync sharing the next one.
+        self._write_queue: List[_PendingWrite] = []
+        self._queue_lock = threading.Lock()
+        self._write_mutex = threading.Lock()
+        # Frozen memtables and the WAL file id that checkpoints each, written
+        # out in order by whoever holds the flush mutex.
+        self._flush_queue: Deque[Tuple[MemTable, int]] = deque()
+        self._flush_mutex = threading.Lock()
+        # With auto_flush off, writers leave frozen memtables to whoever
+        # drives the store (e.g. the asyncio front end) to flush_frozen().
+        self.auto_flush = True
+        self._compaction_mutex = threading.Lock()
+        self.compaction_count = 0
+        self.compaction_bytes_written = 0
+        self.flush_bytes_written = 0
+        self.value_log_bytes_written = 0
+        self.value_log_collections = 0
+        self.value_log_bytes_relocated = 0
+        self.expired_segments_dropped = 0
+        self.expired_bytes_dropped = 0
+        self.segments_ingested = 0
+        self.ingested_bytes = 0
+        # Milliseconds since the epoch; time to live is measured against it.
+        self.clock = now_ms
+        # Segment bytes written by flushes, compactions and value log
+        # collection, by the level they were written to.
+        self.bytes_written_per_level: Dict[int, int] = {}
+        self.metrics = Metrics()
+        self.last_compaction_error: Optional[BaseException] = None
+        # Set while a flush of a frozen memtable keeps failing; flush()
+        # raises it, writers only leave it here.
+        self.last_flush_error: Optional[BaseException] = None
+        self._load_segments()
+        self.wal = WriteAheadLog(os.path.join(directory, config.wal_directory), config.wal_sync_policy,
+                                 config.wal_sync_interval_ms, config.wal_sync_bytes, config.wal_file_size,
+                                 self.metrics)
+        self._closing = False
+        # Flushes bump the request counter; the worker records which request
+        # it last served so wait_for_compaction() knows when it is idle.
+        self._compaction_cond = threading.Condition()
+        self._compaction_requested = 0
+        self._compaction_served = 0
+        self._compaction_thread = None
+        if config.background_compaction:
+            self._compaction_thread = threading.Thread(target=self._compact_in_background,
+                                                       name="compaction", daemon=True)
+            self._compaction_thread.start()
+        self.recover()
 
-    def put(self, key: str, value: bytes) -> None:
-        # TODO: Implement put operation
-        # Don't forget to update the WAL and Bloom filter
-        pass
+    @property
+    def memtable(self) -> MemTable:
+        return self._version.memtable
 
-    def get(self, key: str) -> Optional[bytes]:
-        # TODO: Implement get operation
-        # Use Bloom filter for optimization
-        pass
+    @property
+    def segments(self) -> List[Segment]:
+        return self._version.segments
+
+    @property
+    def pending_flushes(self) -> int:
+        return len(self._flush_queue)
+
+    def put(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        # With a ttl (in seconds), the key reads as deleted once it passes.
+        started = time.perf_counter_ns()
+        check_key(key)
+        self._write([("put", key, with_ttl(value, ttl, self.clock()))])
+        self.metrics.record("put", started, key=key)
+
+    def get(self, key: str, sequence: Optional[int] = None) -> Optional[bytes]:
+        # Without a sequence, the latest value; with one (see snapshot()),
+        # the value as of that write.
+        started = time.perf_counter_ns()
+        value = self._get(key, sequence)
+        self.metrics.record("get", started, key=key)
+        return value
+
+    def _get(self, key: str, sequence: Optional[int]) -> Optional[bytes]:
+        version = self._version
+        found, value = _lookup_memtables(version, key, sequence)
+        if found:
+            return live_value(value, self.clock())
+        for segment in reversed(version.segments):
+            found, value = segment.lookup(key, sequence)
+            if found:
+                return _resolve(version, value, self.clock())
+        return None
+
+    def lookup_memtables(self, key: str) -> Tuple[bool, Optional[bytes]]:
+        # The in-memory part of get(): never touches a file.
+        found, value = _lookup_memtables(self._version, key)
+        return found, live_value(value, self.clock())
+
+    def multi_get(self, keys: Iterable[str], sequence: Optional[int] = None) -> Dict[str, Optional[bytes]]:
+        # Resolves what it can from the memtable, then visits each segment
+        # once, newest first, with the still unresolved keys in sorted order.
+        started = time.perf_counter_ns()
+        keys = list(keys)
+        version = self._version
+        now = self.clock()
+        memtables = (version.memtable,) + version.frozen[::-1]
+        results: Dict[str, Optional[bytes]] = {}
+        pending = []
+        for key in set(keys):
+            for memtable in memtables:
+                found, value = memtable.lookup(key, sequence)
+                if found:
+                    results[key] = live_value(value, now)
+                    break
+            else:
+                pending.append(key)
+        pending.sort()
+        for segment in reversed(version.segments):
+            if not pending:
+                break
+            found = segment.lookup_many(pending, sequence)
+            for key, value in found.items():
+                results[key] = _resolve(version, value, now)
+            if found:
+                pending = [key for key in pending if key not in found]
+        self.metrics.record("multi_get", started, keys=len(keys))
+        return {key: results.get(key) for key in keys}
 
     def delete(self, key: str) -> None:
-        # TODO: Implement delete operation
-        # Don't forget to update the WAL
-        pass
+        started = time.perf_counter_ns()
+        check_key(key)
+        self._write([("delete", key, None)])
+        self.metrics.record("delete", started, key=key)
+
+    def write_batch(self, operations: List[Tuple[str, str, Optional[bytes]]]) -> None:
+        # Each operation is (operation, key, value), or ("put", key, value,
+        # ttl) for a put that expires.
+        started = time.perf_counter_ns()
+        operations = list(operations)
+        check_operations(operations)
+        now = self.clock()
+        operations = [operation if len(operation) == 3 else (operation[0], operation[1],
+                                                             with_ttl(operation[2], operation[3], now))
+                      for operation in operations]
+        if operations:
+            self._write(operations)
+        self.metrics.record("write_batch", started, operations=len(operations))
+
+    def add_tracer(self, tracer: Tracer) -> None:
+        # tracer(operation, seconds, details) is called after every timed
+        # operation (see metrics.OPERATIONS), on the thread that ran it.
+        self.metrics.add_tracer(tracer)
+
+    def remove_tracer(self, tracer: Tracer) -> None:
+        self.metrics.remove_tracer(tracer)
+
+    def scan(self, start: Optional[str] = None, end: Optional[str] = None,
+             limit: Optional[int] = None, sequence: Optional[int] = None) -> Iterator[Tuple[str, bytes]]:
+        # Lazily merges the memtables with every segment, so memory use stays
+        # at one key's versions per source however long the range. Only a
+        # sequence from a snapshot gives a point-in-time view; without one,
+        # each key reads as its newest version when the scan reaches it.
+        if limit is not None and limit <= 0:
+            return
+        version = self._version
+        streams = [segment.iterate_versions(start) for segment in version.segments]
+        streams.extend(memtable.versions(start, end) for memtable in version.frozen)
+        streams.append(version.memtable.versions(start, end))
+        now = self.clock()
+        count = 0
+        for key, value in versions_at(merge_versions(streams), sequence):
+            if end is not None and key >= end:
+                return
+            value = _resolve(version, value, now)
+            if value is None:
+                continue
+            yield key, value
+            count += 1
+            if count == limit:
+                return
+
+    def flush(self) -> None:
+        with self._write_mutex:
+            if len(self.memtable):
+                self._freeze()
+        self.flush_frozen()
+
+    def flush_frozen(self, wait: bool = True) -> None:
+        # The queue is checked again after the mutex is released, so a
+        # memtable frozen while another thread was flushing is never stranded.
+        while self._flush_queue:
+            if not self._flush_mutex.acquire(blocking=wait):
+                return
+            try:
+                self._flush_queued()
+            finally:
+                self._flush_mutex.release()
 
     def compact(self) -> None:
-        # TODO: Implement log compaction
-        # Consider using self.config.compaction_threshold
-        pass
+        # Synchronous full compaction, e.g. from the CLI. Waits for any
+        # background compaction to finish first.
+        self.flush()
+        with self._compaction_mutex:
+            self._drop_expired_segments()
+            task = self.strategy.full_compaction(self.segments)
+            if task is not None:
+                self._run_compaction(task)
+            while self._collect_value_log():
+                pass
+
+    def ingest_segments(self, paths: Iterable[str], move: bool = False) -> None:
+        # Adds segment files written by segment_writer.build_segment() as one
+        # atomic change that is newer than every write before it. The files
+        # are hard-linked into the store (copied across file systems, and
+        # the originals removed afterwards with move=True). Nothing goes
+        # through the WAL or the memtable, and nothing is rewritten: the
+        # strategy puts each file as deep as it can without being shadowed.
+        paths = list(paths)
+        segments: List[Segment] = []
+        try:
+            for path in paths:
+                destination = self._next_segment_path()
+                _link_or_copy(path, destination)
+                if os.path.exists(hint_path(path)):
+                    _link_or_copy(hint_path(path), hint_path(destination))
+                segment = self._open_segment(destination)
+                segments.append(segment)
+                if not segment.entry_count:
+                    raise ValueError(f"{path} holds no entries")
+                if segment.max_sequence or not segment.sorted:
+                    # Store segments hold several versions per key, and maybe
+                    # pointers into value logs this store does not have.
+                    raise ValueError(f"{path} was not written by build_segment()")
+            segments.sort(key=lambda segment: segment.min_key)
+            for before, after in zip(segments, segments[1:]):
+                if after.min_key <= before.max_key:
+                    raise ValueError(f"Ingested segments overlap: {before.max_key!r} >= {after.min_key!r}")
+        except BaseException:
+            for segment in segments:
+                segment.remove()
+            raise
+        if not segments:
+            return
+        low, high = segments[0].min_key, segments[-1].max_key
+        # Compactions could otherwise swap in outputs that span the new
+        # segments' key range on the levels they go to.
+        with self._compaction_mutex, self._write_mutex:
+            # Keys still in memory were written before the ingest but would
+            # shadow it, so they go to segments first.
+            if _overlaps(self.memtable, low, high):
+                self._freeze()
+            if any(_overlaps(memtable, low, high) for memtable in self._version.frozen):
+                self.flush_frozen()
+            sequence = self.last_sequence + 1
+            with self._lock:
+                placed = list(self.segments)
+                for segment in segments:
+                    segment.assign_sequence(sequence)
+                    segment.level = self.strategy.ingest_level(placed, segment)
+                    placed.append(segment)
+                self._install(self.strategy.order(placed))
+            self.last_sequence = sequence
+        if move:
+            for path in paths:
+                for name in (path, hint_path(path)):
+                    if os.path.exists(name):
+                        os.remove(name)
+        self.segments_ingested += len(segments)
+        self.ingested_bytes += sum(segment.offset for segment in segments)
+        self._count_written(segments)
+        if self.strategy.pick(self.segments) is not None:
+            self._request_compaction()
+
+    def collect_value_log_garbage(self) -> int:
+        # Rewrites every value log file that is at least value_log_gc_ratio
+        # garbage; returns how many were collected. The background worker
+        # does the same, one file at a time between compactions.
+        count = 0
+        with self._compaction_mutex:
+            while self._collect_value_log():
+                count += 1
+        return count
+
+    def wait_for_compaction(self) -> None:
+        # Blocks until no background compaction is running or pending.
+        if self._compaction_thread is None:
+            return
+        with self._compaction_cond:
+            while self._compaction_served < self._compaction_requested and self._compaction_thread.is_alive():
+                self._compaction_cond.wait()
+
+    def snapshot(self) -> Snapshot:
+        # Pins the current sequence number. Taken under the write mutex so no
+        # write is half applied and no writer can miss the new snapshot when
+        # deciding which overwritten versions to keep.
+        with self._write_mutex:
+            sequence = self.last_sequence
+            with self._snapshot_lock:
+                self._snapshots[sequence] += 1
+        return Snapshot(self, sequence)
 
     def recover(self) -> None:
-        # TODO: Implement recovery from crash
-        # Use the WAL for crash recovery
-        pass
+        # Rebuild the memtable from the log. Safe to call repeatedly: the log
+        # only ever holds what has not yet been flushed to a segment, so replay
+        # time is bounded by the memtable size rather than the store's history.
+        with self._write_mutex:
+            memtable = MemTable(self.memtable_limit)
+            newest_snapshot = self._newest_snapshot()
+            for sequence, operation, key, value in self.wal.replay():
+                if operation == "put":
+                    memtable.put(key, value, sequence, newest_snapshot)
+                else:
+                    memtable.delete(key, sequence, newest_snapshot)
+                self.last_sequence = max(self.last_sequence, sequence)
+            with self._lock:
+                self._version = self._version._replace(memtable=memtable)
+            if memtable.is_full():
+                self._freeze()
+        self.flush_frozen()
+
+    def close(self) -> None:
+        with self._compaction_cond:
+            self._closing = True
+            self._compaction_cond.notify_all()
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+        with self._write_mutex:
+            self.wal.close()
+        for segment in self.segments:
+            segment.close()
+        for value_log in self._version.value_logs.values():
+            value_log.close()
+        if self._owns_executor:
+            self.executor.shutdown()
 
     def get_statistics(self) -> Dict[str, any]:
-        # TODO: Implement method to return store statistics
-        pass
\ No newline at end of file
+        return {
+            "segment_count": len(self.segments),
+            "segment_bytes": sum(segment.offset for segment in self.segments),
+            "segment_entries": sum(segment.entry_count for segment in self.segments),
+            "sparse_index_entries": sum(len(segment.index_keys) for segment in self.segments),
+            "sparse_index_bytes": sum(segment.index_bytes for segment in self.segments),
+            "segments_opened_from_hints": sum(segment.loaded_from_hints for segment in self.segments),
+            "bloom_filter_bytes": sum(len(segment.bloom.bits) for segment in self.segments if segment.bloom),
+            "bloom_filter_skips": sum(segment.bloom_skips for segment in self.segments),
+            "bloom_filter_false_positives": sum(segment.bloom_false_positives for segment in self.segments),
+            "compression": self.config.compression,
+            "compression_ratio": self._compression_ratio(),
+            "value_log_files": len(self._version.value_logs),
+            "value_log_bytes": sum(log.data_bytes for log in self._version.value_logs.values()),
+            "value_log_garbage_bytes": self._value_log_garbage(),
+            "value_log_collections": self.value_log_collections,
+            "value_log_bytes_relocated": self.value_log_bytes_relocated,
+            "expiring_entries": sum(segment.expiring_count for segment in self.segments),
+            "expired_segments_dropped": self.expired_segments_dropped,
+            "expired_bytes_dropped": self.expired_bytes_dropped,
+            "segments_ingested": self.segments_ingested,
+            "ingested_bytes": self.ingested_bytes,
+            "blocks_decoded": sum(segment.blocks_decoded for segment in self.segments),
+            "block_decode_seconds": sum(segment.decode_seconds for segment in self.segments),
+            "memtable_entries": len(self.memtable),
+            "memtable_bytes": self.memtable.size,
+            "frozen_memtables": len(self._version.frozen),
+            "last_sequence": self.last_sequence,
+            "live_snapshots": sum(self._live_snapshots().values()),
+            "wal_records": self.wal.record_count,
+            "wal_syncs": self.wal.sync_count,
+            "wal_bytes_written": self.wal.bytes_written,
+            "wal_files": len(self.wal.file_ids()),
+            "compactions": self.compaction_count,
+            "compaction_bytes_written": self.compaction_bytes_written,
+            "flush_bytes_written": self.flush_bytes_written,
+            # Everything written to disk: log, segments and value logs.
+            "disk_bytes_written": (self.wal.bytes_written + self.flush_bytes_written + self.compaction_bytes_written
+                                   + self.value_log_bytes_written),
+            "compaction_running": self._compaction_mutex.locked(),
+            "last_compaction_error": repr(self.last_compaction_error) if self.last_compaction_error else None,
+            "last_flush_error": repr(self.last_flush_error) if self.last_flush_error else None,
+            "compaction_strategy": self.strategy.name,
+            "segments_per_level": self._segments_per_level(),
+            "bytes_read_per_level": self._bytes_read_per_level(),
+            "bytes_written_per_level": dict(self.bytes_written_per_level),
+            **self.strategy.amplification(self.segments, self.flush_bytes_written, self.compaction_bytes_written),
+            **(self.block_cache.get_statistics() if self.block_cache is not None else {}),
+            "latency": self.metrics.latency_summary(),
+        }
+
+    def _write(self, operations: List[Tuple[str, str, Optional[bytes]]]) -> None:
+        request = _PendingWrite(operations)
+        with self._queue_lock:
+            self._write_queue.append(request)
+        with self._write_mutex:
+            if not request.done:
+                # Whoever gets here first writes for everyone queued so far.
+                with self._queue_lock:
+                    batch, self._write_queue = self._write_queue, []
+                self._apply(batch)
+        if request.error is not None:
+            raise request.error
+        if self._flush_queue and self.auto_flush:
+            # Flush unless someone else already is; other writers carry on
+            # into the fresh memtable until too many are waiting.
+            try:
+                self.flush_frozen(wait=len(self._flush_queue) > MAX_FROZEN_MEMTABLES)
+            except Exception as e:
+                # This write is logged and applied either way; the failing
+                # memtable stays queued for the next flush to retry.
+                self.last_flush_error = e
+
+    def _apply(self, batch: List[_PendingWrite]) -> None:
+        # Caller holds the write mutex.
+        operations = [operation for request in batch for operation in request.operations]
+        try:
+            sequence = self.last_sequence + 1
+            if len(operations) == 1:
+                self.wal.append(*operations[0], sequence=sequence)
+            else:
+                self.wal.append_batch(operations, sequence=sequence)
+            self.last_sequence = sequence + len(operations) - 1
+            newest_snapshot = self._newest_snapshot()
+            memtable = self._version.memtable
+            for number, (operation, key, value) in enumerate(operations, sequence):
+                if operation == "put":
+                    memtable.put(key, value, number, newest_snapshot)
+                else:
+                    memtable.delete(key, number, newest_snapshot)
+            # Checked once per group, so a batch always lands in one segment.
+            if memtable.is_full():
+                self._freeze()
+        except BaseException as e:
+            for request in batch:
+                request.error = e
+        finally:
+            for request in batch:
+                request.done = True
+
+    def _freeze(self) -> None:
+        # Caller holds the write mutex. Everything in the memtable was logged
+        # before this rotation, so once its segment is durable the older log
+        # files can go.
+        checkpoint = self.wal.rotate()
+        with self._lock:
+            version = self._version
+            self._flush_queue.append((version.memtable, checkpoint))
+            self._version = version._replace(memtable=MemTable(self.memtable_limit),
+                                             frozen=version.frozen + (version.memtable,))
+
+    def _flush_queued(self) -> None:
+        while self._flush_queue:
+            started = time.perf_counter_ns()
+            memtable, checkpoint = self._flush_queue[0]
+            # Overwritten versions no live snapshot can see are dropped here,
+            # and expired values become tombstones.
+            versions = visible_versions(memtable.versions(), list(self._live_snapshots()), now=self.clock())
+            if self.executor is not None:
+                written = self.executor.submit(flush_to_files, list(versions), [self._next_segment_path()],
+                                               self.segment_options, self._next_value_log_path()).result()
+                segments, value_log = self._open_written(*written)
+            else:
+                segments, value_log = self._write_segments(versions, len(memtable))
+            with self._lock:
+                # The segment replaces its memtable in one swap, so a read
+                # finds the data in exactly one of the two.
+                version = self._version
+                dead = self._install(version.segments + segments, value_log, frozen=version.frozen[1:])
+                compact = self.strategy.pick(self._version.segments) is not None
+            for value_log in dead:
+                value_log.remove()
+            self._flush_queue.popleft()
+            self.last_flush_error = None
+            self.wal.checkpoint(checkpoint)
+            self.flush_bytes_written += sum(segment.offset for segment in segments)
+            self._count_written(segments)
+            self.metrics.record("flush", started, entries=len(memtable),
+                                bytes=sum(segment.offset for segment in segments))
+            if compact:
+                self._request_compaction()
+
+    def _request_compaction(self) -> None:
+        with self._compaction_cond:
+            self._compaction_requested += 1
+            self._compaction_cond.notify_all()
+
+    def _compact_in_background(self) -> None:
+        while True:
+            with self._compaction_cond:
+                while not self._closing and self._compaction_served >= self._compaction_requested:
+                    self._compaction_cond.wait()
+                if self._closing:
+                    return
+                request = self._compaction_requested
+            try:
+                self._compact_until_settled()
+                self.last_compaction_error = None
+            except Exception as e:
+                # Leave the inputs in place; the next flush retries.
+                self.last_compaction_error = e
+            with self._compaction_cond:
+                self._compaction_served = request
+                self._compaction_cond.notify_all()
+
+    def _compact_until_settled(self) -> None:
+        while not self._closing:
+            with self._compaction_mutex:
+                self._drop_expired_segments()
+                with self._lock:
+                    task = self.strategy.pick(self.segments)
+                if task is not None:
+                    self._run_compaction(task)
+                elif not self._collect_value_log():
+                    return
+
+    def _run_compaction(self, task: CompactionTask) -> None:
+        # Caller holds the compaction mutex, so the inputs cannot change
+        # underneath; only flushes can run concurrently, and they only add
+        # newer segments at the end.
+        # The inputs' entry count bounds what any output can hold; when the
+        # output is split, scale it down to one output's share of the bytes.
+        started = time.perf_counter_ns()
+        input_bytes = max(sum(segment.offset for segment in task.inputs), 1)
+        expected = sum(segment.entry_count for segment in task.inputs)
+        if task.max_output_size is not None:
+            expected = min(expected, expected * task.max_output_size // input_bytes + 1)
+        # A snapshot taken from here on is newer than everything in the
+        # inputs, so it only needs the newest versions, which are always kept.
+        snapshots = list(self._live_snapshots())
+        now = self.clock()
+        if self.executor is not None:
+            # Every output but the last holds at least max_output_size bytes.
+            count = 1 if task.max_output_size is None else math.ceil(input_bytes / task.max_output_size) + 1
+            written = self.executor.submit(compact_to_files, [segment.file_path for segment in task.inputs],
+                                           [self._next_segment_path() for _ in range(count)], self.segment_options,
+                                           expected, snapshots, task.drop_tombstones, task.max_output_size,
+                                           self.config.compaction_rate_limit, self._next_value_log_path(),
+                                           now, [segment.global_sequence for segment in task.inputs]).result()
+            outputs, value_log = self._open_written(*written)
+        else:
+            versions = visible_versions(merge_segments(task.inputs), snapshots, task.drop_tombstones, now)
+            outputs, value_log = self._write_segments(versions, expected, task.max_output_size,
+                                                      RateLimiter(self.config.compaction_rate_limit))
+        for segment in outputs:
+            segment.level = task.output_level
+        with self._lock:
+            # The outputs take the place of the first input; the strategy then
+            # restores its ordering (e.g. deeper levels first).
+            replaced = set(map(id, task.inputs))
+            position = next(i for i, segment in enumerate(self.segments) if id(segment) in replaced)
+            remaining = [segment for segment in self.segments if id(segment) not in replaced]
+            # Value log files only the inputs pointed into are garbage now.
+            dead = self._install(self.strategy.order(remaining[:position] + outputs + remaining[position:]),
+                                 value_log)
+        for segment in task.inputs:
+            segment.remove()
+        for value_log in dead:
+            value_log.remove()
+        self.compaction_count += 1
+        self.compaction_bytes_written += sum(segment.offset for segment in outputs)
+        self._count_written(outputs)
+        self.metrics.record("compact", started, inputs=len(task.inputs), level=task.output_level,
+                            bytes=sum(segment.offset for segment in outputs))
+
+    def _collect_value_log(self) -> bool:
+        # Caller holds the compaction mutex. Takes the value log file with the
+        # most garbage, if one is past value_log_gc_ratio, and rewrites each
+        # segment pointing into it with those values copied to a new file.
+        # Only pointers move: the segments keep their keys, versions, order
+        # and levels. Returns whether there was a file to collect.
+        started = time.perf_counter_ns()
+        version = self._version
+        references = _value_refs(version.segments)
+        garbage = {file_id: log.data_bytes - references.get(file_id, 0)
+                   for file_id, log in version.value_logs.items()}
+        candidates = [file_id for file_id, log in version.value_logs.items()
+                      if garbage[file_id] and garbage[file_id] >= self.config.value_log_gc_ratio * log.data_bytes]
+        if not candidates:
+            return False
+        victim = max(candidates, key=garbage.get)
+        inputs = [segment for segment in version.segments if victim in segment.value_refs]
+        values = ValueLogWriter(value_log_path(self.directory, self._next_file_id()))
+        read = version.value_logs[victim].read
+        outputs: Dict[int, Segment] = {}
+        try:
+            for segment in inputs:
+                versions = separate_values(segment.iterate_versions(), values, 0, {victim}, read)
+                output, = write_segments(versions, iter(self._next_segment_path, None),
+                                         lambda path: self._open_segment(path, segment.entry_count))
+                output.level = segment.level
+                outputs[id(segment)] = output
+        except BaseException:
+            values.discard()
+            raise
+        path = values.close()
+        relocated = ValueLog(path) if path is not None else None
+        with self._lock:
+            segments = [outputs.get(id(segment), segment) for segment in self.segments]
+            dead = self._install(segments, relocated)
+        for segment in inputs:
+            segment.remove()
+        for value_log in dead:
+            value_log.remove()
+        self.value_log_collections += 1
+        self.value_log_bytes_relocated += relocated.data_bytes if relocated is not None else 0
+        self._count_written(outputs.values())
+        self.metrics.record("value_log_gc", started, file_id=victim,
+                            bytes=relocated.data_bytes if relocated is not None else 0)
+        return True
+
+    def _drop_expired_segments(self) -> None:
+        # Caller holds the compaction mutex. A segment holding nothing but
+        # expired values is deleted outright instead of being rewritten,
+        # unless an older segment it overlaps could hold versions of its
+        # keys that would then resurface; those wait for compaction.
+        now = self.clock()
+        with self._lock:
+            kept: List[Segment] = []
+            dropped: List[Segment] = []
+            for segment in self.segments:
+                if segment.expired(now) and not any(older.min_key <= segment.max_key and segment.min_key <= older.max_key
+                                                    for older in kept):
+                    dropped.append(segment)
+                else:
+                    kept.append(segment)
+            if not dropped:
+                return
+            dead = self._install(kept)
+        for segment in dropped:
+            segment.remove()
+        for value_log in dead:
+            value_log.remove()
+        self.expired_segments_dropped += len(dropped)
+        self.expired_bytes_dropped += sum(segment.offset for segment in dropped)
+
+    def _newest_snapshot(self) -> Optional[int]:
+        with self._snapshot_lock:
+            return max(self._snapshots) if self._snapshots else None
+
+    def _live_snapshots(self) -> Dict[int, int]:
+        with self._snapshot_lock:
+            return dict(self._snapshots)
+
+    def _release_snapshot(self, sequence: int) -> None:
+        with self._snapshot_lock:
+            self._snapshots[sequence] -= 1
+            if not self._snapshots[sequence]:
+                del self._snapshots[sequence]
+
+    def _compression_ratio(self) -> float:
+        # Record bytes as written over bytes on disk, across all segments;
+        # 1.0 when nothing is compressed.
+        stored = sum(segment.offset - FILE_HEADER.size for segment in self.segments)
+        logical = sum(segment.data_end - FILE_HEADER.size for segment in self.segments)
+        return logical / stored if stored else 1.0
+
+    def _value_log_garbage(self) -> int:
+        references = _value_refs(self.segments)
+        return sum(log.data_bytes - references.get(file_id, 0) for file_id, log in self._version.value_logs.items())
+
+    def _install(self, segments: List[Segment], *value_logs: Optional[ValueLog], **changes) -> List[ValueLog]:
+        # Caller holds the lock. Publishes a version with these segments and
+        # any new value log files, and saves the manifest. Value log files no
+        # segment points into any more leave the version; they are returned
+        # for the caller to remove.
+        logs = dict(self._version.value_logs)
+        for log in value_logs:
+            if log is not None:
+                logs[log.file_id] = log
+                self.value_log_bytes_written += log.data_bytes
+        references = _value_refs(segments)
+        dead = [log for file_id, log in logs.items() if file_id not in references]
+        for log in dead:
+            del logs[log.file_id]
+        self._version = self._version._replace(segments=segments, value_logs=logs, **changes)
+        self._save_manifest()
+        return dead
+
+    def _count_written(self, segments: Iterable[Segment]) -> None:
+        for segment in segments:
+            self.bytes_written_per_level[segment.level] = (self.bytes_written_per_level.get(segment.level, 0)
+                                                           + segment.offset)
+
+    def _bytes_read_per_level(self) -> Dict[int, int]:
+        # Block bytes read from the live segments, for lookups, scans and
+        # compaction inputs alike.
+        levels: Dict[int, int] = {}
+        for segment in self.segments:
+            levels[segment.level] = levels.get(segment.level, 0) + segment.bytes_read
+        return levels
+
+    def _segments_per_level(self) -> Dict[int, int]:
+        levels: Dict[int, int] = {}
+        for segment in self.segments:
+            levels[segment.level] = levels.get(segment.level, 0) + 1
+        return levels
+
+    def _load_segments(self) -> None:
+        state = self.manifest.load()
+        if state is None:
+            # A store from before the manifest existed: segment ids are
+            # allocated in order, so the file names give the order.
+            ids = []
+            for name in os.listdir(self.directory):
+                if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                    ids.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+            ids.sort()
+            next_segment_id = max(ids) + 1 if ids else 0
+        else:
+            ids = [entry["id"] for entry in state["segments"]]
+            levels = {entry["id"]: entry.get("level", 0) for entry in state["segments"]}
+            references = {entry["id"]: {int(file_id): size for file_id, size in entry.get("values", {}).items()}
+                          for entry in state["segments"]}
+            sequences = {entry["id"]: entry.get("sequence", 0) for entry in state["segments"]}
+            next_segment_id = state["next_segment_id"]
+        value_log_ids = state.get("value_logs", []) if state is not None else []
+        live = {os.path.basename(self._segment_path(segment_id)) for segment_id in ids}
+        live.update(os.path.basename(value_log_path(self.directory, file_id)) for file_id in value_log_ids)
+        for name in os.listdir(self.directory):
+            base = name[:-len(HINT_SUFFIX)] if name.endswith(HINT_SUFFIX) else name
+            if ".tmp" in name or (base.startswith((SEGMENT_PREFIX, VALUE_LOG_PREFIX)) and base not in live):
+                # Left behind by a crash before the manifest was updated, or
+                # inputs of a compaction that committed just before a crash.
+                os.remove(os.path.join(self.directory, name))
+        segments = [self._open_segment(self._segment_path(segment_id)) for segment_id in ids]
+        value_logs = [ValueLog(value_log_path(self.directory, file_id)) for file_id in value_log_ids]
+        self._version = self._version._replace(segments=segments,
+                                               value_logs={log.file_id: log for log in value_logs})
+        if state is not None:
+            for segment in self.segments:
+                segment.level = levels[segment_id(segment)]
+                segment.value_refs = references[segment_id(segment)]
+                if sequences.get(segment_id(segment)):
+                    segment.assign_sequence(sequences[segment_id(segment)])
+        self.last_sequence = max((segment.max_sequence for segment in segments), default=0)
+        self.next_segment_id = next_segment_id
+        if state is None:
+            self._save_manifest()
+
+    def _save_manifest(self) -> None:
+        entries = []
+        for segment in self.segments:
+            entry = {"id": segment_id(segment), "level": segment.level}
+            if segment.value_refs:
+                # Bytes of each value log file the segment points into, which
+                # is how garbage collection finds its garbage.
+                entry["values"] = {str(file_id): size for file_id, size in segment.value_refs.items()}
+            if segment.global_sequence:
+                entry["sequence"] = segment.global_sequence
+            entries.append(entry)
+        self.manifest.save(entries, self.next_segment_id, sorted(self._version.value_logs))
+
+    def _segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{segment_id:08d}{SEGMENT_SUFFIX}")
+
+    def _next_file_id(self) -> int:
+        # Segments and value log files share one id counter.
+        with self._lock:
+            file_id = self.next_segment_id
+            self.next_segment_id += 1
+        return file_id
+
+    def _next_segment_path(self) -> str:
+        return self._segment_path(self._next_file_id())
+
+    def _next_value_log_path(self) -> Optional[str]:
+        # None when values are not being separated.
+        if not self.config.value_log_threshold:
+            return None
+        return value_log_path(self.directory, self._next_file_id())
+
+    def _open_written(self, segments: List[Tuple[str, Dict[int, int]]],
+                      value_path: Optional[str]) -> Tuple[List[Segment], Optional[ValueLog]]:
+        # Opens what flush_to_files() or compact_to_files() wrote.
+        opened = []
+        for path, references in segments:
+            segment = self._open_segment(path)
+            segment.value_refs = references
+            opened.append(segment)
+        return opened, ValueLog(value_path) if value_path is not None else None
+
+    def _open_segment(self, path: str, expected_entries: Optional[int] = None) -> Segment:
+        options = self.segment_options
+        return Segment(path, options.index_interval, expected_entries,
+                       options.false_positive_rate, options.bloom_filter_size, self.block_cache, options.compression,
+                       options.restart_interval)
+
+    def _write_segments(self, versions: Iterable[Tuple[str, int, Optional[bytes]]], expected_entries: int,
+                        max_size: Optional[int] = None,
+                        limiter: Optional[RateLimiter] = None) -> Tuple[List[Segment], Optional[ValueLog]]:
+        paths = iter(self._next_segment_path, None)
+        segments, value_path = write_separated(versions, paths, lambda path: self._open_segment(path, expected_entries),
+                                               self.config.value_log_threshold, self._next_value_log_path(),
+                                               max_size, limiter)
+        return segments, ValueLog(value_path) if value_path is not None else None
+
+def check_operations(operations: List[Tuple[str, str, Optional[bytes]]]) -> None:
+    for entry in operations:
+        operation, key, value = entry[:3]
+        if operation not in ("put", "delete"):
+            raise ValueError(f"Unknown batch operation {operation!r}; expected 'put' or 'delete'")
+        check_key(key)
+        if operation == "put" and value is None:
+            raise ValueError(f"Batch put of {key!r} has no value")
+        if len(entry) == 4 and operation == "put":
+            if entry[3] is not None and not entry[3] > 0:
+                raise ValueError(f"Batch put of {key!r} has ttl {entry[3]!r}; it must be a positive number of seconds")
+        elif len(entry) != 3:
+            raise ValueError(f"Batch operation {entry!r} should be (operation, key, value) or "
+                             f"('put', key, value, ttl)")
+
+def check_key(key: str) -> None:
+    # Checked before anything is logged: a key no segment can hold would
+    # otherwise fail every flush from then on, even after a restart.
+    size = len(key.encode())
+    if size > MAX_KEY_SIZE:
+        raise ValueError(f"Key is {size} bytes; the limit is {MAX_KEY_SIZE}")
+
+def _lookup_memtables(version: StoreVersion, key: str,
+                      sequence: Optional[int] = None) -> Tuple[bool, Optional[bytes]]:
+    found, value = version.memtable.lookup(key, sequence)
+    if found:
+        return found, value
+    for memtable in reversed(version.frozen):
+        found, value = memtable.lookup(key, sequence)
+        if found:
+            return found, value
+    return False, None
+
+def _overlaps(memtable: MemTable, low: str, high: str) -> bool:
+    first = next(memtable.versions(low), None)
+    return first is not None and first[0] <= high
+
+def _link_or_copy(source: str, destination: str) -> None:
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+        with open(destination, "rb") as f:
+            os.fsync(f.fileno())
+
+def _resolve(version: StoreVersion, value, now: int) -> Optional[bytes]:
+    # Segments hand back views into their mapped file, or a pointer into a
+    # value log; either way copy once, so callers get real bytes and old
+    # files can be unmapped. Expired values read as deleted.
+    value = live_value(value, now)
+    if isinstance(value, ValuePointer):
+        return bytes(version.value_logs[value.file_id].read(value))
+    return bytes(value) if value is not None else None
+
+def _value_refs(segments: Iterable[Segment]) -> Counter:
+    references: Counter = Counter()
+    for segment in segments:
+        references.update(segment.value_refs)
+    return references
+
+def segment_id(segment: Segment) -> int:
+    return int(os.path.basename(segment.file_path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
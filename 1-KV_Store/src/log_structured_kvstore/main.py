@@ -1,7 +1,10 @@
 import os
 import argparse
+import asyncio
 from .log_structured_store import LogStructuredStore
+from .sharded_store import ShardedStore
 from .cli import CLI
+from .server import serve
 from .config import Config
 
 def main():
@@ -10,15 +13,34 @@ def main():
     parser.add_argument("--segment-size", type=int, help="Segment size in bytes")
     parser.add_argument("--compaction-threshold", type=int, help="Number of segments before compaction")
     parser.add_argument("--bloom-filter-size", type=int, help="Size of Bloom filter in bits")
+    parser.add_argument("--shard-count", type=int, help="Number of shards (sub-stores) keys are spread across")
+    parser.add_argument("--serve", action="store_true", help="Serve the store over TCP instead of starting the CLI")
+    parser.add_argument("--server-host", type=str, help="Address the TCP server listens on")
+    parser.add_argument("--server-port", type=int, help="Port the TCP server listens on")
+    parser.add_argument("--metrics-port", type=int, help="Port serving Prometheus metrics over HTTP (with --serve)")
     args = parser.parse_args()
 
     config = Config.from_args(args) if args.config is None else Config(args.config)
 
     store_directory = "store"
     os.makedirs(store_directory, exist_ok=True)
-    store = LogStructuredStore(store_directory, config)
+    if args.serve:
+        if config.shard_count > 1:
+            parser.error("--serve works with a single store; drop --shard-count")
+        try:
+            asyncio.run(serve(store_directory, config))
+        except KeyboardInterrupt:
+            pass
+        return
+    if config.shard_count > 1:
+        store = ShardedStore(store_directory, config)
+    else:
+        store = LogStructuredStore(store_directory, config)
     cli = CLI(store, config)
-    cli.run()
+    try:
+        cli.run()
+    finally:
+        store.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
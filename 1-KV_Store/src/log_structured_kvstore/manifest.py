@@ -0,0 +1,38 @@
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+MANIFEST_NAME = "MANIFEST"
+MANIFEST_VERSION = 1
+
+class Manifest:
+    # The manifest is the single source of truth for which segments make up
+    # the store and in what order. Flushes and compactions write their files
+    # first and then replace the manifest; that rename is the commit point,
+    # so a crash leaves either the old set of segments or the new one. The
+    # same goes for the value log files the segments point into.
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.file_path = os.path.join(directory, MANIFEST_NAME)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.file_path)
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not self.exists():
+            return None
+        with open(self.file_path, "r") as f:
+            state = json.load(f)
+        if state.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported manifest version {state.get('version')!r} in {self.file_path}")
+        return state
+
+    def save(self, segments: List[Dict[str, Any]], next_segment_id: int, value_logs: List[int] = ()) -> None:
+        state = {"version": MANIFEST_VERSION, "next_segment_id": next_segment_id, "segments": segments,
+                 "value_logs": list(value_logs)}
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.file_path)
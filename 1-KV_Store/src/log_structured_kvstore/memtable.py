@@ -1,14 +1,111 @@
-from typing import Dict, Optional
+import bisect
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from .expiry import EXPIRY, ExpiringValue
+
+# Rough per-entry bookkeeping cost (dict slot, sorted key slot, object headers)
+# charged on top of the key/value payload when deciding whether the table is full.
+ENTRY_OVERHEAD = 32
 
 class MemTable:
-    def __init__(self):
-        self.table: Dict[str, bytes] = {}
+    def __init__(self, max_size: int = 1024 * 1024):
+        self.max_size = max_size
+        # Each key maps to the sequence number and value of its current
+        # version, stored together so a concurrent reader never pairs one
+        # version's sequence with another's value. A value of None is a
+        # tombstone: the key was deleted and that fact must shadow any older
+        # value still sitting in a segment. Values written with a TTL are
+        # ExpiringValues; the table hands them out as they are.
+        self.table: Dict[str, Tuple[int, Union[bytes, ExpiringValue, None]]] = {}
+        # Superseded versions that a snapshot may still read, oldest first.
+        self.history: Dict[str, List[Tuple[int, Optional[bytes]]]] = {}
+        self.keys: List[str] = []
+        self.size = 0
 
-    def put(self, key: str, value: bytes) -> None:
-        self.table[key] = value
+    def put(self, key: str, value: Union[bytes, ExpiringValue], sequence: int = 0, newest_snapshot: Optional[int] = None) -> None:
+        self._set(key, value, sequence, newest_snapshot)
 
     def get(self, key: str) -> Optional[bytes]:
-        return self.table.get(key)
+        entry = self.table.get(key)
+        return entry[1] if entry is not None else None
+
+    def delete(self, key: str, sequence: int = 0, newest_snapshot: Optional[int] = None) -> None:
+        self._set(key, None, sequence, newest_snapshot)
+
+    def lookup(self, key: str, sequence: Optional[int] = None) -> Tuple[bool, Optional[bytes]]:
+        # Distinguishes "deleted here" (True, None) from "not here" (False, None).
+        # With a sequence, only versions at or below it are considered.
+        entry = self.table.get(key)
+        if entry is None:
+            return False, None
+        if sequence is None or entry[0] <= sequence:
+            return True, entry[1]
+        for version_sequence, value in reversed(self.history.get(key, ())):
+            if version_sequence <= sequence:
+                return True, value
+        return False, None
+
+    def items(self, start: Optional[str] = None, end: Optional[str] = None) -> Iterator[Tuple[str, Optional[bytes]]]:
+        for key, _, value in self._iterate(start, end, False):
+            yield key, value
+
+    def versions(self, start: Optional[str] = None, end: Optional[str] = None) -> Iterator[Tuple[str, int, Optional[bytes]]]:
+        # Every retained version as (key, sequence, value), by key and then
+        # oldest first.
+        return self._iterate(start, end, True)
+
+    def is_full(self) -> bool:
+        return self.size >= self.max_size
+
+    def clear(self) -> None:
+        self.table.clear()
+        self.history.clear()
+        self.keys = []
+        self.size = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.table
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def _iterate(self, start: Optional[str], end: Optional[str],
+                 history: bool) -> Iterator[Tuple[str, int, Optional[bytes]]]:
+        index = bisect.bisect_left(self.keys, start) if start is not None else 0
+        while index < len(self.keys):
+            key = self.keys[index]
+            if end is not None and key >= end:
+                return
+            if history:
+                for sequence, value in self.history.get(key, ()):
+                    yield key, sequence, value
+            sequence, value = self.table[key]
+            yield key, sequence, value
+            index += 1
+            if index > len(self.keys) or self.keys[index - 1] != key:
+                # A put while we were suspended shifted the list; find our place again.
+                index = bisect.bisect_right(self.keys, key)
+
+    def _set(self, key: str, value: Optional[bytes], sequence: int, newest_snapshot: Optional[int]) -> None:
+        entry = self.table.get(key)
+        if entry is not None:
+            old_sequence, old = entry
+            if newest_snapshot is not None and old_sequence <= newest_snapshot:
+                # A snapshot can still see the old version; keep it (and its
+                # size) around until the table is flushed.
+                self.history.setdefault(key, []).append(entry)
+                self.size += ENTRY_OVERHEAD
+            elif old is not None:
+                self.size -= _size(old)
+        self.table[key] = (sequence, value)
+        if entry is None:
+            # Into the table first: a concurrent iteration may find the key in
+            # keys as soon as it is inserted there.
+            bisect.insort(self.keys, key)
+            self.size += len(key) + ENTRY_OVERHEAD
+        if value is not None:
+            self.size += _size(value)
 
-    def remove(self, key: str) -> None:
-        del self.table[key]
\ No newline at end of file
+def _size(value: Union[bytes, ExpiringValue]) -> int:
+    if isinstance(value, ExpiringValue):
+        return len(value.value) + EXPIRY.size
+    return len(value)
@@ -0,0 +1,175 @@
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Always-on instrumentation for the store's hot paths: a latency histogram
+# per operation, plus optional tracing callbacks that see every timed call.
+
+# Operations that are timed. WAL syncs are the group-commit writes (and
+# fsyncs, under sync policies that make them) rather than one per record.
+OPERATIONS = ("get", "multi_get", "put", "delete", "write_batch", "flush", "compact", "value_log_gc", "wal_sync")
+# Each power of two is split into 2 ** SUB_BUCKET_BITS buckets, so a
+# recorded latency is off by at most 1 / 8 of its value.
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# Latencies are nanoseconds; anything from 2 ** 40 ns (18 minutes) up lands
+# in the last bucket.
+MAX_EXPONENT = 40
+BUCKET_COUNT = SUB_BUCKETS + (MAX_EXPONENT - SUB_BUCKET_BITS) * SUB_BUCKETS
+# Exported Prometheus buckets: powers of four from about 1us to 17s. They
+# fall on bucket boundaries, so the cumulative counts are exact.
+PROMETHEUS_BOUNDS = tuple(1 << exponent for exponent in range(10, 36, 2))
+
+# tracer(operation, seconds, details); details holds e.g. the key or the
+# bytes written.
+Tracer = Callable[[str, float, Dict[str, Any]], None]
+
+def bucket_index(nanoseconds: int) -> int:
+    if nanoseconds < SUB_BUCKETS:
+        return max(nanoseconds, 0)
+    exponent = nanoseconds.bit_length() - 1
+    if exponent >= MAX_EXPONENT:
+        return BUCKET_COUNT - 1
+    sub_bucket = (nanoseconds >> (exponent - SUB_BUCKET_BITS)) - SUB_BUCKETS
+    return SUB_BUCKETS + (exponent - SUB_BUCKET_BITS) * SUB_BUCKETS + sub_bucket
+
+def bucket_upper_bound(index: int) -> int:
+    # Exclusive: the bucket holds latencies below this many nanoseconds.
+    if index < SUB_BUCKETS:
+        return index + 1
+    exponent, sub_bucket = divmod(index - SUB_BUCKETS, SUB_BUCKETS)
+    return (SUB_BUCKETS + sub_bucket + 1) << exponent
+
+class LatencyHistogram:
+    # HDR-style log-linear buckets: constant relative precision across
+    # nanoseconds to minutes in a fixed, small array, so recording is one
+    # bit_length() and an increment.
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self._lock = threading.Lock()
+
+    def record(self, nanoseconds: int) -> None:
+        index = bucket_index(nanoseconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += nanoseconds
+            if nanoseconds > self.max:
+                self.max = nanoseconds
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        with self._lock:
+            for index, count in enumerate(other.counts):
+                self.counts[index] += count
+            self.count += other.count
+            self.total += other.total
+            self.max = max(self.max, other.max)
+
+    def percentile(self, fraction: float) -> int:
+        # The upper bound of the bucket holding the nearest-rank latency,
+        # capped at the largest latency recorded.
+        if not self.count:
+            return 0
+        rank = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_upper_bound(index) - 1, self.max)
+        return self.max
+
+    def cumulative_counts(self, bounds: Iterable[int]) -> List[int]:
+        # How many latencies fell below each bound (in nanoseconds).
+        counts = []
+        for bound in bounds:
+            counts.append(sum(count for index, count in enumerate(self.counts) if bucket_upper_bound(index) <= bound))
+        return counts
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_us": self.total / self.count / 1000 if self.count else 0.0,
+            "p50_us": self.percentile(0.5) / 1000,
+            "p99_us": self.percentile(0.99) / 1000,
+            "p999_us": self.percentile(0.999) / 1000,
+            "max_us": self.max / 1000,
+        }
+
+class Metrics:
+    def __init__(self):
+        self.histograms: Dict[str, LatencyHistogram] = {operation: LatencyHistogram() for operation in OPERATIONS}
+        # Replaced rather than mutated, so record() can iterate it unlocked.
+        self.tracers: Tuple[Tracer, ...] = ()
+        self.tracer_errors = 0
+
+    def record(self, operation: str, started: int, **details) -> None:
+        # started is a time.perf_counter_ns() reading from before the call.
+        elapsed = time.perf_counter_ns() - started
+        self.histograms[operation].record(elapsed)
+        for tracer in self.tracers:
+            try:
+                tracer(operation, elapsed / 1e9, details)
+            except Exception:
+                # A broken tracer must not fail the store operation it saw.
+                self.tracer_errors += 1
+
+    def add_tracer(self, tracer: Tracer) -> None:
+        self.tracers = self.tracers + (tracer,)
+
+    def remove_tracer(self, tracer: Tracer) -> None:
+        self.tracers = tuple(existing for existing in self.tracers if existing is not tracer)
+
+    def latency_summary(self) -> Dict[str, Dict[str, float]]:
+        return {operation: histogram.summary() for operation, histogram in self.histograms.items() if histogram.count}
+
+    @classmethod
+    def merged(cls, sources: Iterable['Metrics']) -> 'Metrics':
+        metrics = cls()
+        for source in sources:
+            for operation, histogram in source.histograms.items():
+                metrics.histograms[operation].merge(histogram)
+            metrics.tracer_errors += source.tracer_errors
+        return metrics
+
+def prometheus_text(statistics: Dict[str, Any], metrics: Optional[Metrics] = None, prefix: str = "kvstore") -> str:
+    # The Prometheus text exposition format. Numeric statistics become
+    # gauges; per-level dicts and per-shard lists become labelled series;
+    # strings and nested summaries are left out.
+    lines: List[str] = []
+    for name, value in statistics.items():
+        metric = f"{prefix}_{name}"
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            lines += [f"# TYPE {metric} gauge", f"{metric} {_number(value)}"]
+        elif isinstance(value, dict) and value and all(isinstance(item, (int, float)) for item in value.values()):
+            lines.append(f"# TYPE {metric} gauge")
+            lines += [f'{metric}{{level="{level}"}} {_number(item)}' for level, item in sorted(value.items())]
+        elif isinstance(value, list) and value and all(isinstance(item, (int, float)) for item in value):
+            lines.append(f"# TYPE {metric} gauge")
+            lines += [f'{metric}{{shard="{shard}"}} {_number(item)}' for shard, item in enumerate(value)]
+    if metrics is not None:
+        metric = f"{prefix}_operation_duration_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for operation, histogram in metrics.histograms.items():
+            if not histogram.count:
+                continue
+            for bound, count in zip(PROMETHEUS_BOUNDS, histogram.cumulative_counts(PROMETHEUS_BOUNDS)):
+                lines.append(f'{metric}_bucket{{operation="{operation}",le="{_number(bound / 1e9)}"}} {count}')
+            lines.append(f'{metric}_bucket{{operation="{operation}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{metric}_sum{{operation="{operation}"}} {_number(histogram.total / 1e9)}')
+            lines.append(f'{metric}_count{{operation="{operation}"}} {histogram.count}')
+        lines += [f"# TYPE {prefix}_tracer_errors gauge", f"{prefix}_tracer_errors {metrics.tracer_errors}"]
+    return "\n".join(lines) + "\n"
+
+def export_prometheus(store: Any) -> str:
+    # Works for any store with get_statistics(); stores that time their
+    # operations also expose a metrics attribute.
+    return prometheus_text(store.get_statistics(), getattr(store, "metrics", None))
+
+def _number(value: float) -> str:
+    return repr(value) if isinstance(value, float) else str(value)
@@ -1,16 +1,655 @@
+import bisect
+import itertools
+import mmap
+import os
+import struct
+import time
+import zlib
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from .block_cache import BlockCache
+from .bloom_filter import BloomFilter
+from .compression import DECOMPRESSION_ERRORS, Codec, codec_by_id, codec_by_name
+from .expiry import EXPIRY, ExpiringValue
+from .hint_file import HintFileWriter, hint_path, read_hint_file
+from .key_array import KeyArray
+from .value_log import ValuePointer
+
+MAGIC = b"LSKV"
+FORMAT_VERSION = 4
+# magic, format version, compression codec id
+FILE_HEADER = struct.Struct("<4sHH")
+# crc32, flags, shared key length, unshared key length, value length,
+# sequence number. Only the part of the key that differs from the previous
+# key in the block is stored; the first shared bytes come from that key.
+# The CRC covers everything after itself: the rest of the header, the
+# stored part of the key and the value.
+RECORD_HEADER = struct.Struct("<IBHHIQ")
+FLAG_TOMBSTONE = 0x01
+# The value is a ValuePointer into a value log file.
+FLAG_VALUE_POINTER = 0x02
+# The value starts with its expiry time (see expiry.py).
+FLAG_EXPIRES = 0x04
+MAX_KEY_SIZE = 0xFFFF
+# Written when a segment is sealed, after the Bloom filter that follows the
+# last record: where the records end, the highest sequence number in the
+# segment, how many records expire and the latest expiry among them, filter
+# length, magic.
+FOOTER = struct.Struct("<QQQQI4s")
+FOOTER_MAGIC = b"LSKF"
+# Precedes each block: stored (maybe compressed) length, length of its
+# contents. The contents are the records, then the offset of every restart
+# point (a record whose key is stored in full) and the number of them.
+BLOCK_HEADER = struct.Struct("<II")
+RESTART = struct.Struct("<I")
+
+# Rough cost of one decoded record in the block cache on top of its key and
+# value bytes: the str, int and bytes objects and three list slots.
+CACHED_ENTRY_OVERHEAD = 128
+
+# Names a segment in the block cache; paths change when segments are renamed.
+_cache_ids = itertools.count()
+
+def _record_size(data: memoryview, position: int) -> int:
+    _, _, _, key_length, value_length, _ = RECORD_HEADER.unpack_from(data, position)
+    return RECORD_HEADER.size + key_length + value_length
+
+def encode_record_header(key: bytes, value: Optional[bytes], sequence: int = 0, flags: int = 0,
+                         shared: int = 0) -> bytes:
+    # key is the stored part of the key, after the shared prefix.
+    flags |= FLAG_TOMBSTONE if value is None else 0
+    value = value if value is not None else b""
+    rest = RECORD_HEADER.pack(0, flags, shared, len(key), len(value), sequence)[4:]
+    crc = zlib.crc32(value, zlib.crc32(key, zlib.crc32(rest)))
+    return struct.pack("<I", crc) + rest
+
 class Segment:
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, index_interval: int = 4096, expected_entries: Optional[int] = None,
+                 false_positive_rate: float = 0.01, bloom_filter_size: int = 10000,
+                 block_cache: Optional[BlockCache] = None, compression: str = "none",
+                 restart_interval: int = 16):
+        self.file_path = file_path
+        self.index_interval = index_interval
+        self.restart_interval = restart_interval
+        # End of the blocks in the file; a sealed file continues with its
+        # footer. Record offsets, the sparse index and data_end count block
+        # contents as if laid end to end, without block headers or compression.
+        self.offset = FILE_HEADER.size
+        self.data_end = FILE_HEADER.size
+        self.entry_count = 0
+        self.tombstone_count = 0
+        self.max_sequence = 0
+        # Set for an ingested segment: every record reads as written at this
+        # sequence, whatever its header says (see assign_sequence()).
+        self.global_sequence = 0
+        # Records written with a TTL and when the last of them expires; a
+        # segment of nothing else is garbage once that time has passed.
+        self.expiring_count = 0
+        self.max_expires_at = 0
+        # Assigned by the store's compaction strategy; 0 for fresh flushes.
+        self.level = 0
+        self.min_key: Optional[str] = None
+        self.max_key: Optional[str] = None
+        # Segments written by the store are sorted, which is what makes the
+        # sparse index usable. Unsorted appends fall back to a full scan.
+        self.sorted = True
+        # Sparse index: the first key of every block of ~index_interval bytes,
+        # packed rather than held as str and int objects.
+        self.index_keys = KeyArray()
+        self.index_offsets = array("Q")
+        # New files use this codec; existing ones say which they were written
+        # with. Every block is stored (and compressed) on its own, at these
+        # file positions; the block still being written is pending, with its
+        # restart points and the key its next record is encoded against.
+        self.codec: Codec = codec_by_name(compression)
+        self.block_positions = array("Q")
+        self._pending = bytearray()
+        self._restarts: List[int] = []
+        self._block_entries = 0
+        self._previous_key = b""
+        self.blocks_decoded = 0
+        self.decode_seconds = 0.0
+        self.bytes_read = 0
+        # Filters are sized for the expected key count when the writer knows
+        # it (flushes and compactions do) and fall back to a fixed size.
+        self.expected_entries = expected_entries
+        self.false_positive_rate = false_positive_rate
+        self.bloom_filter_size = bloom_filter_size
+        self.bloom: Optional[BloomFilter] = None
+        self.bloom_skips = 0
+        # Lookups the filter let through that found nothing.
+        self.bloom_false_positives = 0
+        self._sealed = False
+        # Decoded (and decompressed) sparse-index blocks of sorted segments not
+        # open for writing are cached; everything else is read straight from
+        # the mapping, or decompressed on every read.
+        self.block_cache = block_cache
+        self.cache_id = next(_cache_ids)
+        self._file = None
+        self._hints: Optional[HintFileWriter] = None
+        self._mmap: Optional[mmap.mmap] = None
+        self.loaded_from_hints = False
+        # Bytes of each value log file this segment points into. Only known
+        # for records appended in this process; the store keeps it otherwise.
+        self.value_refs: Dict[int, int] = {}
+        if os.path.exists(file_path):
+            self._load_index()
+
+    def append(self, key: str, value: Union[bytes, ValuePointer, ExpiringValue, None], sequence: int = 0) -> int:
+        # Versions of one key must be appended oldest first.
+        key_bytes = key.encode()
+        flags = 0
+        expires_at = None
+        if isinstance(value, ExpiringValue):
+            value, expires_at, flags = value.value, value.expires_at, FLAG_EXPIRES
+        if isinstance(value, ValuePointer):
+            self.value_refs[value.file_id] = self.value_refs.get(value.file_id, 0) + value.size
+            value, flags = value.encode(), flags | FLAG_VALUE_POINTER
+        if expires_at is not None:
+            value = EXPIRY.pack(expires_at) + value
+            self.expiring_count += 1
+            self.max_expires_at = max(self.max_expires_at, expires_at)
+        if len(key_bytes) > MAX_KEY_SIZE:
+            raise ValueError(f"Key is {len(key_bytes)} bytes; the limit is {MAX_KEY_SIZE}")
+        if self._file is None:
+            if self.block_cache is not None:
+                # The last block is about to grow.
+                self.block_cache.discard(self.cache_id)
+            if self._sealed:
+                # Reopened for appending: drop the footer, keep adding to the
+                # filter that already covers the existing keys.
+                self._unmap()
+                with open(self.file_path, "r+b") as f:
+                    f.truncate(self.offset)
+                self._sealed = False
+            self._file = open(self.file_path, "ab")
+            if self._file.tell() == 0:
+                self._file.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION, self.codec.id))
+                self._hints = HintFileWriter(self.file_path)
+                if self.expected_entries is not None:
+                    self.bloom = BloomFilter.for_capacity(self.expected_entries, self.false_positive_rate)
+                else:
+                    self.bloom = BloomFilter(self.bloom_filter_size)
+            elif os.path.exists(hint_path(self.file_path)):
+                # Appending to a segment from an earlier run makes its hints stale.
+                os.remove(hint_path(self.file_path))
+        if len(self._pending) >= self.index_interval:
+            self._write_block()
+        block_start = not self._pending
+        offset = self.data_end
+        shared = 0
+        if self._block_entries % self.restart_interval == 0:
+            self._restarts.append(len(self._pending))
+        else:
+            shared = len(os.path.commonprefix((self._previous_key, key_bytes)))
+        stored_key = key_bytes[shared:]
+        size = RECORD_HEADER.size + len(stored_key) + (len(value) if value is not None else 0)
+        self._pending += encode_record_header(stored_key, value, sequence, flags, shared)
+        self._pending += stored_key
+        if value is not None:
+            self._pending += value
+        self._previous_key = key_bytes
+        self._block_entries += 1
+        if self._hints is not None:
+            self._hints.add(key_bytes, offset, size, value is None)
+        if self.bloom is not None:
+            self.bloom.add(key)
+        self._track(key, offset, value is None, block_start)
+        self.max_sequence = max(self.max_sequence, sequence)
+        self.data_end += size
+        return offset
+
+    @property
+    def index_bytes(self) -> int:
+        # Memory held by the sparse index and the block positions.
+        return (self.index_keys.nbytes + self.index_offsets.itemsize * len(self.index_offsets)
+                + self.block_positions.itemsize * len(self.block_positions))
+
+    def assign_sequence(self, sequence: int) -> None:
+        # Files built outside the store (see segment_writer.build_segment())
+        # hold one version per key at sequence 0. Ingesting one gives all of
+        # them the sequence of the ingest, kept in the manifest, so they shadow
+        # older writes and stay hidden from older snapshots without rewriting
+        # the file.
+        self.global_sequence = sequence
+        self.max_sequence = sequence
+        if self.block_cache is not None:
+            self.block_cache.discard(self.cache_id)
+
+    def expired(self, now: int) -> bool:
+        # Whether every record in the segment has expired by now.
+        return 0 < self.entry_count == self.expiring_count and self.max_expires_at <= now
+
+    def read(self, key: str) -> Optional[memoryview]:
+        return self.lookup(key)[1]
+
+    def read_at(self, offset: int) -> Tuple[str, Optional[memoryview]]:
+        if not FILE_HEADER.size <= offset < self.data_end:
+            raise ValueError(f"No entry at offset {offset} in {self.file_path}")
+        block = bisect.bisect_right(self.index_offsets, offset) - 1
+        data = self._block_data(block)
+        # Keys depend on the records before them, so walk up to the record.
+        for position, key, _, _, _ in self._entries(data):
+            if self.index_offsets[block] + position == offset:
+                return key.decode(), self._value(data, position)
+        raise ValueError(f"No entry at offset {offset} in {self.file_path}")
+
+    def lookup(self, key: str, sequence: Optional[int] = None) -> Tuple[bool, Optional[memoryview]]:
+        # Values come back as memoryview slices of the mapped file (or of
+        # the decompressed block): no syscalls and no copy. Call bytes() on
+        # them to keep a value around. With a sequence, the newest version at
+        # or below it is returned. Separated values come back as the
+        # ValuePointer to resolve against the value log, and values with a
+        # TTL wrapped in an ExpiringValue, whether or not they have expired.
+        if not self._may_contain(key):
+            return False, None
+        found, value, present = self._lookup(key, sequence)
+        if not present and self.bloom is not None:
+            self.bloom_false_positives += 1
+        return found, value
+
+    def _lookup(self, key: str, sequence: Optional[int]) -> Tuple[bool, Optional[memoryview], bool]:
+        # (found, value, present): present says whether the key is here at
+        # any sequence, as only a key absent at all of them was a false
+        # positive of the filter.
+        block = 0
+        if self.sorted:
+            if self.block_cache is not None and self._file is None:
+                return self._lookup_cached(key, sequence)
+            block = self._first_block(key, sequence)
+        target = key.encode()
+        found, value, present = False, None, False
+        for _, data, position, entry_key, record_sequence in self._scan(block, target):
+            if entry_key == target:
+                present = True
+                if sequence is None or record_sequence <= sequence:
+                    # Keep going: a later record for the same key is newer.
+                    value = self._value(data, position)
+                    found = True
+            elif self.sorted and entry_key > target:
+                break
+        return found, value, present
+
+    def lookup_many(self, keys: List[str], sequence: Optional[int] = None) -> Dict[str, Optional[memoryview]]:
+        # Looks up sorted keys in one forward pass over the file: each block
+        # is visited at most once and the position never moves backwards.
+        # Returns only the keys found; tombstones map to None.
+        keys = [key for key in keys if self._may_contain(key)]
+        if not keys:
+            return {}
+        results, present = self._lookup_many(keys, sequence)
+        if self.bloom is not None:
+            self.bloom_false_positives += len(keys) - present
+        return results
+
+    def _lookup_many(self, keys: List[str], sequence: Optional[int]) -> Tuple[Dict[str, Optional[memoryview]], int]:
+        # The keys found, and how many keys are here at any sequence.
+        results: Dict[str, Optional[memoryview]] = {}
+        present = 0
+        if not self.sorted or (self.block_cache is not None and self._file is None):
+            lookup = self._lookup if not self.sorted else self._lookup_cached
+            for key in keys:
+                found, value, seen = lookup(key, sequence)
+                if found:
+                    results[key] = value
+                present += seen
+            return results, present
+        records = None
+        record = None
+        for key in keys:
+            block = self._first_block(key, sequence)
+            target = key.encode()
+            if records is None or (record is not None and record[0] < block):
+                records = self._scan(block, target)
+                record = next(records, None)
+            seen = False
+            while record is not None and record[3] <= target:
+                _, data, position, entry_key, record_sequence = record
+                if entry_key == target:
+                    seen = True
+                    if sequence is None or record_sequence <= sequence:
+                        results[key] = self._value(data, position)
+                record = next(records, None)
+            present += seen
+        return results, present
+
+    def iterate_entries(self, start: Optional[str] = None) -> Iterator[Tuple[str, Optional[memoryview]]]:
+        for _, _, key, _, value in self._records(start):
+            yield key, value
+
+    def iterate_versions(self, start: Optional[str] = None) -> Iterator[Tuple[str, int, Optional[memoryview]]]:
+        # (key, sequence, value) per record; the versions of a key are
+        # adjacent and oldest first.
+        for _, _, key, sequence, value in self._records(start):
+            yield key, sequence, value
+
+    def iterate_records(self, start: Optional[str] = None) -> Iterator[Tuple[int, int, str, Optional[memoryview]]]:
+        # (offset, record size, key, value) in file order.
+        for position, size, key, _, value in self._records(start):
+            yield position, size, key, value
+
+    def close(self) -> None:
+        if self._file is not None:
+            if self._pending:
+                self._write_block()
+            if self.bloom is not None:
+                bloom = self.bloom.to_bytes()
+                self._file.write(bloom)
+                self._file.write(FOOTER.pack(self.offset, self.max_sequence, self.expiring_count,
+                                             self.max_expires_at, len(bloom), FOOTER_MAGIC))
+                self._sealed = True
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+        if self._hints is not None:
+            self._hints.close(self.offset)
+            self._hints = None
+
+    def rename(self, file_path: str) -> None:
+        self.close()
+        os.replace(self.file_path, file_path)
+        # Data first: a crash in between leaves a segment without hints,
+        # which just means the next open scans it.
+        if os.path.exists(hint_path(self.file_path)):
+            os.replace(hint_path(self.file_path), hint_path(file_path))
         self.file_path = file_path
-        self.offset = 0
 
-    def append(self, key: str, value: bytes) -> int:
-        # Implement append operation
-        pass
+    def remove(self) -> None:
+        if self._hints is not None:
+            self._hints.discard()
+            self._hints = None
+        self.close()
+        if self.block_cache is not None:
+            self.block_cache.discard(self.cache_id)
+        # Map before unlinking so readers still holding this segment (from a
+        # list that compaction has since replaced) can finish their lookups.
+        if self.entry_count:
+            self._view()
+        os.remove(self.file_path)
+        if os.path.exists(hint_path(self.file_path)):
+            os.remove(hint_path(self.file_path))
+
+    def _track(self, key: str, offset: int, tombstone: bool, block_start: bool) -> None:
+        if self.max_key is not None and key < self.max_key:
+            self.sorted = False
+        if self.min_key is None or key < self.min_key:
+            self.min_key = key
+        if self.max_key is None or key > self.max_key:
+            self.max_key = key
+        if block_start:
+            self.index_keys.append(key)
+            self.index_offsets.append(offset)
+        self.entry_count += 1
+        if tombstone:
+            self.tombstone_count += 1
+
+    def _load_index(self) -> None:
+        size = os.path.getsize(self.file_path)
+        if size == 0:
+            return
+        self.offset = size
+        view = self._view()
+        magic, version, codec_id = FILE_HEADER.unpack_from(view, 0)
+        if magic == MAGIC and version < FORMAT_VERSION:
+            # There is no in-place upgrade; older segments are refused outright.
+            raise ValueError(f"{self.file_path} was written in segment format version {version}, but this "
+                             f"version reads only format {FORMAT_VERSION}; rebuild the data directory")
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{self.file_path} is not a version {FORMAT_VERSION} segment file")
+        self.codec = codec_by_id(codec_id)
+        if size >= FILE_HEADER.size + FOOTER.size:
+            # Segments written before filters existed have no footer.
+            end, max_sequence, expiring_count, max_expires_at, bloom_length, footer_magic = \
+                FOOTER.unpack_from(view, size - FOOTER.size)
+            if footer_magic == FOOTER_MAGIC and end + bloom_length + FOOTER.size == size:
+                self.max_sequence = max_sequence
+                self.expiring_count = expiring_count
+                self.max_expires_at = max_expires_at
+                self.bloom = BloomFilter.from_bytes(bytes(view[end:end + bloom_length]))
+                self._sealed = True
+                size = self.offset = end
+        block_starts = self._load_blocks(view, size)
+        hints = read_hint_file(self.file_path, size)
+        if hints is not None:
+            starts = set(block_starts)
+            for key, offset, _, tombstone in hints:
+                self._track(key, offset, tombstone, offset in starts)
+            self.loaded_from_hints = True
+            return
+        # No usable hints, so walk every block instead. Only headers and keys
+        # are touched here; values are skipped over and their CRCs are checked
+        # when they are actually read.
+        for block, start in enumerate(block_starts):
+            data = self._block_data(block)
+            for position, key, flags, sequence, _ in self._entries(data):
+                self._track(key.decode(), start + position, bool(flags & FLAG_TOMBSTONE), position == 0)
+                self.max_sequence = max(self.max_sequence, sequence)
+
+    def _may_contain(self, key: str) -> bool:
+        if self.entry_count == 0 or key < self.min_key or key > self.max_key:
+            return False
+        if self.bloom is not None and not self.bloom.may_contain(key):
+            self.bloom_skips += 1
+            return False
+        return True
+
+    def _first_block(self, key: str, sequence: Optional[int]) -> int:
+        # The newest version of a key is in the last block starting at or
+        # before it. Older versions can reach back into the previous block
+        # when a block boundary falls among them.
+        if sequence is None:
+            return self.index_keys.bisect_right(key) - 1
+        block = self.index_keys.bisect_left(key)
+        if block == len(self.index_keys) or self.index_keys[block] != key:
+            return self.index_keys.bisect_right(key) - 1
+        return max(block - 1, 0)
+
+    def _lookup_cached(self, key: str, sequence: Optional[int]) -> Tuple[bool, Optional[bytes], bool]:
+        # Walks the key's versions newest first, block by block.
+        present = False
+        for block in range(self.index_keys.bisect_right(key) - 1, self._first_block(key, sequence) - 1, -1):
+            keys, sequences, values = self._cached_block(block)
+            position = bisect.bisect_right(keys, key) - 1
+            while position >= 0 and keys[position] == key:
+                if sequence is None or sequences[position] <= sequence:
+                    return True, values[position], True
+                present = True
+                position -= 1
+        return False, None, present
+
+    def _cached_block(self, block: int) -> Tuple[List[str], List[int], List[Optional[bytes]]]:
+        cache_key = (self.cache_id, block)
+        cached = self.block_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        data = self._block_data(block)
+        keys: List[str] = []
+        sequences: List[int] = []
+        values: List[Optional[bytes]] = []
+        # Charged for the decoded objects actually held, which for small
+        # records is several times the block's own size.
+        size = 0
+        for position, key, _, sequence, _ in self._entries(data):
+            value = self._value(data, position)
+            keys.append(key.decode())
+            sequences.append(sequence)
+            # Copies, so cached blocks never pin the mapping of a removed file.
+            if isinstance(value, ExpiringValue) and isinstance(value.value, memoryview):
+                value = value._replace(value=bytes(value.value))
+            elif isinstance(value, memoryview):
+                value = bytes(value)
+            values.append(value)
+            inner = value.value if isinstance(value, ExpiringValue) else value
+            size += len(key) + CACHED_ENTRY_OVERHEAD + (len(inner) if isinstance(inner, bytes) else 0)
+        self.block_cache.put(cache_key, (keys, sequences, values), size)
+        return keys, sequences, values
+
+    def _block_data(self, block: int) -> memoryview:
+        # The contents of one sparse-index block: a slice of the mapping for
+        # raw segments, a freshly decompressed copy otherwise.
+        if block == len(self.block_positions):
+            return memoryview(self._block_contents())
+        view = self._view()
+        position = self.block_positions[block]
+        stored_length, length = BLOCK_HEADER.unpack_from(view, position)
+        start = position + BLOCK_HEADER.size
+        self.bytes_read += BLOCK_HEADER.size + stored_length
+        if not self.codec.id:
+            return view[start:start + stored_length]
+        began = time.perf_counter()
+        try:
+            data = self.codec.decompress(view[start:start + stored_length])
+        except DECOMPRESSION_ERRORS as e:
+            raise ValueError(f"Corrupt block at offset {position} in {self.file_path}") from e
+        self.decode_seconds += time.perf_counter() - began
+        self.blocks_decoded += 1
+        if len(data) != length:
+            raise ValueError(f"Corrupt block at offset {position} in {self.file_path}")
+        return memoryview(data)
+
+    def _block_contents(self) -> bytes:
+        # The pending records with their restart array, as a finished block
+        # holds them.
+        return bytes(self._pending) + struct.pack(f"<{len(self._restarts) + 1}I", *self._restarts,
+                                                  len(self._restarts))
+
+    def _restart_points(self, data: memoryview) -> Tuple[int, Tuple[int, ...]]:
+        # Where a block's records end, and the offsets of its restart points.
+        count = RESTART.unpack_from(data, len(data) - RESTART.size)[0] if len(data) >= RESTART.size else 0
+        end = len(data) - RESTART.size * (count + 1)
+        if count == 0 or end < 0:
+            raise ValueError(f"Corrupt restart array in a block of {self.file_path}")
+        return end, struct.unpack_from(f"<{count}I", data, end)
+
+    def _seek(self, data: memoryview, target: bytes) -> int:
+        # Binary search of the restart points for the last one whose key is
+        # below target: every record for target comes after it. Restart keys
+        # are stored in full, so each probe reads just one record.
+        _, restarts = self._restart_points(data)
+        low, high = 0, len(restarts)
+        while low < high:
+            middle = (low + high) // 2
+            position = restarts[middle]
+            _, _, _, key_length, _, _ = RECORD_HEADER.unpack_from(data, position)
+            key_start = position + RECORD_HEADER.size
+            if bytes(data[key_start:key_start + key_length]) < target:
+                low = middle + 1
+            else:
+                high = middle
+        return restarts[max(low - 1, 0)]
+
+    def _entries(self, data: memoryview, position: int = 0) -> Iterator[Tuple[int, bytes, int, int, int]]:
+        # (position, key, flags, sequence, end) for the records of a block from
+        # position, which must be a restart point, on. Values are left for
+        # _value().
+        end, _ = self._restart_points(data)
+        global_sequence = self.global_sequence
+        key = b""
+        while position < end:
+            _, flags, shared, key_length, value_length, sequence = RECORD_HEADER.unpack_from(data, position)
+            key_start = position + RECORD_HEADER.size
+            record_end = key_start + key_length + value_length
+            if record_end > end:
+                raise ValueError(f"Truncated record in a block of {self.file_path}")
+            key = key[:shared] + bytes(data[key_start:key_start + key_length])
+            yield position, key, flags, global_sequence or sequence, record_end
+            position = record_end
+
+    def _scan(self, block: int, target: Optional[bytes] = None) -> Iterator[Tuple[int, memoryview, int, bytes, int]]:
+        # (block, block data, position in it, key, sequence) for every record
+        # from the start of block on; with a target, a sorted segment starts
+        # at the restart point before it.
+        for block in range(block, len(self.index_offsets)):
+            data = self._block_data(block)
+            position = self._seek(data, target) if target is not None and self.sorted else 0
+            target = None
+            for position, key, _, sequence, _ in self._entries(data, position):
+                yield block, data, position, key, sequence
+
+    def _records(self, start: Optional[str]) -> Iterator[Tuple[int, int, str, int, Optional[memoryview]]]:
+        # (offset, record size, key, sequence, value) in file order. In a
+        # sorted segment start skips ahead via the sparse index and the
+        # restart points to the first key >= start.
+        if self.entry_count == 0:
+            return
+        first = 0
+        if start is not None and self.sorted:
+            # bisect_left: copies of start may begin in the block before the
+            # one whose first key is start.
+            first = max(self.index_keys.bisect_left(start) - 1, 0)
+        for block, data, position, key, sequence in self._scan(first, start.encode() if start is not None else None):
+            key = key.decode()
+            if start is None or not self.sorted or key >= start:
+                yield (self.index_offsets[block] + position, _record_size(data, position), key, sequence,
+                       self._value(data, position))
+
+    def _write_block(self) -> None:
+        contents = self._block_contents()
+        data = self.codec.compress(contents)
+        self.block_positions.append(self.offset)
+        self._file.write(BLOCK_HEADER.pack(len(data), len(contents)))
+        self._file.write(data)
+        self.offset += BLOCK_HEADER.size + len(data)
+        # The restart array counts towards the logical offsets too.
+        self.data_end += len(contents) - len(self._pending)
+        self._pending = bytearray()
+        self._restarts = []
+        self._block_entries = 0
+        self._previous_key = b""
+
+    def _load_blocks(self, view: memoryview, size: int) -> List[int]:
+        # Walks the block headers, recording where each block sits in the
+        # file; returns the offset of its first record.
+        starts = []
+        position = FILE_HEADER.size
+        while position < size:
+            if position + BLOCK_HEADER.size > size:
+                raise ValueError(f"Truncated block at offset {position} in {self.file_path}")
+            stored_length, length = BLOCK_HEADER.unpack_from(view, position)
+            self.block_positions.append(position)
+            starts.append(self.data_end)
+            position += BLOCK_HEADER.size + stored_length
+            self.data_end += length
+        if position != size:
+            raise ValueError(f"Truncated block at end of {self.file_path}")
+        return starts
+
+    def _value(self, data: memoryview, position: int) -> Union[memoryview, ValuePointer, ExpiringValue, None]:
+        # Checks the CRC of the record at position and returns its value.
+        crc, flags, _, key_length, value_length, _ = RECORD_HEADER.unpack_from(data, position)
+        value_start = position + RECORD_HEADER.size + key_length
+        end = value_start + value_length
+        if zlib.crc32(data[position + 4:end]) != crc:
+            raise ValueError(f"CRC mismatch for record at offset {position} in a block of {self.file_path}")
+        if flags & FLAG_TOMBSTONE:
+            return None
+        if flags & FLAG_EXPIRES:
+            expires_at, = EXPIRY.unpack_from(data, value_start)
+            value_start += EXPIRY.size
+        if flags & FLAG_VALUE_POINTER:
+            value = ValuePointer.decode(data[value_start:end])
+        else:
+            value = data[value_start:end]
+        return ExpiringValue(value, expires_at) if flags & FLAG_EXPIRES else value
 
-    def read(self, offset: int) -> tuple[str, bytes]:
-        # Implement read operation
-        pass
+    def _view(self) -> memoryview:
+        if self._file is not None:
+            self._file.flush()
+        if self._mmap is None or len(self._mmap) < self.offset:
+            # Only a segment still being appended to ever needs remapping;
+            # sealed segments are mapped once.
+            self._unmap()
+            with open(self.file_path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._mmap)
 
-    def iterate_entries(self):
-        # Implement iteration over all entries
-        pass
\ No newline at end of file
+    def _unmap(self) -> None:
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # A caller still holds a value slice; the mapping is released
+                # when the last view goes away.
+                pass
+            self._mmap = None
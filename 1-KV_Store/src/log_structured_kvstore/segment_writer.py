@@ -0,0 +1,131 @@
+import os
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from .compaction import RateLimiter, merge_segments, visible_versions
+from .hint_file import hint_path
+from .segment import Segment
+from .value_log import ValueLogWriter, ValuePointer, separate_values
+
+class SegmentOptions(NamedTuple):
+    # Everything needed to write a segment the way the store would, in a
+    # form that can be shipped to a worker process.
+    index_interval: int = 4096
+    false_positive_rate: float = 0.01
+    bloom_filter_size: int = 10000
+    compression: str = "none"
+    value_log_threshold: int = 0
+    restart_interval: int = 16
+
+def write_segments(versions: Iterable[Tuple[str, int, Optional[bytes]]], paths: Iterator[str],
+                   open_segment: Callable[[str], Segment], max_size: Optional[int] = None,
+                   limiter: Optional[RateLimiter] = None) -> List[Segment]:
+    # Writes sorted versions into one segment, or into a new one each time
+    # max_size is reached. A key's versions never straddle two segments.
+    # Files are written under a temporary name so a crash mid-write never
+    # leaves a half-written segment that looks valid.
+    segments: List[Segment] = []
+    segment = None
+    for key, sequence, value in versions:
+        if segment is not None and max_size is not None and segment.offset >= max_size and key != segment.max_key:
+            segment.rename(path)
+            segments.append(segment)
+            segment = None
+        if segment is None:
+            path = next(paths)
+            segment = open_segment(path + ".tmp")
+        start = segment.offset
+        segment.append(key, value, sequence)
+        if limiter is not None:
+            limiter.consume(segment.offset - start)
+    if segment is not None:
+        segment.rename(path)
+        segments.append(segment)
+    return segments
+
+def write_separated(versions: Iterable[Tuple[str, int, Optional[bytes]]], paths: Iterator[str],
+                    open_segment: Callable[[str], Segment], threshold: int, value_path: Optional[str],
+                    max_size: Optional[int] = None, limiter: Optional[RateLimiter] = None,
+                    relocate: Set[int] = frozenset(),
+                    read: Optional[Callable[[ValuePointer], memoryview]] = None) -> Tuple[List[Segment], Optional[str]]:
+    # write_segments(), with values over threshold (and those in the relocate
+    # files) moved to a new value log file at value_path. Returns the path
+    # of that file, durable like the segments, or None if it was not needed.
+    if value_path is None:
+        return write_segments(versions, paths, open_segment, max_size, limiter), None
+    values = ValueLogWriter(value_path)
+    try:
+        segments = write_segments(separate_values(versions, values, threshold, relocate, read), paths,
+                                  open_segment, max_size, limiter)
+    except BaseException:
+        values.discard()
+        raise
+    return segments, values.close()
+
+def build_segment(path: str, entries: Iterable[Tuple[str, object]], options: SegmentOptions = SegmentOptions(),
+                  expected_entries: Optional[int] = None) -> Segment:
+    # Writes sorted (key, value) pairs into a finished segment at path, index
+    # and filter included, for LogStructuredStore.ingest_segments() to take
+    # in whole. Needs no store. Keys must be strictly increasing; a value of
+    # None writes a tombstone and an ExpiringValue one that expires. Values
+    # always stay inline. The filter is sized for expected_entries, or for
+    # len(entries) when entries is a sequence.
+    if expected_entries is None and hasattr(entries, "__len__"):
+        expected_entries = len(entries)
+    try:
+        segments = write_segments(_strictly_sorted(entries), iter([path]), _opener(options, expected_entries))
+    except BaseException:
+        # Nothing half written is left behind under the temporary name.
+        for leftover in (path + ".tmp", hint_path(path + ".tmp")):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    if not segments:
+        raise ValueError("A segment needs at least one entry")
+    return segments[0]
+
+def _strictly_sorted(entries: Iterable[Tuple[str, object]]) -> Iterator[Tuple[str, int, object]]:
+    previous = None
+    for key, value in entries:
+        if previous is not None and key <= previous:
+            raise ValueError(f"Keys must be strictly increasing; {key!r} follows {previous!r}")
+        previous = key
+        yield key, 0, value
+
+# The two functions below run in worker processes. They take and return
+# plain paths; the store opens the results itself. Both return each segment
+# written with the bytes it points into every value log file, and the value
+# log file written, if any values were separated.
+
+Written = Tuple[List[Tuple[str, Dict[int, int]]], Optional[str]]
+
+def flush_to_files(versions: List[Tuple[str, int, Optional[bytes]]], paths: List[str],
+                   options: SegmentOptions, value_path: Optional[str] = None) -> Written:
+    segments, value_log = write_separated(versions, iter(paths), _opener(options, len(versions)),
+                                          options.value_log_threshold, value_path)
+    return [(segment.file_path, segment.value_refs) for segment in segments], value_log
+
+def compact_to_files(input_paths: List[str], paths: List[str], options: SegmentOptions, expected_entries: int,
+                     snapshots: List[int], drop_tombstones: bool, max_size: Optional[int],
+                     rate_limit: int, value_path: Optional[str] = None, now: Optional[int] = None,
+                     global_sequences: Optional[List[int]] = None) -> Written:
+    # global_sequences has one entry per input: the sequence an ingested
+    # input was assigned, or 0.
+    inputs = [Segment(path, options.index_interval) for path in input_paths]
+    for segment, sequence in zip(inputs, global_sequences or ()):
+        if sequence:
+            segment.assign_sequence(sequence)
+    try:
+        versions = visible_versions(merge_segments(inputs), snapshots, drop_tombstones, now)
+        segments, value_log = write_separated(versions, iter(paths), _opener(options, expected_entries),
+                                              options.value_log_threshold, value_path, max_size,
+                                              RateLimiter(rate_limit))
+        return [(segment.file_path, segment.value_refs) for segment in segments], value_log
+    finally:
+        for segment in inputs:
+            segment.close()
+
+def _opener(options: SegmentOptions, expected_entries: int) -> Callable[[str], Segment]:
+    def open_segment(path: str) -> Segment:
+        return Segment(path, options.index_interval, expected_entries,
+                       options.false_positive_rate, options.bloom_filter_size, compression=options.compression,
+                       restart_interval=options.restart_interval)
+    return open_segment
@@ -0,0 +1,379 @@
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+from .async_log_structured_store import AsyncLogStructuredStore
+from .metrics import prometheus_text
+from .segment import MAX_KEY_SIZE
+from .config import Config
+
+# The server speaks RESP, the Redis protocol, so redis-cli and
+# redis-benchmark work against it. Clients may pipeline: send many commands
+# without waiting, then read the replies, which come back in order.
+
+READ_CHUNK = 64 * 1024
+# Largest bulk string a client may send, longest inline command line and
+# most arguments in one command.
+MAX_BULK_LENGTH = 512 * 1024 * 1024
+MAX_INLINE_LENGTH = 64 * 1024
+MAX_MULTIBULK_LENGTH = 1024 * 1024
+# Back-to-back commands of one kind are answered with a single store call.
+_READS = {b"GET", b"MGET"}
+_WRITES = {b"SET", b"MSET", b"DEL"}
+
+class ProtocolError(Exception):
+    pass
+
+class RequestParser:
+    # Incremental RESP parser: feed it whatever the socket returned and take
+    # every complete command, leaving a partial one buffered. Inline commands
+    # ("PING\r\n"), as typed into telnet, are accepted too.
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+        self.error: Optional[str] = None
+
+    def feed(self, data: bytes) -> None:
+        self._buffer += data
+
+    def commands(self) -> List[List[bytes]]:
+        # After a protocol error the stream cannot be resynchronised; what
+        # parsed before it is returned and error is set.
+        commands = []
+        try:
+            while self.error is None:
+                command = self._parse()
+                if command is None:
+                    break
+                if command:
+                    commands.append(command)
+        except ProtocolError as e:
+            self.error = str(e)
+        del self._buffer[:self._position]
+        self._position = 0
+        return commands
+
+    def _parse(self) -> Optional[List[bytes]]:
+        line = self._line(self._position)
+        if line is None:
+            return None
+        header, position = line
+        if not header.startswith(b"*"):
+            self._position = position
+            return header.split()
+        count = _parse_length(header)
+        if not 0 <= count <= MAX_MULTIBULK_LENGTH:
+            raise ProtocolError("invalid multibulk length")
+        arguments = []
+        for _ in range(count):
+            line = self._line(position)
+            if line is None:
+                return None
+            header, position = line
+            if not header.startswith(b"$"):
+                raise ProtocolError(f"expected '$', got {header[:1]!r}")
+            length = _parse_length(header)
+            # Clients never send the null bulk string ($-1).
+            if not 0 <= length <= MAX_BULK_LENGTH:
+                raise ProtocolError("invalid bulk length")
+            end = position + length
+            if len(self._buffer) < end + 2:
+                return None
+            if self._buffer[end:end + 2] != b"\r\n":
+                raise ProtocolError("bulk string not terminated by CRLF")
+            arguments.append(bytes(self._buffer[position:end]))
+            position = end + 2
+        self._position = position
+        return arguments
+
+    def _line(self, start: int) -> Optional[Tuple[bytes, int]]:
+        end = self._buffer.find(b"\r\n", start)
+        if end < 0:
+            if len(self._buffer) - start > MAX_INLINE_LENGTH:
+                raise ProtocolError("too big inline request")
+            return None
+        return bytes(self._buffer[start:end]), end + 2
+
+def _parse_length(header: bytes) -> int:
+    try:
+        return int(header[1:])
+    except ValueError:
+        raise ProtocolError(f"invalid length {header[1:]!r}") from None
+
+def encode_ok() -> bytes:
+    return b"+OK\r\n"
+
+def encode_error(message: str) -> bytes:
+    return b"-ERR " + message.replace("\r", " ").replace("\n", " ").encode() + b"\r\n"
+
+def encode_integer(value: int) -> bytes:
+    return b":%d\r\n" % value
+
+def encode_bulk(value: Optional[bytes]) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n" % len(value) + value + b"\r\n"
+
+def encode_array(items: List[bytes]) -> bytes:
+    # Items are already encoded replies.
+    return b"*%d\r\n" % len(items) + b"".join(items)
+
+def encode_command(*arguments: bytes) -> bytes:
+    return encode_array([encode_bulk(argument) for argument in arguments])
+
+class Server:
+    # Serves an AsyncLogStructuredStore over TCP. Every connection is a task
+    # that reads whatever the client has sent, answers all the complete
+    # commands in it and writes the replies back in one go.
+    def __init__(self, store: AsyncLogStructuredStore, config: Config):
+        self.store = store
+        self.config = config
+        self.connections = 0
+        self.commands_processed = 0
+        self.rejected_connections = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._metrics_server: Optional[asyncio.AbstractServer] = None
+        self._writers: Set[asyncio.StreamWriter] = set()
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.config.server_host, self.config.server_port)
+        if self.config.metrics_port:
+            self._metrics_server = await asyncio.start_server(self._serve_metrics, self.config.server_host,
+                                                              self.config.metrics_port)
+
+    @property
+    def port(self) -> int:
+        # The bound port; differs from the configured one when that is 0.
+        return self._server.sockets[0].getsockname()[1]
+
+    @property
+    def metrics_port(self) -> Optional[int]:
+        if self._metrics_server is None:
+            return None
+        return self._metrics_server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+            await self._metrics_server.wait_closed()
+
+    def get_statistics(self) -> Dict[str, int]:
+        return {"connected_clients": self.connections, "rejected_connections": self.rejected_connections,
+                "commands_processed": self.commands_processed}
+
+    def metrics_text(self) -> str:
+        return prometheus_text({**self.store.get_statistics(), **self.get_statistics()}, self.store.metrics)
+
+    async def _serve_metrics(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Just enough HTTP for a Prometheus scrape: GET /metrics gets the
+        # text exposition format, anything else a 404, and the connection
+        # is closed after every response.
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            await _close(writer)
+            return
+        method, path = (request.split(b" ", 2) + [b"", b""])[:2]
+        if method == b"GET" and path.split(b"?")[0] == b"/metrics":
+            status, body = b"200 OK", self.metrics_text().encode()
+        else:
+            status, body = b"404 Not Found", b"Not found\n"
+        writer.write(b"HTTP/1.0 %s\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: %d\r\n"
+                     b"Connection: close\r\n\r\n" % (status, len(body)) + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        await _close(writer)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        if self.connections >= self.config.server_max_connections:
+            self.rejected_connections += 1
+            writer.write(encode_error("max number of clients reached"))
+            await _close(writer)
+            return
+        self.connections += 1
+        self._writers.add(writer)
+        parser = RequestParser()
+        try:
+            while True:
+                data = await reader.read(READ_CHUNK)
+                if not data:
+                    break
+                parser.feed(data)
+                replies, quit = await self.execute(parser.commands())
+                if parser.error is not None:
+                    replies.append(encode_error(f"Protocol error: {parser.error}"))
+                    quit = True
+                writer.write(b"".join(replies))
+                # Stop reading until the client takes its replies.
+                await writer.drain()
+                if quit:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            self._writers.discard(writer)
+            await _close(writer)
+
+    async def execute(self, commands: List[List[bytes]]) -> Tuple[List[bytes], bool]:
+        # Answers commands in order. A run of reads becomes one multi_get and
+        # a run of writes one write_batch, so a pipeline of thousands costs a
+        # handful of store calls and a single WAL sync. Returns the replies
+        # and whether the client asked to quit.
+        replies: List[bytes] = []
+        index = 0
+        while index < len(commands):
+            name = commands[index][0].upper()
+            end = index + 1
+            if name in _READS or name in _WRITES:
+                kind = _READS if name in _READS else _WRITES
+                while end < len(commands) and commands[end][0].upper() in kind:
+                    end += 1
+                run = commands[index:end]
+                replies.extend(await (self._read(run) if kind is _READS else self._write(run)))
+            elif name == b"QUIT":
+                self.commands_processed += index + 1
+                return replies + [encode_ok()], True
+            else:
+                replies.append(await self._command(name, commands[index][1:]))
+            index = end
+        self.commands_processed += len(commands)
+        return replies, False
+
+    async def _read(self, run: List[List[bytes]]) -> List[bytes]:
+        requests: List[Optional[List[str]]] = []
+        errors: Dict[int, bytes] = {}
+        for position, (name, *arguments) in enumerate(run):
+            name = name.upper()
+            if (name == b"GET" and len(arguments) != 1) or not arguments:
+                errors[position] = _arity_error(name)
+                requests.append(None)
+                continue
+            try:
+                requests.append([_key(argument) for argument in arguments])
+            except ValueError as e:
+                errors[position] = encode_error(str(e))
+                requests.append(None)
+        keys = [key for request in requests if request for key in request]
+        try:
+            values = await self.store.multi_get(keys) if keys else {}
+        except Exception as e:
+            return [errors.get(position, encode_error(str(e))) for position in range(len(run))]
+        replies = []
+        for position, (command, request) in enumerate(zip(run, requests)):
+            if request is None:
+                replies.append(errors[position])
+            elif command[0].upper() == b"GET":
+                replies.append(encode_bulk(values[request[0]]))
+            else:
+                replies.append(encode_array([encode_bulk(values[key]) for key in request]))
+        return replies
+
+    async def _write(self, run: List[List[bytes]]) -> List[bytes]:
+        operations: List[Tuple[str, str, Optional[bytes]]] = []
+        replies: List[Optional[bytes]] = []
+        for name, *arguments in run:
+            name = name.upper()
+            try:
+                if name == b"SET":
+                    if len(arguments) < 2:
+                        raise ValueError(_arity_message(name))
+                    # EX and PX set a time to live; SET's condition options
+                    # are not supported.
+                    command = [("put", _key(arguments[0]), arguments[1], _ttl(arguments[2:]))]
+                elif name == b"MSET":
+                    if not arguments or len(arguments) % 2:
+                        raise ValueError(_arity_message(name))
+                    command = [("put", _key(key), value) for key, value in zip(arguments[::2], arguments[1::2])]
+                else:
+                    if not arguments:
+                        raise ValueError(_arity_message(name))
+                    command = [("delete", _key(key), None) for key in arguments]
+            except ValueError as e:
+                replies.append(encode_error(str(e)))
+                continue
+            operations.extend(command)
+            # Deletes are blind writes; DEL counts the keys it was given
+            # rather than looking up which of them existed.
+            replies.append(encode_integer(len(command)) if name == b"DEL" else None)
+        if operations:
+            try:
+                await self.store.write_batch(operations)
+            except Exception as e:
+                return [reply if reply is not None and reply.startswith(b"-") else encode_error(str(e))
+                        for reply in replies]
+        return [reply if reply is not None else encode_ok() for reply in replies]
+
+    async def _command(self, name: bytes, arguments: List[bytes]) -> bytes:
+        if name == b"PING":
+            return encode_bulk(arguments[0]) if arguments else b"+PONG\r\n"
+        if name == b"ECHO":
+            return encode_bulk(arguments[0]) if len(arguments) == 1 else _arity_error(name)
+        if name == b"INFO":
+            statistics = {**self.store.get_statistics(), **self.get_statistics()}
+            return encode_bulk("".join(f"{key}:{value}\r\n" for key, value in statistics.items()).encode())
+        if name == b"METRICS":
+            return encode_bulk(self.metrics_text().encode())
+        if name == b"COMMAND":
+            # redis-cli asks for command docs on connect; an empty list is fine.
+            return encode_array([])
+        return encode_error(f"unknown command '{name.decode(errors='replace')}'")
+
+def _key(argument: bytes) -> str:
+    if len(argument) > MAX_KEY_SIZE:
+        raise ValueError(f"key is {len(argument)} bytes; the limit is {MAX_KEY_SIZE}")
+    try:
+        return argument.decode()
+    except UnicodeDecodeError:
+        raise ValueError("keys must be valid UTF-8") from None
+
+def _ttl(options: List[bytes]) -> Optional[float]:
+    # SET key value [EX seconds | PX milliseconds], as seconds.
+    if not options:
+        return None
+    if len(options) != 2 or options[0].upper() not in (b"EX", b"PX"):
+        raise ValueError("syntax error")
+    try:
+        amount = int(options[1])
+    except ValueError:
+        raise ValueError("value is not an integer or out of range") from None
+    if amount <= 0:
+        raise ValueError("invalid expire time in 'set' command")
+    return amount if options[0].upper() == b"EX" else amount / 1000
+
+def _arity_message(name: bytes) -> str:
+    return f"wrong number of arguments for '{name.decode(errors='replace').lower()}' command"
+
+def _arity_error(name: bytes) -> bytes:
+    return encode_error(_arity_message(name))
+
+async def _close(writer: asyncio.StreamWriter) -> None:
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except ConnectionError:
+        pass
+
+async def serve(directory: str, config: Config) -> None:
+    # Runs until cancelled (e.g. Ctrl-C), then closes the store cleanly.
+    store = await AsyncLogStructuredStore.open(directory, config)
+    server = Server(store, config)
+    try:
+        await server.start()
+        print(f"Serving {directory} on {config.server_host}:{server.port}")
+        if server.metrics_port is not None:
+            print(f"Prometheus metrics at http://{config.server_host}:{server.metrics_port}/metrics")
+        await server.serve_forever()
+    finally:
+        await server.close()
+        await store.close()
@@ -0,0 +1,146 @@
+import bisect
+import hashlib
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from .key_value_store import KeyValueStore
+from .block_cache import BlockCache
+from .log_structured_store import LogStructuredStore, check_operations
+from .compaction import merge_entries
+from .metrics import Metrics, Tracer
+from .config import Config
+
+SHARD_PREFIX = "shard-"
+# Points per shard on the ring; more points even out the key spread.
+VIRTUAL_NODES = 64
+
+def _hash(data: str) -> int:
+    return struct.unpack("<Q", hashlib.blake2b(data.encode(), digest_size=8).digest())[0]
+
+class HashRing:
+    # Consistent hashing: each shard owns the arcs of the ring ending at its
+    # points, so adding a shard moves only about 1/N of the keys.
+    def __init__(self, shard_count: int, virtual_nodes: int = VIRTUAL_NODES):
+        points = sorted((_hash(f"{shard}-{node}"), shard)
+                        for shard in range(shard_count) for node in range(virtual_nodes))
+        self._points = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, key: str) -> int:
+        index = bisect.bisect_right(self._points, _hash(key))
+        return self._shards[index % len(self._shards)]
+
+class ShardedStore(KeyValueStore):
+    # Spreads keys over shard_count LogStructuredStores, one per
+    # subdirectory, each with its own WAL, segments and compaction. With
+    # process_pool_workers set, every shard hands its flushes and
+    # compactions to one shared process pool, and all shards share one block
+    # cache of block_cache_size bytes.
+    def __init__(self, directory: str, config: Config):
+        self.directory = directory
+        self.config = config
+        os.makedirs(directory, exist_ok=True)
+        existing = sorted(name for name in os.listdir(directory) if name.startswith(SHARD_PREFIX))
+        if existing and len(existing) != config.shard_count:
+            raise ValueError(f"{directory} holds {len(existing)} shards but shard_count is {config.shard_count}; "
+                             f"keys would be routed to the wrong shards")
+        self.executor = ProcessPoolExecutor(config.process_pool_workers) if config.process_pool_workers > 0 else None
+        self.block_cache = BlockCache(config.block_cache_size) if config.block_cache_size > 0 else None
+        self.ring = HashRing(config.shard_count)
+        self.shards = [LogStructuredStore(os.path.join(directory, f"{SHARD_PREFIX}{shard:03d}"), config, self.executor,
+                                          self.block_cache)
+                       for shard in range(config.shard_count)]
+
+    def shard_for(self, key: str) -> LogStructuredStore:
+        return self.shards[self.ring.shard_for(key)]
+
+    def put(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        self.shard_for(key).put(key, value, ttl)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.shard_for(key).get(key)
+
+    def delete(self, key: str) -> None:
+        self.shard_for(key).delete(key)
+
+    def multi_get(self, keys: Iterable[str]) -> Dict[str, Optional[bytes]]:
+        keys = list(keys)
+        results: Dict[str, Optional[bytes]] = {}
+        for shard, shard_keys in self._group(keys).items():
+            results.update(self.shards[shard].multi_get(shard_keys))
+        return {key: results[key] for key in keys}
+
+    def write_batch(self, operations: List[Tuple[str, str, Optional[bytes]]]) -> None:
+        # Atomic within each shard; a crash can leave a batch that spans
+        # shards applied on some and not on others.
+        operations = list(operations)
+        check_operations(operations)
+        grouped: Dict[int, List[Tuple[str, str, Optional[bytes]]]] = {}
+        for operation in operations:
+            grouped.setdefault(self.ring.shard_for(operation[1]), []).append(operation)
+        for shard, shard_operations in grouped.items():
+            self.shards[shard].write_batch(shard_operations)
+
+    def scan(self, start: Optional[str] = None, end: Optional[str] = None,
+             limit: Optional[int] = None) -> Iterator[Tuple[str, bytes]]:
+        # Shards hold disjoint keys, so merging their scans needs no tie-break.
+        if limit is not None and limit <= 0:
+            return
+        count = 0
+        for entry in merge_entries([shard.scan(start, end, limit) for shard in self.shards]):
+            yield entry
+            count += 1
+            if count == limit:
+                return
+
+    def flush(self) -> None:
+        for shard in self.shards:
+            shard.flush()
+
+    def compact(self) -> None:
+        for shard in self.shards:
+            shard.compact()
+
+    def wait_for_compaction(self) -> None:
+        for shard in self.shards:
+            shard.wait_for_compaction()
+
+    def recover(self) -> None:
+        for shard in self.shards:
+            shard.recover()
+
+    def close(self) -> None:
+        for shard in self.shards:
+            shard.close()
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def get_statistics(self) -> Dict[str, any]:
+        per_shard = [shard.get_statistics() for shard in self.shards]
+        totals = {name: sum(stats[name] for stats in per_shard) for name, value in per_shard[0].items()
+                  if isinstance(value, int) and not isinstance(value, bool)}
+        # Every shard reports the shared cache; count it once.
+        return {"shard_count": len(self.shards), **totals,
+                **(self.block_cache.get_statistics() if self.block_cache is not None else {}),
+                "shard_entries": [stats["memtable_entries"] + stats["segment_entries"] for stats in per_shard],
+                "latency": self.metrics.latency_summary()}
+
+    @property
+    def metrics(self) -> Metrics:
+        # Every shard's histograms added together; a fresh copy each time.
+        return Metrics.merged(shard.metrics for shard in self.shards)
+
+    def add_tracer(self, tracer: Tracer) -> None:
+        for shard in self.shards:
+            shard.add_tracer(tracer)
+
+    def remove_tracer(self, tracer: Tracer) -> None:
+        for shard in self.shards:
+            shard.remove_tracer(tracer)
+
+    def _group(self, keys: Iterable[str]) -> Dict[int, List[str]]:
+        grouped: Dict[int, List[str]] = {}
+        for key in keys:
+            grouped.setdefault(self.ring.shard_for(key), []).append(key)
+        return grouped
@@ -0,0 +1,153 @@
+import mmap
+import os
+import struct
+import zlib
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Set, Tuple
+from .expiry import ExpiringValue
+
+# Values above a size threshold are kept out of the segments: they go to a
+# value log file once, and the segment record holds a pointer to them.
+# Compaction then only copies the pointer, however often it rewrites the key.
+# Every flush (and every value-log garbage collection) that separates values
+# writes one new file; files are immutable once written.
+
+VALUE_LOG_PREFIX = "values-"
+VALUE_LOG_SUFFIX = ".vlog"
+MAGIC = b"LSVL"
+FORMAT_VERSION = 1
+# magic, format version, reserved
+FILE_HEADER = struct.Struct("<4sHH")
+# crc32, key length, value length. The CRC covers the lengths, the key and
+# the value; the key is kept so a record can be traced back to its owner.
+RECORD_HEADER = struct.Struct("<IHI")
+# file id, record offset, record size
+POINTER = struct.Struct("<QQI")
+
+class ValuePointer(NamedTuple):
+    file_id: int
+    offset: int
+    # The whole record: header, key and value. Segments add this up per file
+    # to know how much of it is still referenced.
+    size: int
+
+    def encode(self) -> bytes:
+        return POINTER.pack(*self)
+
+    @classmethod
+    def decode(cls, data: memoryview) -> 'ValuePointer':
+        if len(data) != POINTER.size:
+            raise ValueError(f"Value pointer is {len(data)} bytes, expected {POINTER.size}")
+        return cls(*POINTER.unpack(data))
+
+def value_log_path(directory: str, file_id: int) -> str:
+    return os.path.join(directory, f"{VALUE_LOG_PREFIX}{file_id:08d}{VALUE_LOG_SUFFIX}")
+
+def value_log_id(file_path: str) -> int:
+    return int(os.path.basename(file_path)[len(VALUE_LOG_PREFIX):-len(VALUE_LOG_SUFFIX)])
+
+class ValueLogWriter:
+    # Writes one value log file under a temporary name; close() makes it
+    # durable and gives it its real name. The file is only created once a
+    # value is appended, so a flush without large values leaves nothing.
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.file_id = value_log_id(file_path)
+        self.offset = FILE_HEADER.size
+        self._file = None
+
+    def append(self, key: str, value: bytes) -> ValuePointer:
+        if self._file is None:
+            self._file = open(self.file_path + ".tmp", "wb")
+            self._file.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION, 0))
+        key_bytes = key.encode()
+        lengths = RECORD_HEADER.pack(0, len(key_bytes), len(value))[4:]
+        crc = zlib.crc32(value, zlib.crc32(key_bytes, zlib.crc32(lengths)))
+        self._file.write(struct.pack("<I", crc) + lengths)
+        self._file.write(key_bytes)
+        self._file.write(value)
+        pointer = ValuePointer(self.file_id, self.offset, RECORD_HEADER.size + len(key_bytes) + len(value))
+        self.offset += pointer.size
+        return pointer
+
+    def close(self) -> Optional[str]:
+        # Returns the path of the finished file, or None if nothing was written.
+        if self._file is None:
+            return None
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        os.replace(self.file_path + ".tmp", self.file_path)
+        return self.file_path
+
+    def discard(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self.file_path + ".tmp")
+
+class ValueLog:
+    # A finished value log file, mapped for reading.
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.file_id = value_log_id(file_path)
+        with open(file_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self._mmap)
+        magic, version, _ = FILE_HEADER.unpack_from(self._mmap, 0) if self.size >= FILE_HEADER.size else (b"", 0, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{file_path} is not a version {FORMAT_VERSION} value log file")
+
+    @property
+    def data_bytes(self) -> int:
+        return self.size - FILE_HEADER.size
+
+    def read(self, pointer: ValuePointer) -> memoryview:
+        # A view of the mapped value, checked against its CRC on every read.
+        view = memoryview(self._mmap)
+        if not FILE_HEADER.size <= pointer.offset <= self.size - RECORD_HEADER.size:
+            raise ValueError(f"No value at offset {pointer.offset} in {self.file_path}")
+        crc, key_length, value_length = RECORD_HEADER.unpack_from(view, pointer.offset)
+        key_start = pointer.offset + RECORD_HEADER.size
+        end = key_start + key_length + value_length
+        if RECORD_HEADER.size + key_length + value_length != pointer.size or end > self.size:
+            raise ValueError(f"Value pointer does not match the record at offset {pointer.offset} in {self.file_path}")
+        checked = zlib.crc32(view[key_start:end], zlib.crc32(view[pointer.offset + 4:key_start]))
+        if checked != crc:
+            raise ValueError(f"CRC mismatch for value at offset {pointer.offset} in {self.file_path}")
+        return view[end - value_length:end]
+
+    def remove(self) -> None:
+        # The mapping stays valid for readers still holding this file (from a
+        # version that garbage collection has since replaced).
+        os.remove(self.file_path)
+
+    def close(self) -> None:
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A caller still holds a value view; the mapping is released when
+            # the last one goes away.
+            pass
+
+def separate_values(versions: Iterable[Tuple[str, int, Optional[bytes]]], writer: ValueLogWriter,
+                    threshold: int, relocate: Set[int] = frozenset(),
+                    read: Optional[Callable[[ValuePointer], memoryview]] = None) -> Iterator[Tuple[str, int, object]]:
+    # Moves values longer than threshold into writer, yielding pointers in
+    # their place. Pointers into the files in relocate are read back through
+    # read() and written to writer as well, which is how garbage collection
+    # empties a file.
+    for key, sequence, value in versions:
+        yield key, sequence, _separate(key, value, writer, threshold, relocate, read)
+
+def _separate(key: str, value: object, writer: ValueLogWriter, threshold: int, relocate: Set[int],
+              read: Optional[Callable[[ValuePointer], memoryview]]) -> object:
+    if isinstance(value, ValuePointer):
+        if value.file_id in relocate:
+            return writer.append(key, bytes(read(value)))
+    elif isinstance(value, ExpiringValue):
+        # A value with a TTL: separate what it wraps and keep the expiry.
+        return value._replace(value=_separate(key, value.value, writer, threshold, relocate, read))
+    elif value is not None and threshold and len(value) > threshold:
+        return writer.append(key, bytes(value))
+    return value
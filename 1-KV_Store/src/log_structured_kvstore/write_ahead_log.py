@@ -1,14 +1,298 @@
-from typing import List, Optional, Tuple
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
+from .expiry import EXPIRY, ExpiringValue
+from .metrics import Metrics
+
+# crc32, operation, sequence number, key length, value length. A batch
+# record carries the sequence number of its first operation.
+_HEADER = struct.Struct("<IBQII")
+# operation, key length, value length; one per operation inside a batch
+_BATCH_ENTRY = struct.Struct("<BII")
+_NO_VALUE = 0xFFFFFFFF
+_OPERATIONS = {"put": 1, "delete": 2}
+_BATCH = 3
+# A put with a TTL: the value is preceded by its expiry time.
+_PUT_EXPIRING = 4
+_OPERATION_NAMES = {code: name for name, code in _OPERATIONS.items()}
+
+SYNC_POLICIES = ("always", "batch", "never")
+WAL_PREFIX = "wal-"
+WAL_SUFFIX = ".log"
 
 class WriteAheadLog:
-    def __init__(self, directory: str):
-        # TODO: Initialize WAL in the given directory
-        pass
+    def __init__(self, directory: str, sync_policy: str = "always",
+                 sync_interval_ms: int = 5, sync_bytes: int = 1024 * 1024,
+                 file_size: int = 1024 * 1024, metrics: Optional[Metrics] = None):
+        if sync_policy not in SYNC_POLICIES:
+            raise ValueError(f"Unknown WAL sync policy {sync_policy!r}; expected one of {SYNC_POLICIES}")
+        self.directory = directory
+        self.sync_policy = sync_policy
+        self.sync_interval = sync_interval_ms / 1000
+        self.sync_bytes = sync_bytes
+        self.file_size = file_size
+        self.metrics = metrics
+        os.makedirs(directory, exist_ok=True)
+        # The log is a sequence of numbered files. A new process always starts
+        # a fresh file rather than appending behind a possibly torn tail.
+        existing = self.file_ids()
+        self.file_id = existing[-1] + 1 if existing else 0
+        self.file_path = self._file_path(self.file_id)
+        self._file: BinaryIO = open(self.file_path, "ab")
+        self._file_bytes = 0
+
+        # Records are numbered in append order. Everything up to
+        # _synced_lsn has been written and (policy permitting) fsynced.
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._pending: List[bytes] = []
+        self._pending_bytes = 0
+        self._appended_lsn = 0
+        self._synced_lsn = 0
+        self._syncing = False
+        self._failure: Optional[BaseException] = None
+        self._closed = False
+        self.record_count = 0
+        self.bytes_written = 0
+        self.sync_count = 0
+
+        self._flusher = None
+        if sync_policy == "batch":
+            self._flusher = threading.Thread(target=self._flush_periodically, name="wal-flusher", daemon=True)
+            self._flusher.start()
+
+    def append(self, operation: str, key: str, value: Optional[bytes] = None, wait: bool = True,
+               sequence: int = 0) -> int:
+        # Returns the record's log sequence number. With wait=False the caller
+        # can collect its durability acknowledgement later via wait_for_sync().
+        # sequence is the store's version number for the write, kept so that
+        # replay restores it.
+        return self._append(encode_record(operation, key, value, sequence), wait)
+
+    def append_batch(self, operations: Iterable[Tuple[str, str, Optional[bytes]]], wait: bool = True,
+                     sequence: int = 0) -> int:
+        # The whole batch is one record under one CRC, so recovery replays
+        # either all of it or, for a torn tail, none of it. Its operations
+        # are numbered consecutively from sequence.
+        return self._append(encode_batch(operations, sequence), wait)
+
+    def _append(self, record: bytes, wait: bool) -> int:
+        with self._lock:
+            if self._closed:
+                raise ValueError("Write-ahead log is closed")
+            self._pending.append(record)
+            self._pending_bytes += len(record)
+            self._appended_lsn += 1
+            self.record_count += 1
+            self.bytes_written += len(record)
+            lsn = self._appended_lsn
+            if self.sync_policy == "batch" and self._pending_bytes >= self.sync_bytes:
+                self._cond.notify_all()
+        if self.sync_policy == "never":
+            self._sync(lsn, fsync=False)
+        elif wait:
+            self.wait_for_sync(lsn)
+        return lsn
+
+    def wait_for_sync(self, lsn: int) -> None:
+        if self.sync_policy == "batch":
+            with self._lock:
+                while self._synced_lsn < lsn:
+                    self._raise_on_failure()
+                    self._cond.wait()
+        else:
+            self._sync(lsn, fsync=self.sync_policy == "always")
+
+    def sync(self) -> None:
+        # Force everything appended so far to disk, regardless of policy.
+        with self._lock:
+            lsn = self._appended_lsn
+        self._sync(lsn, fsync=True)
+
+    def recover(self) -> Iterator[Tuple[str, str, Optional[bytes]]]:
+        for _, operation, key, value in self.replay():
+            yield operation, key, value
+
+    def replay(self) -> Iterator[Tuple[int, str, str, Optional[bytes]]]:
+        # Streams (sequence, operation, key, value) oldest first; nothing is
+        # materialized. Only files not yet checkpointed remain, so this is
+        # bounded by unflushed data.
+        self.sync()
+        for file_id in self.file_ids():
+            with open(self._file_path(file_id), "rb") as f:
+                yield from read_records(f)
+
+    def rotate(self) -> int:
+        # Seals the current file and starts a new one. Everything appended
+        # before the call lives in files numbered below the returned id.
+        with self._lock:
+            lsn = self._appended_lsn
+        return self._sync(lsn, fsync=True, rotate=True)
+
+    def checkpoint(self, file_id: int) -> None:
+        # Called once everything logged before rotate() returned file_id is
+        # durable in a segment; those files are no longer needed.
+        for old_id in self.file_ids():
+            if old_id >= file_id:
+                break
+            os.remove(self._file_path(old_id))
+
+    def file_ids(self) -> List[int]:
+        ids = []
+        for name in os.listdir(self.directory):
+            if name.startswith(WAL_PREFIX) and name.endswith(WAL_SUFFIX):
+                ids.append(int(name[len(WAL_PREFIX):-len(WAL_SUFFIX)]))
+        return sorted(ids)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self.sync()
+        with self._lock:
+            self._closed = True
+            self._cond.notify_all()
+        if self._flusher is not None:
+            self._flusher.join()
+        self._file.close()
+        if self._file_bytes == 0:
+            os.remove(self.file_path)
+
+    def _file_path(self, file_id: int) -> str:
+        return os.path.join(self.directory, f"{WAL_PREFIX}{file_id:08d}{WAL_SUFFIX}")
+
+    def _sync(self, lsn: int, fsync: bool, rotate: bool = False) -> int:
+        # Group commit: whichever caller finds no write in progress becomes
+        # the leader and writes every pending record in one go; callers that
+        # arrive meanwhile wait and are covered by the leader's fsync or the
+        # next one. Returns the id of the file that will take the next record.
+        with self._lock:
+            while self._synced_lsn < lsn or rotate:
+                self._raise_on_failure()
+                if self._syncing:
+                    self._cond.wait()
+                    continue
+                self._syncing = True
+                batch, target = self._pending, self._appended_lsn
+                self._pending, self._pending_bytes = [], 0
+                self._lock.release()
+                started = time.perf_counter_ns()
+                try:
+                    data = b"".join(batch)
+                    self._file.write(data)
+                    self._file.flush()
+                    self._file_bytes += len(data)
+                    if fsync:
+                        os.fsync(self._file.fileno())
+                    if rotate or self._file_bytes >= self.file_size:
+                        self._open_next_file()
+                except BaseException as e:
+                    self._lock.acquire()
+                    self._failure = e
+                    self._syncing = False
+                    self._cond.notify_all()
+                    raise
+                if self.metrics is not None:
+                    self.metrics.record("wal_sync", started, records=len(batch), bytes=len(data), fsync=fsync)
+                self._lock.acquire()
+                self._syncing = False
+                self._synced_lsn = target
+                rotate = False
+                if fsync:
+                    self.sync_count += 1
+                self._cond.notify_all()
+            return self.file_id
+
+    def _open_next_file(self) -> None:
+        # Only ever called by the current sync leader.
+        self._file.close()
+        self.file_id += 1
+        self.file_path = self._file_path(self.file_id)
+        self._file = open(self.file_path, "ab")
+        self._file_bytes = 0
+
+    def _flush_periodically(self) -> None:
+        while True:
+            with self._lock:
+                deadline = time.monotonic() + self.sync_interval
+                while not self._closed and self._pending_bytes < self.sync_bytes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+                lsn = self._appended_lsn
+            try:
+                self._sync(lsn, fsync=True)
+            except BaseException:
+                # The failure is recorded and re-raised to every waiting caller.
+                return
+
+    def _raise_on_failure(self) -> None:
+        if self._failure is not None:
+            raise OSError("Write-ahead log write failed; earlier records may not be durable") from self._failure
+
+def _encode_value(operation: str, value: Union[bytes, ExpiringValue, None]) -> Tuple[int, bytes, int]:
+    # (operation code, value bytes, value length field)
+    if isinstance(value, ExpiringValue):
+        data = EXPIRY.pack(value.expires_at) + value.value
+        return _PUT_EXPIRING, data, len(data)
+    if value is None:
+        return _OPERATIONS[operation], b"", _NO_VALUE
+    return _OPERATIONS[operation], value, len(value)
+
+def _decode_value(op: int, value: Optional[bytes]) -> Tuple[str, Union[bytes, ExpiringValue, None]]:
+    if op == _PUT_EXPIRING:
+        return "put", ExpiringValue(value[EXPIRY.size:], EXPIRY.unpack_from(value)[0])
+    return _OPERATION_NAMES[op], value
+
+def encode_record(operation: str, key: str, value: Union[bytes, ExpiringValue, None], sequence: int = 0) -> bytes:
+    key_bytes = key.encode()
+    op, value_bytes, value_length = _encode_value(operation, value)
+    body = _HEADER.pack(0, op, sequence, len(key_bytes), value_length)[4:] + key_bytes + value_bytes
+    return struct.pack("<I", zlib.crc32(body)) + body
+
+def encode_batch(operations: Iterable[Tuple[str, str, Optional[bytes]]], sequence: int = 0) -> bytes:
+    parts = []
+    for operation, key, value in operations:
+        key_bytes = key.encode()
+        op, value_bytes, value_length = _encode_value(operation, value)
+        parts.append(_BATCH_ENTRY.pack(op, len(key_bytes), value_length))
+        parts.append(key_bytes)
+        parts.append(value_bytes)
+    payload = b"".join(parts)
+    body = _HEADER.pack(0, _BATCH, sequence, 0, len(payload))[4:] + payload
+    return struct.pack("<I", zlib.crc32(body)) + body
 
-    def append(self, operation: str, key: str, value: Optional[bytes] = None) -> None:
-        # TODO: Append operation to WAL
-        pass
+def _decode_batch(payload: bytes, sequence: int) -> Iterator[Tuple[int, str, str, Optional[bytes]]]:
+    position = 0
+    while position < len(payload):
+        op, key_length, value_length = _BATCH_ENTRY.unpack_from(payload, position)
+        key_start = position + _BATCH_ENTRY.size
+        value_start = key_start + key_length
+        position = value_start + (0 if value_length == _NO_VALUE else value_length)
+        operation, value = _decode_value(op, None if value_length == _NO_VALUE else payload[value_start:position])
+        yield sequence, operation, payload[key_start:value_start].decode(), value
+        sequence += 1
 
-    def recover(self) -> List[Tuple[str, str, Optional[bytes]]]:
-        # TODO: Read WAL and return list of operations for recovery
-        pass
\ No newline at end of file
+def read_records(f: BinaryIO) -> Iterator[Tuple[int, str, str, Optional[bytes]]]:
+    while True:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        crc, op, sequence, key_length, value_length = _HEADER.unpack(header)
+        value_size = 0 if value_length == _NO_VALUE else value_length
+        payload = f.read(key_length + value_size)
+        # A short or corrupt record can only be a torn tail from a crash
+        # mid-append; nothing after it in this file was ever acknowledged.
+        if len(payload) < key_length + value_size or zlib.crc32(payload, zlib.crc32(header[4:])) != crc:
+            return
+        if op == _BATCH:
+            yield from _decode_batch(payload[key_length:], sequence)
+            continue
+        key = payload[:key_length].decode()
+        operation, value = _decode_value(op, None if value_length == _NO_VALUE else payload[key_length:])
+        yield sequence, operation, key, value
@@ -2,7 +2,7 @@ import os
 import matplotlib.pyplot as plt
 from matplotlib.patches import Rectangle
 from typing import List, Tuple, Dict
-import json
+from log_structured_kvstore.segment import Segment
 
 class Visualizer:
     def __init__(self, store_directory: str):
@@ -14,12 +14,8 @@ class Visualizer:
         return sorted([f for f in os.listdir(self.store_directory) if f.endswith('.seg')])
 
     def _read_segment(self, segment_file: str) -> List[Tuple[str, int]]:
-        entries = []
-        with open(os.path.join(self.store_directory, segment_file), 'r') as f:
-            for line in f:
-                entry = json.loads(line)
-                entries.append((entry['key'], len(line)))
-        return entries
+        segment = Segment(os.path.join(self.store_directory, segment_file))
+        return [(key, size) for _, size, key, _ in segment.iterate_records()]
 
     def visualize(self):
         fig, ax = plt.subplots(figsize=(12, 6))
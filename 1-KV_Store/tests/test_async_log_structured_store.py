@@ -0,0 +1,121 @@
+import asyncio
+import pytest
+import shutil
+import threading
+from src.log_structured_kvstore.async_log_structured_store import AsyncLogStructuredStore
+from src.log_structured_kvstore.config import Config
+
+@pytest.fixture
+def temp_dir(tmpdir):
+    yield tmpdir
+    shutil.rmtree(tmpdir)
+
+@pytest.fixture
+def config():
+    return Config.from_dict({
+        "segment_size": 4096,
+        "max_memtable_size": 2048,
+        "index_interval": 256,
+        "background_compaction": False
+    })
+
+class TestAsyncLogStructuredStore:
+    def test_put_get_delete(self, temp_dir, config):
+        async def run():
+            store = await AsyncLogStructuredStore.open(str(temp_dir), config)
+            await store.put("key1", b"value1")
+            await store.put("key2", b"value2")
+            await store.delete("key2")
+            assert await store.get("key1") == b"value1"
+            assert await store.get("key2") is None
+            assert await store.get("missing") is None
+            await store.close()
+        asyncio.run(run())
+
+    def test_memtable_hits_are_timed(self, temp_dir, config):
+        async def run():
+            store = await AsyncLogStructuredStore.open(str(temp_dir), config)
+            await store.put("key1", b"value1")
+            assert await store.get("key1") == b"value1"
+            assert await store.get("missing") is None
+            assert store.metrics.histograms["get"].count == 2
+            await store.close()
+        asyncio.run(run())
+
+    def test_batch_expiry_is_fixed_on_submission(self, temp_dir, config):
+        async def run():
+            store = await AsyncLogStructuredStore.open(str(temp_dir), config)
+            clock = [1_000_000]
+            store.store.clock = lambda: clock[0]
+            # Hold the writer thread so the batch is applied only after the
+            # clock has moved on.
+            release = threading.Event()
+            store._writes.submit(release.wait)
+            write = asyncio.ensure_future(store.write_batch([("put", "key1", b"value1", 1)]))
+            await asyncio.sleep(0)
+            clock[0] += 500
+            release.set()
+            await write
+            clock[0] += 500
+            assert await store.get("key1") is None
+            await store.close()
+        asyncio.run(run())
+
+    def test_concurrent_writers_share_wal_records(self, temp_dir, config):
+        async def run():
+            store = await AsyncLogStructuredStore.open(str(temp_dir), config)
+            await asyncio.gather(*(store.put(f"key{i:04d}", f"value{i}".encode()) for i in range(1000)))
+            assert store.store.wal.record_count < 1000
+            values = await asyncio.gather(*(store.get(f"key{i:04d}") for i in range(1000)))
+            assert values == [f"value{i}".encode() for i in range(1000)]
+            await store.close()
+        asyncio.run(run())
+
+    def test_memtables_flush_in_background(self, temp_dir, config):
+        async def run():
+            store = await AsyncLogStructuredStore.open(str(temp_dir), config)
+            for i in range(300):
+                await store.put(f"key{i:03d}", b"x" * 40)
+            await store.close()
+            assert store.store.pending_flushes == 0
+            assert len(store.store.segments) > 1
+            assert store.last_flush_error is None
+        asyncio.run(run())
+
+    def test_flush_scan_and_multi_get(self, temp_dir, config):
+        async def run():
+            store = await AsyncLogStructuredStore.open(str(temp_dir), config)
+            await store.write_batch([("put", f"key{i:03d}", b"x" * 50) for i in range(600)])
+            await store.flush()
+            assert store.store.pending_flushes == 0
+            assert [key async for key, _ in store.scan("key100", "key103")] == ["key100", "key101", "key102"]
+            assert len([key async for key, _ in store.scan()]) == 600
+            assert [key async for key, _ in store.prefix("key05")] == [f"key05{i}" for i in range(10)]
+            assert await store.multi_get(["key007", "nope"]) == {"key007": b"x" * 50, "nope": None}
+            await store.close()
+        asyncio.run(run())
+
+    def test_invalid_batch_fails_alone(self, temp_dir, config):
+        async def run():
+            store = await AsyncLogStructuredStore.open(str(temp_dir), config)
+            good = asyncio.ensure_future(store.put("key", b"value"))
+            with pytest.raises(ValueError):
+                await store.write_batch([("merge", "key", b"x")])
+            await good
+            assert await store.get("key") == b"value"
+            await store.close()
+        asyncio.run(run())
+
+    def test_reopen_recovers_writes(self, temp_dir, config):
+        async def write():
+            store = await AsyncLogStructuredStore.open(str(temp_dir), config)
+            await asyncio.gather(*(store.put(f"key{i:03d}", b"v") for i in range(300)))
+            await store.close()
+
+        async def read():
+            store = await AsyncLogStructuredStore.open(str(temp_dir), config)
+            values = await store.multi_get(f"key{i:03d}" for i in range(300))
+            await store.close()
+            return values
+        asyncio.run(write())
+        assert set(asyncio.run(read()).values()) == {b"v"}
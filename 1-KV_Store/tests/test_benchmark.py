@@ -0,0 +1,94 @@
+import json
+import pytest
+import random
+import shutil
+from collections import Counter
+from src.log_structured_kvstore.benchmark import (WORKLOADS, BenchmarkOptions, ZipfianGenerator, compare,
+                                                  format_key, main, run_benchmark, run_workloads)
+from src.log_structured_kvstore.config import Config
+from src.log_structured_kvstore.log_structured_store import LogStructuredStore
+
+@pytest.fixture
+def temp_dir(tmpdir):
+    yield tmpdir
+    shutil.rmtree(tmpdir)
+
+@pytest.fixture
+def config():
+    return Config.from_dict({
+        "segment_size": 4096,
+        "max_memtable_size": 4096,
+        "index_interval": 256,
+        "wal_sync_policy": "never",
+        "background_compaction": False
+    })
+
+OPTIONS = BenchmarkOptions(record_count=300, operation_count=400, value_size=50, max_scan_length=10)
+
+class TestGenerators:
+    def test_zipfian_is_skewed_and_in_range(self):
+        rng = random.Random(1)
+        for scrambled in (False, True):
+            generator = ZipfianGenerator(1000, scrambled=scrambled)
+            counts = Counter(generator.next(rng) for _ in range(20000))
+            assert all(0 <= item < 1000 for item in counts)
+            # The ten hottest items draw far more than their 1% share.
+            assert sum(count for _, count in counts.most_common(10)) > 0.2 * 20000
+        unscrambled = Counter(ZipfianGenerator(1000, scrambled=False).next(rng) for _ in range(5000))
+        assert unscrambled.most_common(1)[0][0] == 0
+
+    def test_keys(self):
+        assert format_key(42, 12, ordered=True) == "user00000042"
+        assert sorted(format_key(i, 12, ordered=True) for i in range(20)) == \
+            [format_key(i, 12, ordered=True) for i in range(20)]
+        scattered = {format_key(i, 24) for i in range(1000)}
+        assert len(scattered) == 1000 and all(len(key) == 24 for key in scattered)
+
+class TestBenchmark:
+    def test_every_workload_runs(self, temp_dir, config):
+        results = run_workloads(list(WORKLOADS), str(temp_dir), config, OPTIONS._replace(threads=2))
+        assert [result["workload"] for result in results] == list(WORKLOADS)
+        for result in results:
+            assert result["run"]["operations"] == 400
+            assert sum(latency["count"] for latency in result["latency"].values()) >= 400
+            for latency in result["latency"].values():
+                assert latency["p50_us"] <= latency["p99_us"] <= latency["p999_us"] <= latency["max_us"]
+            json.dumps(result)
+
+    def test_reads_find_loaded_keys_and_amplification(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        result = run_benchmark(store, WORKLOADS["ycsb-a"], OPTIONS)
+        assert result["load"]["operations"] == 300
+        assert store.get(format_key(0, OPTIONS.key_size)) is not None
+        amplification = result["amplification"]
+        assert amplification["live_bytes"] == 300 * (OPTIONS.key_size + OPTIONS.value_size)
+        # Every byte goes through the WAL and at least some reach segments.
+        assert amplification["write"] > 1
+        assert amplification["space"] > 0
+        store.close()
+
+    def test_inserts_extend_the_key_space(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        run_benchmark(store, WORKLOADS["fillseq"], OPTIONS)
+        keys = [key for key, _ in store.scan()]
+        assert keys == [format_key(i, OPTIONS.key_size, ordered=True) for i in range(400)]
+        store.close()
+
+    def test_compare_with_baseline(self):
+        baseline = [{"workload": "ycsb-c", "run": {"throughput": 100.0}, "latency": {"read": {"p99_us": 10.0}}}]
+        results = [{"workload": "ycsb-c", "run": {"throughput": 150.0}, "latency": {"read": {"p99_us": 5.0}}},
+                   {"workload": "ycsb-a", "run": {"throughput": 1.0}, "latency": {}}]
+        assert compare(results, baseline) == {"ycsb-c": {"throughput": 1.5, "p99": {"read": 0.5}}}
+
+    def test_command_line(self, temp_dir):
+        output = str(temp_dir.join("results.json"))
+        arguments = ["--workloads", "ycsb-b", "--records", "100", "--operations", "100",
+                     "--wal-sync-policy", "never", "--directory", str(temp_dir.join("stores"))]
+        main(arguments + ["--output", output])
+        main(["--workloads", "ycsb-b", "--records", "100", "--operations", "100", "--wal-sync-policy", "never",
+              "--output", str(temp_dir.join("second.json")), "--baseline", output])
+        with open(str(temp_dir.join("second.json"))) as f:
+            report = json.load(f)
+        assert set(report["comparison"]) == {"ycsb-b"}
+        with pytest.raises(SystemExit):
+            main(arguments)
@@ -0,0 +1,47 @@
+from src.log_structured_kvstore.block_cache import BLOCK_OVERHEAD, BlockCache
+
+class TestBlockCache:
+    def test_hit_and_miss(self):
+        cache = BlockCache(10000)
+        assert cache.get(("seg", 0)) is None
+        cache.put(("seg", 0), "block", 100)
+        assert cache.get(("seg", 0)) == "block"
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_stays_within_budget(self):
+        cache = BlockCache(10 * (100 + BLOCK_OVERHEAD))
+        for i in range(50):
+            cache.put(("seg", i), i, 100)
+        assert cache.size <= cache.capacity
+        assert len(cache) == 10
+        assert cache.evictions == 40
+        # Least recently inserted blocks go first.
+        assert cache.get(("seg", 49)) == 49
+        assert cache.get(("seg", 0)) is None
+
+    def test_scan_does_not_evict_hot_blocks(self):
+        cache = BlockCache(10 * (100 + BLOCK_OVERHEAD))
+        for i in range(5):
+            cache.put(("hot", i), i, 100)
+            cache.get(("hot", i))
+        for i in range(100):
+            if cache.get(("scan", i)) is None:
+                cache.put(("scan", i), i, 100)
+        for i in range(5):
+            assert cache.get(("hot", i)) == i
+
+    def test_oversized_blocks_are_not_cached(self):
+        cache = BlockCache(100)
+        cache.put(("seg", 0), "block", 1000)
+        assert len(cache) == 0
+
+    def test_discard_drops_one_owner(self):
+        cache = BlockCache(10000)
+        for i in range(3):
+            cache.put(("a", i), i, 10)
+            cache.put(("b", i), i, 10)
+        cache.get(("a", 0))  # promoted to protected
+        cache.discard("a")
+        assert len(cache) == 3
+        assert cache.size == 3 * (10 + BLOCK_OVERHEAD)
+        assert cache.get(("b", 1)) == 1
@@ -1,3 +1,4 @@
+import pytest
 from src.log_structured_kvstore.bloom_filter import BloomFilter
 
 class TestBloomFilter:
@@ -18,4 +19,25 @@ class TestBloomFilter:
                 false_positives += 1
 
         # False positive rate should be relatively low
-        assert false_positives / 100 < 0.1
\ No newline at end of file
+        assert false_positives / 100 < 0.1
+
+    def test_sized_for_capacity(self):
+        bf = BloomFilter.for_capacity(1000, 0.01)
+        assert bf.num_hashes == 7
+        for i in range(1000):
+            bf.add(f"key{i}")
+        assert all(bf.may_contain(f"key{i}") for i in range(1000))
+        false_positives = sum(bf.may_contain(f"other{i}") for i in range(10000))
+        assert false_positives / 10000 < 0.02
+
+    def test_serialization_round_trip(self):
+        bf = BloomFilter.for_capacity(50, 0.05)
+        for i in range(50):
+            bf.add(f"key{i}")
+        restored = BloomFilter.from_bytes(bf.to_bytes())
+        assert (restored.size, restored.num_hashes, restored.bits) == (bf.size, bf.num_hashes, bf.bits)
+        assert all(restored.may_contain(f"key{i}") for i in range(50))
+
+    def test_rejects_truncated_bytes(self):
+        with pytest.raises(ValueError):
+            BloomFilter.from_bytes(BloomFilter(1000).to_bytes()[:-1])
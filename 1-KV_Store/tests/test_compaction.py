@@ -0,0 +1,127 @@
+import pytest
+import shutil
+from src.log_structured_kvstore.log_structured_store import LogStructuredStore
+from src.log_structured_kvstore.compaction import LeveledStrategy, SizeTieredStrategy, create_strategy, visible_versions
+from src.log_structured_kvstore.config import Config
+from src.log_structured_kvstore.expiry import ExpiringValue
+from src.log_structured_kvstore.segment import Segment
+
+@pytest.fixture
+def temp_dir(tmpdir):
+    yield tmpdir
+    shutil.rmtree(tmpdir)
+
+def make_segment(temp_dir, name, size, level=0, first=0):
+    segment = Segment(str(temp_dir.join(name)))
+    i = first
+    while segment.offset < size:
+        segment.append(f"key{i:05d}", b"x" * 50)
+        i += 1
+    segment.level = level
+    return segment
+
+def fill(store, count):
+    for i in range(count):
+        store.put(f"key{i % 400:03d}", f"value{i}".encode())
+
+class TestSizeTieredStrategy:
+    def test_merges_adjacent_segments_of_similar_size(self, temp_dir):
+        strategy = SizeTieredStrategy(Config.from_dict({"compaction_threshold": 3}))
+        big = make_segment(temp_dir, "big.seg", 20000)
+        small = [make_segment(temp_dir, f"small{i}.seg", 1000) for i in range(3)]
+        task = strategy.pick([big] + small)
+        assert task.inputs == small
+        assert not task.drop_tombstones
+
+    def test_waits_for_enough_similar_segments(self, temp_dir):
+        strategy = SizeTieredStrategy(Config.from_dict({"compaction_threshold": 3}))
+        segments = [make_segment(temp_dir, "a.seg", 20000), make_segment(temp_dir, "b.seg", 1000),
+                    make_segment(temp_dir, "c.seg", 1000)]
+        assert strategy.pick(segments) is None
+
+class TestLeveledStrategy:
+    def test_level_zero_goes_to_level_one_with_overlaps(self, temp_dir):
+        strategy = LeveledStrategy(Config.from_dict({"compaction_threshold": 2}))
+        inside = make_segment(temp_dir, "inside.seg", 1000, level=1, first=0)
+        outside = make_segment(temp_dir, "outside.seg", 1000, level=1, first=90000)
+        fresh = [make_segment(temp_dir, f"l0-{i}.seg", 1000) for i in range(2)]
+        task = strategy.pick([inside, outside] + fresh)
+        assert task.inputs == [inside] + fresh
+        assert task.output_level == 1
+
+    def test_ingested_segments_go_as_deep_as_they_can(self, temp_dir):
+        strategy = LeveledStrategy(Config.from_dict({"segment_size": 1000, "compaction_threshold": 2}))
+        deep = make_segment(temp_dir, "deep.seg", 1000, level=2, first=0)
+        shallow = make_segment(temp_dir, "shallow.seg", 1000, level=1, first=90000)
+        segments = [deep, shallow]
+        assert strategy.ingest_level(segments, make_segment(temp_dir, "apart.seg", 1000, first=50000)) == 2
+        assert strategy.ingest_level(segments, make_segment(temp_dir, "under.seg", 1000, first=10)) == 1
+        assert strategy.ingest_level(segments, make_segment(temp_dir, "over.seg", 1000, first=90010)) == 0
+        # A segment too big for the bottom level starts a new one below it.
+        big = make_segment(temp_dir, "big.seg", strategy.level_limit(2) + 1, first=50000)
+        assert strategy.ingest_level(segments, big) == 3
+        assert SizeTieredStrategy(Config()).ingest_level(segments, big) == 0
+
+    def test_store_keeps_deeper_levels_non_overlapping(self, temp_dir):
+        config = Config.from_dict({"segment_size": 2048, "compaction_threshold": 2,
+                                   "level_size_multiplier": 2, "compaction_strategy": "leveled"})
+        store = LogStructuredStore(str(temp_dir), config)
+        fill(store, 3000)
+        store.wait_for_compaction()
+        for level in {segment.level for segment in store.segments} - {0}:
+            ranges = sorted((s.min_key, s.max_key) for s in store.segments if s.level == level)
+            assert all(prev[1] < cur[0] for prev, cur in zip(ranges, ranges[1:]))
+        assert max(segment.level for segment in store.segments) >= 2
+        for i in range(2600, 3000):
+            assert store.get(f"key{i % 400:03d}") == f"value{i}".encode()
+        store.close()
+
+        reopened = LogStructuredStore(str(temp_dir), config)
+        assert [s.level for s in reopened.segments] == [s.level for s in store.segments]
+        assert reopened.get("key123") == b"value2923"
+        reopened.close()
+
+    def test_full_compaction_splits_output(self, temp_dir):
+        config = Config.from_dict({"segment_size": 2048, "compaction_strategy": "leveled",
+                                   "background_compaction": False})
+        store = LogStructuredStore(str(temp_dir), config)
+        fill(store, 1000)
+        store.compact()
+        assert len(store.segments) > 1
+        assert all(segment.level == 1 for segment in store.segments)
+        assert store.get("key399") == b"value799"
+
+class TestAmplificationStatistics:
+    @pytest.mark.parametrize("strategy", ["size_tiered", "leveled"])
+    def test_reported_per_strategy(self, temp_dir, strategy):
+        config = Config.from_dict({"segment_size": 2048, "compaction_threshold": 2, "compaction_strategy": strategy})
+        store = LogStructuredStore(str(temp_dir), config)
+        fill(store, 2000)
+        store.wait_for_compaction()
+        stats = store.get_statistics()
+        assert stats["compaction_strategy"] == strategy
+        assert stats["write_amplification"] > 1.0
+        assert stats["read_amplification"] >= 1.0
+        assert stats["space_amplification"] >= 1.0
+        store.close()
+
+    def test_unknown_strategy(self):
+        with pytest.raises(ValueError):
+            create_strategy(Config.from_dict({"compaction_strategy": "random"}))
+
+class TestVersionGarbageCollection:
+    def test_keeps_newest_and_snapshot_versions(self):
+        versions = [("a", 1, b"1"), ("a", 3, b"3"), ("a", 5, b"5"), ("a", 7, None), ("b", 2, b"2")]
+        assert list(visible_versions(iter(versions), [])) == [("a", 7, None), ("b", 2, b"2")]
+        assert list(visible_versions(iter(versions), [4, 6])) == [("a", 3, b"3"), ("a", 5, b"5"),
+                                                                  ("a", 7, None), ("b", 2, b"2")]
+        assert list(visible_versions(iter(versions), [], drop_tombstones=True)) == [("b", 2, b"2")]
+        assert list(visible_versions(iter(versions), [0, 1])) == [("a", 1, b"1"), ("a", 7, None), ("b", 2, b"2")]
+
+    def test_expired_values_become_tombstones(self):
+        versions = [("a", 1, b"1"), ("a", 2, ExpiringValue(b"2", 100)), ("b", 3, ExpiringValue(b"3", 200))]
+        assert list(visible_versions(iter(versions), [], now=150)) == [("a", 2, None),
+                                                                        ("b", 3, ExpiringValue(b"3", 200))]
+        assert list(visible_versions(iter(versions), [], drop_tombstones=True, now=200)) == []
+        assert list(visible_versions(iter(versions), [])) == [("a", 2, ExpiringValue(b"2", 100)),
+                                                              ("b", 3, ExpiringValue(b"3", 200))]
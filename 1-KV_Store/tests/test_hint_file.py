@@ -0,0 +1,52 @@
+import pytest
+import shutil
+from src.log_structured_kvstore.segment import Segment
+from src.log_structured_kvstore.hint_file import hint_path, read_hint_file
+
+@pytest.fixture
+def temp_dir(tmpdir):
+    yield tmpdir
+    shutil.rmtree(tmpdir)
+
+def write_segment(path, count=100):
+    segment = Segment(path, index_interval=128)
+    for i in range(count):
+        segment.append(f"key{i:03d}", None if i % 10 == 0 else f"value{i}".encode())
+    segment.close()
+    return segment
+
+class TestHintFile:
+    def test_hints_describe_every_record(self, temp_dir):
+        path = str(temp_dir.join("segment.seg"))
+        segment = write_segment(path)
+        hints = read_hint_file(path, segment.offset)
+        assert len(hints) == 100
+        assert hints[0] == ("key000", segment.index_offsets[0], hints[1][1] - hints[0][1], True)
+        assert [key for key, _, _, _ in hints] == [key for key, _ in segment.iterate_entries()]
+
+    def test_open_uses_hints(self, temp_dir):
+        path = str(temp_dir.join("segment.seg"))
+        segment = write_segment(path)
+        reopened = Segment(path, index_interval=128)
+        assert reopened.loaded_from_hints
+        assert reopened.index_keys == segment.index_keys
+        assert reopened.tombstone_count == 10
+        assert reopened.lookup("key020") == (True, None)
+        assert reopened.read("key042") == b"value42"
+
+    def test_damaged_hints_fall_back_to_scan(self, temp_dir):
+        path = str(temp_dir.join("segment.seg"))
+        segment = write_segment(path)
+        with open(hint_path(path), "r+b") as f:
+            f.seek(20)
+            f.write(b"\xff")
+        reopened = Segment(path, index_interval=128)
+        assert not reopened.loaded_from_hints
+        assert reopened.index_keys == segment.index_keys
+
+    def test_hints_for_other_data_are_ignored(self, temp_dir):
+        path = str(temp_dir.join("segment.seg"))
+        write_segment(path)
+        Segment(path).append("zzz", b"appended later")
+        assert read_hint_file(path, 1 << 20) is None
+        assert not Segment(path).loaded_from_hints
@@ -0,0 +1,37 @@
+import bisect
+import random
+from src.log_structured_kvstore.key_array import FENCE_INTERVAL, KeyArray
+
+class TestKeyArray:
+    def test_behaves_like_a_list(self):
+        keys = ["", "a", "ab", "café", "\U0001f600", "z" * 300]
+        array = KeyArray()
+        for key in keys:
+            array.append(key)
+        assert len(array) == len(keys)
+        assert list(array) == keys
+        assert [array[i] for i in range(len(keys))] == keys
+        assert array[-1] == keys[-1]
+        other = KeyArray()
+        for key in keys:
+            other.append(key)
+        assert array == other
+
+    def test_bisect_matches_list(self):
+        rng = random.Random(5)
+        keys = sorted(rng.choice(["key", "kéy", "kez"]) + str(rng.randrange(10 ** 6))
+                      for _ in range(FENCE_INTERVAL * 20 + 3))
+        array = KeyArray()
+        for key in keys:
+            array.append(key)
+        probes = keys + [key + "\x00" for key in keys[::7]] + [key[:-1] for key in keys[::5]] + ["", "zzz", "k"]
+        for probe in probes:
+            assert array.bisect_left(probe) == bisect.bisect_left(keys, probe)
+            assert array.bisect_right(probe) == bisect.bisect_right(keys, probe)
+
+    def test_packed_size(self):
+        array = KeyArray()
+        for i in range(1000):
+            array.append(f"key{i:05d}")
+        # Eight bytes per key and one fence per group on top of the keys.
+        assert array.nbytes == 8000 + 8000 + 8 * (1000 // FENCE_INTERVAL + 1)
@@ -3,6 +3,7 @@ import shutil
 import os
 from src.log_structured_kvstore.log_structured_store import LogStructuredStore
 from src.log_structured_kvstore.config import Config
+from src.log_structured_kvstore.cli import CLI
 
 @pytest.fixture
 def temp_dir(tmpdir):
@@ -14,7 +15,10 @@ def config():
     return Config.from_dict({
         "segment_size": 1024,
         "compaction_threshold": 2,
-        "bloom_filter_size": 1000
+        "bloom_filter_size": 1000,
+        # These tests count files and reopen directories, so keep compaction
+        # on the caller's thread.
+        "background_compaction": False
     })
 
 class TestLogStructuredStore:
@@ -85,6 +89,47 @@ class TestLogStructuredStore:
         for i in range(100):
             assert store2.get(f"key{i}") == f"value{i}".encode()
 
+class TestScan:
+    @pytest.fixture
+    def store(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(100):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        store.flush()
+        for i in range(0, 100, 10):
+            store.delete(f"key{i:03d}")
+        for i in range(50, 60):
+            store.put(f"key{i:03d}", b"updated")
+        yield store
+        store.close()
+
+    def test_scan_merges_memtable_and_segments(self, store):
+        assert len(store.segments) > 1
+        entries = list(store.scan())
+        assert [key for key, _ in entries] == [f"key{i:03d}" for i in range(100) if i % 10 or i == 50]
+        assert dict(entries)["key051"] == b"updated"
+        assert dict(entries)["key041"] == b"value41"
+
+    def test_scan_range_and_limit(self, store):
+        assert [key for key, _ in store.scan("key015", "key022")] == \
+            ["key015", "key016", "key017", "key018", "key019", "key021"]
+        assert [key for key, _ in store.scan("key095", limit=3)] == ["key095", "key096", "key097"]
+        assert list(store.scan(limit=0)) == []
+
+    def test_prefix(self, store):
+        store.put("other", b"x")
+        assert [key for key, _ in store.prefix("key07")] == [f"key07{i}" for i in range(1, 10)]
+        assert list(store.prefix("missing")) == []
+
+    def test_scan_after_compaction(self, store):
+        expected = list(store.scan())
+        store.compact()
+        assert list(store.scan()) == expected
+
+    def test_cli_lists_keys(self, store):
+        store.put("zzz", b"last")
+        assert CLI(store, store.config).get_all_keys()[-2:] == ["key099", "zzz"]
+
 class TestConfig:
     def test_load_from_file(self, temp_dir):
         config_file = temp_dir.join("config.ini")
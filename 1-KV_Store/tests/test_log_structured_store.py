@@ -0,0 +1,813 @@
+import pytest
+import shutil
+import os
+import threading
+from src.log_structured_kvstore.log_structured_store import LogStructuredStore
+from src.log_structured_kvstore.config import Config
+from src.log_structured_kvstore.segment_writer import build_segment
+
+@pytest.fixture
+def temp_dir(tmpdir):
+    yield tmpdir
+    shutil.rmtree(tmpdir)
+
+@pytest.fixture
+def config():
+    return Config.from_dict({
+        "segment_size": 4096,
+        "max_memtable_size": 2048,
+        "compaction_threshold": 4,
+        "index_interval": 256,
+        "background_compaction": False
+    })
+
+class TestMemTableFlush:
+    def test_flush_when_memtable_full(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(200):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        assert len(store.segments) > 1
+        assert store.memtable.size < config.max_memtable_size
+        for i in range(200):
+            assert store.get(f"key{i:03d}") == f"value{i}".encode()
+
+    def test_segments_are_sorted(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in reversed(range(200)):
+            store.put(f"key{i:03d}", b"v")
+        store.flush()
+        for segment in store.segments:
+            keys = [key for key, _ in segment.iterate_entries()]
+            assert keys == sorted(keys)
+            assert segment.sorted
+
+    def test_tombstone_shadows_older_segment(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        store.put("key", b"value")
+        store.flush()
+        store.delete("key")
+        store.flush()
+        assert len(store.segments) == 2
+        assert store.get("key") is None
+
+    def test_reopen_after_flush(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(200):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        store.close()
+
+        reopened = LogStructuredStore(str(temp_dir), config)
+        assert len(reopened.segments) == len(store.segments)
+        assert all(segment.loaded_from_hints for segment in reopened.segments)
+        for i in range(200):
+            assert reopened.get(f"key{i:03d}") == f"value{i}".encode()
+
+    def test_compact_merges_to_one_segment(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(200):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        for i in range(0, 200, 3):
+            store.delete(f"key{i:03d}")
+        store.compact()
+        assert len(store.segments) == 1
+        assert not any(name.endswith(".tmp") for name in os.listdir(temp_dir))
+        for i in range(200):
+            expected = None if i % 3 == 0 else f"value{i}".encode()
+            assert store.get(f"key{i:03d}") == expected
+
+    def test_failed_flush_does_not_fail_later_writes(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        write_segments = store._write_segments
+        def broken(*args, **kwargs):
+            raise OSError("disk full")
+        store._write_segments = broken
+        # Each of these fills and freezes memtables whose flush fails.
+        for i in range(300):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        assert store.pending_flushes > 0
+        assert "disk full" in store.get_statistics()["last_flush_error"]
+        with pytest.raises(OSError):
+            store.flush()
+        store._write_segments = write_segments
+        store.flush()
+        assert store.pending_flushes == 0 and store.get_statistics()["last_flush_error"] is None
+        assert all(store.get(f"key{i:03d}") == f"value{i}".encode() for i in range(300))
+        store.close()
+
+class TestWalSyncPolicy:
+    @pytest.mark.parametrize("policy", ["always", "batch", "never"])
+    def test_recovery_under_each_policy(self, temp_dir, policy):
+        config = Config.from_dict({"wal_sync_policy": policy, "wal_sync_interval_ms": 1})
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(20):
+            store.put(f"key{i}", f"value{i}".encode())
+        store.close()
+
+        reopened = LogStructuredStore(str(temp_dir), config)
+        for i in range(20):
+            assert reopened.get(f"key{i}") == f"value{i}".encode()
+        reopened.close()
+
+class TestWalCheckpointing:
+    def test_flush_deletes_covered_wal_files(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(500):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        # Only the log for the current memtable survives flushes.
+        replayed = list(store.wal.recover())
+        assert len(replayed) == len(store.memtable)
+        assert len(store.wal.file_ids()) <= 2
+
+class TestBackgroundCompaction:
+    @pytest.fixture
+    def config(self):
+        return Config.from_dict({
+            "segment_size": 2048,
+            "compaction_threshold": 3,
+            "index_interval": 256
+        })
+
+    def test_compacts_once_threshold_is_crossed(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(300):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        store.wait_for_compaction()
+        assert store.compaction_count > 0
+        assert len(store.segments) < config.compaction_threshold + 1
+        for i in range(300):
+            assert store.get(f"key{i:03d}") == f"value{i}".encode()
+        store.close()
+
+    def test_reads_and_writes_flow_during_compaction(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        errors = []
+        stop = threading.Event()
+
+        def reader():
+            while not stop.is_set():
+                for i in range(0, 100, 7):
+                    if store.get(f"key{i:03d}") != f"value{i}".encode():
+                        errors.append(i)
+
+        for i in range(100):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        thread = threading.Thread(target=reader)
+        thread.start()
+        for i in range(100, 1000):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        stop.set()
+        thread.join()
+        store.wait_for_compaction()
+        assert errors == []
+        assert store.last_compaction_error is None
+        store.close()
+
+    def test_manifest_survives_restart(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(300):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        store.close()
+        segment_files = sorted(name for name in os.listdir(temp_dir) if name.endswith(".seg"))
+        assert segment_files == sorted(os.path.basename(s.file_path) for s in store.segments)
+
+        reopened = LogStructuredStore(str(temp_dir), config)
+        for i in range(300):
+            assert reopened.get(f"key{i:03d}") == f"value{i}".encode()
+        reopened.close()
+
+    def test_orphaned_segments_are_discarded(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        store.put("key", b"value")
+        store.flush()
+        store.close()
+        orphan = temp_dir.join("segment-00000099.seg")
+        orphan.write_binary(b"leftover from a crashed compaction")
+        reopened = LogStructuredStore(str(temp_dir), config)
+        assert not orphan.exists()
+        assert reopened.get("key") == b"value"
+        reopened.close()
+
+class TestBloomFilters:
+    def test_missing_keys_skip_segments(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(200):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        store.flush()
+        for i in range(200):
+            assert store.get(f"key{i:03d}x") is None
+        stats = store.get_statistics()
+        assert stats["bloom_filter_bytes"] > 0
+        # Every absent key falls inside some segment's key range; nearly all
+        # of those lookups must be answered by the filter alone.
+        assert stats["bloom_filter_skips"] >= 190
+        assert stats["bloom_filter_false_positives"] <= 10
+        store.close()
+
+    def test_compaction_outputs_have_filters(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(300):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        store.compact()
+        assert all(segment.bloom is not None for segment in store.segments)
+        store.close()
+
+        reopened = LogStructuredStore(str(temp_dir), config)
+        for i in range(300):
+            assert reopened.get(f"key{i:03d}") == f"value{i}".encode()
+        reopened.close()
+
+class TestBlockCache:
+    def test_repeated_reads_hit_the_cache(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(200):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        store.flush()
+        for _ in range(3):
+            for i in range(200):
+                assert store.get(f"key{i:03d}") == f"value{i}".encode()
+        stats = store.get_statistics()
+        assert stats["block_cache_hits"] > 2 * stats["block_cache_misses"]
+        assert 0 < stats["block_cache_bytes"] <= config.block_cache_size
+        store.close()
+
+    def test_compaction_drops_blocks_of_removed_segments(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(200):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        store.flush()
+        for i in range(200):
+            store.get(f"key{i:03d}")
+        store.compact()
+        assert len(store.block_cache) == 0
+        for i in range(200):
+            assert store.get(f"key{i:03d}") == f"value{i}".encode()
+        store.close()
+
+    def test_cache_can_be_disabled(self, temp_dir):
+        store = LogStructuredStore(str(temp_dir), Config.from_dict({"block_cache_size": 0}))
+        store.put("key", b"value")
+        store.flush()
+        assert store.get("key") == b"value"
+        assert "block_cache_hits" not in store.get_statistics()
+        store.close()
+
+class TestCompression:
+    def test_compressed_store_reports_ratio(self, temp_dir, config):
+        config.compression = "zlib"
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(200):
+            store.put(f"key{i:03d}", b"repetitive value " * 10)
+        store.flush()
+        assert store.get("key123") == b"repetitive value " * 10
+        stats = store.get_statistics()
+        assert stats["compression"] == "zlib"
+        assert stats["compression_ratio"] > 2
+        assert stats["blocks_decoded"] > 0 and stats["block_decode_seconds"] >= 0
+        store.close()
+
+    def test_segments_of_different_codecs_stay_readable(self, temp_dir, config):
+        for round, compression in enumerate(["none", "zlib", "lzma", "bz2"]):
+            config.compression = compression
+            store = LogStructuredStore(str(temp_dir), config)
+            for i in range(50):
+                store.put(f"key{round}{i:02d}", f"value{round}-{i}".encode())
+            store.flush()
+            store.close()
+        store = LogStructuredStore(str(temp_dir), config)
+        assert {segment.codec.name for segment in store.segments} == {"none", "zlib", "lzma", "bz2"}
+        for round in range(4):
+            assert store.get(f"key{round}07") == f"value{round}-7".encode()
+        store.compact()
+        assert {segment.codec.name for segment in store.segments} == {"bz2"}
+        assert len(list(store.scan())) == 200
+        store.close()
+
+    def test_unknown_codec_is_rejected(self, temp_dir, config):
+        config.compression = "snappy"
+        with pytest.raises(ValueError):
+            LogStructuredStore(str(temp_dir), config)
+
+class TestWriteBatch:
+    def test_batch_applies_every_operation(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        store.put("old", b"value")
+        store.write_batch([("put", "key1", b"value1"), ("delete", "old", None), ("put", "key2", b"value2")])
+        assert store.get("key1") == b"value1"
+        assert store.get("key2") == b"value2"
+        assert store.get("old") is None
+        assert store.wal.record_count == 2
+        store.close()
+
+    def test_batch_survives_restart(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        store.write_batch([("put", f"key{i:03d}", f"value{i}".encode()) for i in range(50)])
+        store.wal.close()
+
+        reopened = LogStructuredStore(str(temp_dir), config)
+        for i in range(50):
+            assert reopened.get(f"key{i:03d}") == f"value{i}".encode()
+        reopened.close()
+
+    def test_invalid_batch_writes_nothing(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        with pytest.raises(ValueError):
+            store.write_batch([("put", "key1", b"value1"), ("merge", "key2", b"x")])
+        with pytest.raises(ValueError):
+            store.write_batch([("put", "key1", None)])
+        assert store.get("key1") is None
+        assert store.wal.record_count == 0
+        store.close()
+
+    def test_oversized_key_is_rejected_before_logging(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        key = "k" * 70000
+        with pytest.raises(ValueError):
+            store.put(key, b"value")
+        with pytest.raises(ValueError):
+            store.delete(key)
+        with pytest.raises(ValueError):
+            store.write_batch([("put", "key1", b"value1"), ("delete", key, None)])
+        assert store.wal.record_count == 0
+        store.put("key1", b"value1")
+        store.flush()
+        assert store.get("key1") == b"value1"
+        store.close()
+
+        reopened = LogStructuredStore(str(temp_dir), config)
+        reopened.put("key2", b"value2")
+        reopened.flush()
+        assert reopened.get("key1") == b"value1" and reopened.get(key) is None
+        reopened.close()
+
+class TestMultiGet:
+    @pytest.mark.parametrize("block_cache_size", [0, 1024 * 1024])
+    def test_matches_get(self, temp_dir, block_cache_size):
+        config = Config.from_dict({"segment_size": 4096, "max_memtable_size": 2048, "index_interval": 256,
+                                   "background_compaction": False, "block_cache_size": block_cache_size})
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(300):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        for i in range(0, 300, 5):
+            store.delete(f"key{i:03d}")
+        for i in range(0, 300, 9):
+            store.put(f"key{i:03d}", b"updated")
+        keys = [f"key{i:03d}" for i in range(350, -1, -3)] + ["key001", "key001"]
+        assert store.multi_get(keys) == {key: store.get(key) for key in keys}
+        assert list(store.multi_get(keys)) == list(dict.fromkeys(keys))
+        store.close()
+
+class TestConcurrency:
+    def test_queued_writes_share_one_wal_record(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        threads = [threading.Thread(target=store.put, args=(f"key{n}", b"value")) for n in range(8)]
+        with store._write_mutex:
+            # Every writer queues up behind the one currently writing.
+            for thread in threads:
+                thread.start()
+            while len(store._write_queue) < 8:
+                pass
+        for thread in threads:
+            thread.join()
+        assert store.wal.record_count == 1
+        assert all(store.get(f"key{n}") == b"value" for n in range(8))
+        store.close()
+
+    def test_slow_flush_blocks_neither_readers_nor_writers(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        with store._flush_mutex:
+            # Enough to freeze one memtable, not enough for backpressure.
+            for i in range(40):
+                store.put(f"key{i:03d}", b"x" * 40)
+            assert len(store._version.frozen) == 1
+            assert store.segments == []
+            for i in range(40):
+                assert store.get(f"key{i:03d}") == b"x" * 40
+            assert [key for key, _ in store.scan(limit=3)] == ["key000", "key001", "key002"]
+        store.flush()
+        assert store._version.frozen == ()
+        assert len(store.segments) == 2
+        store.close()
+
+    def test_concurrent_readers_and_writers(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        errors = []
+        written = [0] * 4
+
+        def writer(n):
+            for i in range(150):
+                store.put(f"w{n}-{i:03d}", f"{n}-{i}".encode())
+                written[n] = i + 1
+
+        def reader():
+            for attempt in range(300):
+                n = attempt % 4
+                done = written[n]
+                if done and store.get(f"w{n}-{done - 1:03d}") != f"{n}-{done - 1}".encode():
+                    errors.append((n, done))
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        threads += [threading.Thread(target=reader) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert len(list(store.scan())) == 600
+        store.close()
+
+class TestProcessPool:
+    def test_flush_and_compaction_in_worker_processes(self, temp_dir, config):
+        config.process_pool_workers = 1
+        config.compaction_strategy = "leveled"
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(400):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        store.compact()
+        assert store.executor is not None
+        assert all(segment.bloom is not None and segment.loaded_from_hints for segment in store.segments)
+        assert all(segment.level == 1 for segment in store.segments)
+        assert len(store.segments) > 1  # split at segment_size in the worker
+        for i in range(400):
+            assert store.get(f"key{i:03d}") == f"value{i}".encode()
+        store.close()
+
+class TestSnapshots:
+    def test_snapshot_ignores_later_writes(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        store.put("key1", b"old")
+        store.put("key2", b"old")
+        with store.snapshot() as snapshot:
+            store.put("key1", b"new")
+            store.delete("key2")
+            store.put("key3", b"new")
+            assert snapshot.get("key1") == b"old"
+            assert snapshot.get("key2") == b"old"
+            assert snapshot.get("key3") is None
+            assert snapshot.multi_get(["key1", "key2", "key3"]) == {"key1": b"old", "key2": b"old", "key3": None}
+            assert list(snapshot.scan()) == [("key1", b"old"), ("key2", b"old")]
+        assert store.get("key1") == b"new"
+        assert list(store.scan()) == [("key1", b"new"), ("key3", b"new")]
+        with pytest.raises(ValueError):
+            snapshot.get("key1")
+        store.close()
+
+    def test_snapshot_survives_flush_and_compaction(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(100):
+            store.put(f"key{i:03d}", b"v1")
+        snapshot = store.snapshot()
+        for round in range(2, 5):
+            for i in range(100):
+                store.put(f"key{i:03d}", f"v{round}".encode())
+            store.delete("key050")
+        store.compact()
+        assert store.get_statistics()["live_snapshots"] == 1
+        assert all(snapshot.get(f"key{i:03d}") == b"v1" for i in range(100))
+        assert [value for _, value in snapshot.scan()] == [b"v1"] * 100
+        assert store.get("key050") is None
+        assert store.get("key051") == b"v4"
+
+        # Released, the old versions go at the next compaction.
+        kept = store.get_statistics()["segment_entries"]
+        snapshot.release()
+        store.compact()
+        assert store.get_statistics()["segment_entries"] < kept
+        assert len(list(store.scan())) == 99
+        store.close()
+
+    def test_only_versions_visible_to_snapshots_are_kept(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        store.put("key", b"v1")
+        store.put("key", b"v2")
+        snapshot = store.snapshot()
+        store.put("key", b"v3")
+        store.put("key", b"v4")
+        store.flush()
+        assert [value for _, _, value in store.segments[0].iterate_versions()] == [b"v2", b"v4"]
+        assert snapshot.get("key") == b"v2"
+        snapshot.release()
+        store.close()
+
+    def test_sequence_numbers_survive_restart(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(100):
+            store.put(f"key{i:03d}", b"value")
+        store.write_batch([("put", "a", b"1"), ("put", "b", b"2")])
+        last_sequence = store.last_sequence
+        assert last_sequence == 102
+        store.close()
+
+        reopened = LogStructuredStore(str(temp_dir), config)
+        assert reopened.last_sequence == last_sequence
+        reopened.put("c", b"3")
+        assert reopened.last_sequence == last_sequence + 1
+        reopened.close()
+
+    def test_snapshot_scan_is_stable_during_writes(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(200):
+            store.put(f"key{i:03d}", b"before")
+        with store.snapshot() as snapshot:
+            scanned = []
+            for i, (key, value) in enumerate(snapshot.scan()):
+                scanned.append((key, value))
+                store.put(f"key{(i * 7) % 200:03d}", b"after")
+                store.put(f"new{i:03d}", b"after")
+            assert scanned == [(f"key{i:03d}", b"before") for i in range(200)]
+        store.close()
+
+class TestValueLog:
+    @pytest.fixture
+    def config(self, config):
+        config.value_log_threshold = 100
+        return config
+
+    def test_large_values_are_stored_once(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(40):
+            store.put(f"key{i:03d}", bytes([i]) * 500)
+            store.put(f"small{i:03d}", b"inline")
+        store.flush()
+        stats = store.get_statistics()
+        assert stats["value_log_files"] > 0
+        assert stats["value_log_bytes"] > 40 * 500
+        assert stats["segment_bytes"] < 40 * 500
+        assert store.get("key007") == bytes([7]) * 500
+        assert store.multi_get(["key008", "small008"]) == {"key008": bytes([8]) * 500, "small008": b"inline"}
+        assert dict(store.scan(end="key002")) == {"key000": bytes([0]) * 500, "key001": bytes([1]) * 500}
+
+        # Compaction copies the pointers, never the values.
+        value_log_bytes = stats["value_log_bytes"]
+        store.compact()
+        stats = store.get_statistics()
+        assert stats["value_log_bytes"] == value_log_bytes
+        assert stats["compaction_bytes_written"] < value_log_bytes
+        store.close()
+
+        reopened = LogStructuredStore(str(temp_dir), config)
+        assert reopened.get("key039") == bytes([39]) * 500
+        assert reopened.get_statistics()["value_log_garbage_bytes"] == 0
+        reopened.close()
+
+    def test_garbage_is_collected(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(40):
+            store.put(f"key{i:03d}", b"a" * 500)
+        store.flush()
+        snapshot = store.snapshot()
+        for i in range(0, 40, 4):
+            store.put(f"key{i:03d}", b"b" * 500)
+        for i in range(1, 40, 4):
+            store.delete(f"key{i:03d}")
+        store.compact()
+        # Overwritten values a snapshot can still see are not garbage.
+        assert store.get_statistics()["value_log_garbage_bytes"] == 0
+        assert snapshot.get("key001") == b"a" * 500
+
+        snapshot.release()
+        store.compact()
+        stats = store.get_statistics()
+        assert stats["value_log_collections"] > 0
+        assert stats["value_log_garbage_bytes"] == 0
+        assert 0 < stats["value_log_bytes_relocated"] < stats["value_log_bytes"]
+        assert stats["value_log_bytes"] < 40 * 500
+        files = [name for name in os.listdir(str(temp_dir)) if name.endswith(".vlog")]
+        assert len(files) == stats["value_log_files"]
+        expected = {f"key{i:03d}": (b"b" if i % 4 == 0 else b"a") * 500 for i in range(40) if i % 4 != 1}
+        assert dict(store.scan()) == expected
+        store.close()
+
+        reopened = LogStructuredStore(str(temp_dir), config)
+        assert dict(reopened.scan()) == expected
+        reopened.close()
+
+    def test_values_separated_in_worker_processes(self, temp_dir, config):
+        config.process_pool_workers = 1
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(40):
+            store.put(f"key{i:03d}", bytes([i]) * 500)
+        store.compact()
+        assert store.get_statistics()["value_log_files"] > 0
+        assert all(store.get(f"key{i:03d}") == bytes([i]) * 500 for i in range(40))
+        store.close()
+
+    def test_unreferenced_value_logs_are_removed_on_open(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        store.put("key", b"x" * 500)
+        store.flush()
+        store.close()
+        temp_dir.join("values-99999999.vlog").write_binary(b"left by a crash")
+        reopened = LogStructuredStore(str(temp_dir), config)
+        assert not temp_dir.join("values-99999999.vlog").exists()
+        assert reopened.get("key") == b"x" * 500
+        reopened.close()
+
+class TestInstrumentation:
+    def test_operations_are_timed(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(300):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        store.delete("key000")
+        store.write_batch([("put", "a", b"1"), ("delete", "b", None)])
+        for i in range(50):
+            store.get(f"key{i:03d}")
+        store.multi_get(["key001", "key002"])
+        store.compact()
+        latency = store.get_statistics()["latency"]
+        assert latency["put"]["count"] == 300
+        assert latency["get"]["count"] == 50
+        assert latency["delete"]["count"] == latency["multi_get"]["count"] == latency["write_batch"]["count"] == 1
+        assert latency["flush"]["count"] >= 1 and latency["compact"]["count"] == 1
+        assert latency["wal_sync"]["count"] >= 1
+        for summary in latency.values():
+            assert 0 < summary["p50_us"] <= summary["p99_us"] <= summary["p999_us"] <= summary["max_us"]
+        store.close()
+
+    def test_bytes_per_level(self, temp_dir, config):
+        config.compaction_strategy = "leveled"
+        store = LogStructuredStore(str(temp_dir), config)
+        for i in range(600):
+            store.put(f"key{i:03d}", f"value{i}".encode() * 3)
+        store.compact()
+        stats = store.get_statistics()
+        written = stats["bytes_written_per_level"]
+        assert written[0] == stats["flush_bytes_written"]
+        assert sum(written.values()) == stats["flush_bytes_written"] + stats["compaction_bytes_written"]
+        for i in range(600):
+            store.get(f"key{i:03d}")
+        read = store.get_statistics()["bytes_read_per_level"]
+        assert set(read) == set(stats["segments_per_level"]) and sum(read.values()) > 0
+        store.close()
+
+    def test_tracers(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir), config)
+        seen = []
+        def trace(operation, seconds, details):
+            seen.append((operation, details.get("key")))
+            assert seconds >= 0
+        def broken(operation, seconds, details):
+            raise RuntimeError("tracer bug")
+        store.add_tracer(trace)
+        store.add_tracer(broken)
+        store.put("key", b"value")
+        assert store.get("key") == b"value"
+        assert ("put", "key") in seen and ("get", "key") in seen and ("wal_sync", None) in seen
+        assert store.metrics.tracer_errors == len(seen)
+        store.remove_tracer(trace)
+        store.remove_tracer(broken)
+        count = len(seen)
+        store.get("key")
+        assert len(seen) == count
+        store.close()
+
+class TestExpiry:
+    @pytest.fixture
+    def clock(self):
+        # Milliseconds; tests move it forward by hand.
+        return [1_000_000]
+
+    def open(self, temp_dir, config, clock):
+        store = LogStructuredStore(str(temp_dir), config)
+        store.clock = lambda: clock[0]
+        return store
+
+    def test_expired_keys_read_as_deleted(self, temp_dir, config, clock):
+        store = self.open(temp_dir, config, clock)
+        store.put("a", b"old")
+        store.put("a", b"1", ttl=10)
+        store.put("b", b"2", ttl=0.5)
+        store.write_batch([("put", "c", b"3", 20), ("put", "d", b"4", None)])
+        assert store.get("a") == b"1"
+        clock[0] += 600
+        assert store.get("b") is None and store.get("a") == b"1"
+        store.flush()
+        clock[0] += 10_000
+        assert store.get("a") is None and store.get("c") == b"3"
+        assert store.multi_get(["a", "b", "c", "d"]) == {"a": None, "b": None, "c": b"3", "d": b"4"}
+        assert list(store.scan()) == [("c", b"3"), ("d", b"4")]
+        store.close()
+
+        # The expiry is absolute, so it survives both the WAL and segments.
+        store = self.open(temp_dir, config, clock)
+        store.put("e", b"5", ttl=1)
+        store.close()
+        store = self.open(temp_dir, config, clock)
+        assert store.get("e") == b"5" and store.get("a") is None
+        clock[0] += 1000
+        assert store.get("e") is None
+        store.close()
+
+    def test_invalid_ttl(self, temp_dir, config, clock):
+        store = self.open(temp_dir, config, clock)
+        with pytest.raises(ValueError):
+            store.put("a", b"1", ttl=0)
+        with pytest.raises(ValueError):
+            store.write_batch([("put", "a", b"1", -1)])
+        with pytest.raises(ValueError):
+            store.write_batch([("delete", "a", None, 5)])
+        assert store.get("a") is None
+        store.close()
+
+    def test_compaction_purges_expired_values(self, temp_dir, config, clock):
+        store = self.open(temp_dir, config, clock)
+        for i in range(100):
+            store.put(f"key{i:03d}", b"old")
+        store.flush()
+        for i in range(50):
+            store.put(f"key{i:03d}", b"new", ttl=1)
+        store.flush()
+        clock[0] += 1000
+        store.compact()
+        stats = store.get_statistics()
+        # The older segment is still live, so this is merged rather than dropped,
+        # and the overwritten values never resurface.
+        assert stats["expired_segments_dropped"] == 0
+        assert stats["segment_entries"] == 50 and stats["expiring_entries"] == 0
+        assert store.get("key000") is None and store.get("key050") == b"old"
+        store.close()
+
+    def test_wholly_expired_segments_are_dropped(self, temp_dir, config, clock):
+        store = self.open(temp_dir, config, clock)
+        for i in range(100):
+            store.put(f"key{i:03d}", b"value", ttl=1)
+        store.flush()
+        store.put("other", b"kept")
+        store.flush()
+        clock[0] += 1000
+        store.compact()
+        stats = store.get_statistics()
+        assert stats["expired_segments_dropped"] >= 1 and stats["expired_bytes_dropped"] > 0
+        assert stats["segment_entries"] == 1
+        assert store.get("key000") is None and store.get("other") == b"kept"
+        store.close()
+        store = self.open(temp_dir, config, clock)
+        assert store.get_statistics()["segment_entries"] == 1
+        store.close()
+
+class TestIngest:
+    def build(self, temp_dir, name, keys, value=b"built"):
+        path = str(temp_dir.join(name))
+        build_segment(path, [(f"key{i:03d}", value) for i in keys])
+        return path
+
+    def test_ingested_segments_shadow_older_writes(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir.mkdir("store")), config)
+        for i in range(0, 300, 2):
+            store.put(f"key{i:03d}", b"written")
+        store.flush()
+        store.put("key100", b"in memory")
+        store.put("other", b"in memory")
+        snapshot = store.snapshot()
+        wal_records = store.get_statistics()["wal_records"]
+        paths = [self.build(temp_dir, "b.seg", range(150, 300)), self.build(temp_dir, "a.seg", range(50, 150))]
+        store.ingest_segments(paths)
+        stats = store.get_statistics()
+        assert stats["segments_ingested"] == 2 and stats["wal_records"] == wal_records
+        assert store.get("key000") == b"written" and store.get("key100") == b"built"
+        assert store.get("key299") == b"built" and store.get("other") == b"in memory"
+        # Older snapshots do not see the ingest.
+        assert snapshot.get("key100") == b"in memory" and snapshot.get("key051") is None
+        snapshot.release()
+        assert all(os.path.exists(path) for path in paths)
+        store.put("key200", b"newer")
+        assert store.get("key200") == b"newer"
+        store.close()
+
+        store = LogStructuredStore(str(temp_dir.join("store")), config)
+        assert store.get("key100") == b"built" and store.get("key200") == b"newer"
+        assert store.last_sequence == 150 + 2 + 2
+        store.compact()
+        assert store.get("key100") == b"built" and store.get("key200") == b"newer"
+        assert dict(store.scan("key048", "key052")) == {"key048": b"written", "key050": b"built",
+                                                        "key051": b"built"}
+        store.close()
+
+    def test_leveled_ingest_is_not_recompacted(self, temp_dir, config):
+        config.compaction_strategy = "leveled"
+        store = LogStructuredStore(str(temp_dir.mkdir("store")), config)
+        paths = [self.build(temp_dir, f"{i}.seg", range(i * 100, i * 100 + 100)) for i in range(4)]
+        store.ingest_segments(paths, move=True)
+        assert not any(os.path.exists(path) for path in paths)
+        assert [segment.level for segment in store.segments] == [1] * 4
+        assert store.strategy.pick(store.segments) is None
+        assert store.get("key399") == b"built"
+        store.close()
+
+    def test_rejects_unsuitable_files(self, temp_dir, config):
+        store = LogStructuredStore(str(temp_dir.mkdir("store")), config)
+        overlapping = [self.build(temp_dir, "a.seg", range(0, 100)), self.build(temp_dir, "b.seg", range(99, 200))]
+        with pytest.raises(ValueError):
+            store.ingest_segments(overlapping)
+        for i in range(100):
+            store.put(f"key{i:03d}", b"written")
+        store.flush()
+        segments = list(store.segments)
+        with pytest.raises(ValueError):
+            store.ingest_segments([segments[0].file_path])
+        with pytest.raises(ValueError):
+            build_segment(str(temp_dir.join("c.seg")), [("b", b"1"), ("a", b"2")])
+        assert not os.path.exists(str(temp_dir.join("c.seg.tmp")))
+        # Nothing was linked in.
+        assert store.segments == segments and store.get_statistics()["segments_ingested"] == 0
+        assert len([name for name in os.listdir(str(temp_dir.join("store"))) if name.endswith(".seg")]) == len(segments)
+        store.close()
@@ -1,3 +1,6 @@
+import random
+import sys
+import threading
 from src.log_structured_kvstore.memtable import MemTable
 class TestMemTable:
     def test_put_and_get(self):
@@ -19,4 +22,85 @@ class TestMemTable:
 
     def test_nonexistent_key(self):
         memtable = MemTable()
-        assert memtable.get("nonexistent") is None
\ No newline at end of file
+        assert memtable.get("nonexistent") is None
+
+    def test_items_are_sorted(self):
+        memtable = MemTable()
+        for key in ["banana", "apple", "cherry"]:
+            memtable.put(key, key.encode())
+        memtable.delete("apple")
+        assert list(memtable.items()) == [("apple", None), ("banana", b"banana"), ("cherry", b"cherry")]
+
+    def test_lookup_distinguishes_tombstones(self):
+        memtable = MemTable()
+        memtable.delete("gone")
+        assert memtable.lookup("gone") == (True, None)
+        assert memtable.lookup("never") == (False, None)
+
+    def test_is_full(self):
+        memtable = MemTable(max_size=100)
+        memtable.put("key", b"x" * 50)
+        assert not memtable.is_full()
+        memtable.put("key", b"x" * 100)
+        assert memtable.is_full()
+
+    def test_items_in_range(self):
+        memtable = MemTable()
+        for key in ["a", "b", "c", "d"]:
+            memtable.put(key, key.encode())
+        assert [key for key, _ in memtable.items("b", "d")] == ["b", "c"]
+
+    def test_items_survive_concurrent_inserts(self):
+        memtable = MemTable()
+        for key in ["b", "d", "f"]:
+            memtable.put(key, b"")
+        seen = []
+        for key, _ in memtable.items():
+            seen.append(key)
+            if key == "b":
+                memtable.put("a", b"")
+                memtable.put("c", b"")
+        assert seen == ["b", "c", "d", "f"]
+
+    def test_scans_run_alongside_a_writer(self):
+        memtable = MemTable(max_size=1 << 30)
+        keys = [f"k{i:06d}" for i in range(20000)]
+        random.Random(1).shuffle(keys)
+        errors = []
+        done = threading.Event()
+        def scan():
+            try:
+                while not done.is_set():
+                    for _ in memtable.versions():
+                        pass
+            except Exception as e:
+                errors.append(e)
+        scanners = [threading.Thread(target=scan) for _ in range(2)]
+        # Switch threads often, so scans interleave with individual puts.
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for scanner in scanners:
+                scanner.start()
+            for sequence, key in enumerate(keys):
+                memtable.put(key, b"value", sequence)
+        finally:
+            done.set()
+            for scanner in scanners:
+                scanner.join()
+            sys.setswitchinterval(interval)
+        assert errors == []
+        assert len(list(memtable.versions())) == len(keys)
+
+    def test_overwritten_versions_kept_for_snapshots(self):
+        memtable = MemTable()
+        memtable.put("key", b"v1", 1)
+        memtable.put("key", b"v2", 2)
+        memtable.put("key", b"v3", 3, newest_snapshot=2)
+        memtable.delete("key", 4, newest_snapshot=2)
+        assert memtable.lookup("key") == (True, None)
+        assert memtable.lookup("key", 3) == (True, b"v2")
+        assert memtable.lookup("key", 2) == (True, b"v2")
+        # No snapshot could see v1 or v3, so neither was kept.
+        assert memtable.lookup("key", 1) == (False, None)
+        assert list(memtable.versions()) == [("key", 2, b"v2"), ("key", 4, None)]
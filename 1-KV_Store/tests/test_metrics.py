@@ -0,0 +1,54 @@
+import random
+from src.log_structured_kvstore.metrics import (BUCKET_COUNT, LatencyHistogram, Metrics, bucket_index,
+                                                bucket_upper_bound, prometheus_text)
+
+class TestLatencyHistogram:
+    def test_buckets_cover_every_latency(self):
+        previous = 0
+        for index in range(BUCKET_COUNT):
+            bound = bucket_upper_bound(index)
+            assert bound > previous
+            assert bucket_index(previous) == index and bucket_index(bound - 1) == index
+            previous = bound
+        assert bucket_index(10 ** 15) == BUCKET_COUNT - 1
+
+    def test_percentiles_are_within_precision(self):
+        histogram = LatencyHistogram()
+        rng = random.Random(3)
+        latencies = sorted(int(rng.lognormvariate(10, 1.5)) for _ in range(10000))
+        for latency in latencies:
+            histogram.record(latency)
+        assert histogram.count == 10000 and histogram.max == latencies[-1]
+        for fraction in (0.5, 0.99, 0.999):
+            exact = latencies[int(fraction * len(latencies)) - 1]
+            assert exact <= histogram.percentile(fraction) <= exact * 1.125 + 1
+
+    def test_merge(self):
+        first, second = LatencyHistogram(), LatencyHistogram()
+        first.record(1000)
+        second.record(5000)
+        second.record(9000)
+        first.merge(second)
+        assert first.count == 3 and first.total == 15000 and first.max == 9000
+
+class TestPrometheus:
+    def test_text_format(self):
+        metrics = Metrics()
+        started = 0
+        metrics.record("get", started)
+        text = prometheus_text({"segment_count": 3, "compaction_running": False, "compaction_strategy": "leveled",
+                                "segments_per_level": {0: 2, 1: 1}, "shard_entries": [5, 7], "latency": {}},
+                               metrics)
+        lines = text.splitlines()
+        assert "kvstore_segment_count 3" in lines
+        assert "kvstore_compaction_running 0" in lines
+        assert 'kvstore_segments_per_level{level="1"} 1' in lines
+        assert 'kvstore_shard_entries{shard="1"} 7' in lines
+        assert not any("compaction_strategy" in line or "latency" in line for line in lines)
+        assert "# TYPE kvstore_operation_duration_seconds histogram" in lines
+        assert 'kvstore_operation_duration_seconds_count{operation="get"} 1' in lines
+        assert 'kvstore_operation_duration_seconds_bucket{operation="get",le="+Inf"} 1' in lines
+        buckets = [int(line.rsplit(" ", 1)[1]) for line in lines if line.startswith(
+            'kvstore_operation_duration_seconds_bucket{operation="get"')]
+        assert buckets == sorted(buckets)
+        assert not any('operation="put"' in line for line in lines)
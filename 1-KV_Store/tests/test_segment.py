@@ -1,6 +1,11 @@
+import os
 import pytest
 import shutil
-from src.log_structured_kvstore.segment import Segment
+from src.log_structured_kvstore.block_cache import BLOCK_OVERHEAD, BlockCache
+from src.log_structured_kvstore.expiry import ExpiringValue
+from src.log_structured_kvstore.hint_file import hint_path
+from src.log_structured_kvstore.segment import (CACHED_ENTRY_OVERHEAD, FILE_HEADER, FOOTER, FORMAT_VERSION, MAGIC,
+                                                RESTART, Segment)
 
 @pytest.fixture
 def temp_dir(tmpdir):
@@ -44,3 +49,290 @@ class TestSegment:
             segment.append(key, value)
 
         assert list(segment.iterate_entries()) == entries
+
+    def test_sparse_index_lookup(self, temp_dir):
+        segment_file = temp_dir.join("segment.log")
+        segment = Segment(str(segment_file), index_interval=256)
+        for i in range(500):
+            segment.append(f"key{i:04d}", f"value{i}".encode())
+        assert 1 < len(segment.index_keys) < 500
+        assert segment.read("key0321") == b"value321"
+        assert segment.lookup("key9999") == (False, None)
+
+    def test_reopen_rebuilds_index(self, temp_dir):
+        segment_file = temp_dir.join("segment.log")
+        segment = Segment(str(segment_file), index_interval=128)
+        for i in range(100):
+            segment.append(f"key{i:03d}", None if i % 10 == 0 else f"value{i}".encode())
+        segment.close()
+
+        reopened = Segment(str(segment_file), index_interval=128)
+        assert reopened.entry_count == 100
+        assert reopened.index_keys == segment.index_keys
+        assert reopened.lookup("key010") == (True, None)
+        assert reopened.read("key042") == b"value42"
+
+    def test_read_returns_view_of_mapped_file(self, temp_dir):
+        segment_file = temp_dir.join("segment.log")
+        segment = Segment(str(segment_file))
+        segment.append("key1", b"value1")
+        segment.close()
+        value = Segment(str(segment_file)).read("key1")
+        assert isinstance(value, memoryview)
+        assert bytes(value) == b"value1"
+
+    def test_corrupt_record_is_detected(self, temp_dir):
+        segment_file = temp_dir.join("segment.log")
+        segment = Segment(str(segment_file))
+        segment.append("key1", b"value1")
+        segment.close()
+        data = bytearray(segment_file.read_binary())
+        data[segment.offset - 2 * RESTART.size - 1] ^= 0xFF  # last byte of the value, before the restart array
+        segment_file.write_binary(bytes(data))
+        with pytest.raises(ValueError):
+            Segment(str(segment_file)).read("key1")
+
+    def test_rejects_foreign_files(self, temp_dir):
+        segment_file = temp_dir.join("segment.log")
+        segment_file.write_binary(b'{"key": "key1", "value": "dmFsdWUx"}\n')
+        with pytest.raises(ValueError):
+            Segment(str(segment_file))
+
+    def test_rejects_older_format_versions(self, temp_dir):
+        segment_file = temp_dir.join("segment.log")
+        segment = Segment(str(segment_file))
+        segment.append("key1", b"value1")
+        segment.close()
+        data = bytearray(segment_file.read_binary())
+        _, _, codec_id = FILE_HEADER.unpack_from(data, 0)
+        FILE_HEADER.pack_into(data, 0, MAGIC, FORMAT_VERSION - 1, codec_id)
+        segment_file.write_binary(bytes(data))
+        with pytest.raises(ValueError, match="rebuild the data directory"):
+            Segment(str(segment_file))
+
+    def test_bloom_filter_is_stored_in_footer(self, temp_dir):
+        segment_file = temp_dir.join("segment.log")
+        segment = Segment(str(segment_file), expected_entries=100)
+        for i in range(100):
+            segment.append(f"key{i:03d}", f"value{i}".encode())
+        segment.close()
+        assert segment_file.size() == segment.offset + len(segment.bloom.to_bytes()) + FOOTER.size
+
+        reopened = Segment(str(segment_file))
+        assert reopened.bloom.bits == segment.bloom.bits
+        assert reopened.offset == segment.offset
+        assert reopened.read("key042") == b"value42"
+        assert [key for key, _ in reopened.iterate_entries()] == [f"key{i:03d}" for i in range(100)]
+
+    def test_bloom_filter_skips_absent_keys(self, temp_dir):
+        segment_file = temp_dir.join("segment.log")
+        segment = Segment(str(segment_file), expected_entries=100, false_positive_rate=0.01)
+        for i in range(0, 200, 2):
+            segment.append(f"key{i:03d}", b"value")
+        segment.close()
+        reopened = Segment(str(segment_file))
+        for i in range(1, 200, 2):
+            assert reopened.lookup(f"key{i:03d}") == (False, None)
+        assert reopened.bloom_skips >= 95
+        # key199 is past the last key; whatever else the filter let through
+        # was a false positive.
+        assert reopened.bloom_skips + reopened.bloom_false_positives == 99
+
+    def test_append_after_reopen_rewrites_footer(self, temp_dir):
+        segment_file = temp_dir.join("segment.log")
+        segment = Segment(str(segment_file))
+        segment.append("key1", b"value1")
+        segment.close()
+        reopened = Segment(str(segment_file))
+        reopened.append("key2", b"value2")
+        reopened.close()
+
+        final = Segment(str(segment_file))
+        assert list(final.iterate_entries()) == [("key1", b"value1"), ("key2", b"value2")]
+        assert final.bloom.may_contain("key1") and final.bloom.may_contain("key2")
+
+    def test_iterate_from_start_key(self, temp_dir):
+        segment_file = temp_dir.join("segment.log")
+        segment = Segment(str(segment_file), index_interval=128)
+        for i in range(200):
+            segment.append(f"key{i:03d}", f"value{i}".encode())
+        entries = list(segment.iterate_entries("key150"))
+        assert [key for key, _ in entries] == [f"key{i:03d}" for i in range(150, 200)]
+        assert bytes(entries[0][1]) == b"value150"
+
+    def test_lookup_many_matches_single_lookups(self, temp_dir):
+        segment_file = temp_dir.join("segment.log")
+        segment = Segment(str(segment_file), index_interval=128)
+        for i in range(0, 300, 2):
+            segment.append(f"key{i:03d}", None if i % 10 == 0 else f"value{i}".encode())
+        segment.close()
+        keys = sorted(f"key{i:03d}" for i in range(0, 300, 7))
+        found = Segment(str(segment_file), index_interval=128).lookup_many(keys)
+        expected = {key: value for key, (hit, value) in ((k, segment.lookup(k)) for k in keys) if hit}
+        assert set(found) == set(expected)
+        assert all((found[key] is None) == (expected[key] is None) for key in expected)
+        assert all(bytes(found[key]) == bytes(expected[key]) for key in expected if expected[key] is not None)
+
+    def test_lookup_as_of_sequence(self, temp_dir):
+        segment_file = temp_dir.join("segment.log")
+        segment = Segment(str(segment_file), index_interval=64)
+        for i in range(50):
+            # Versions of key020 straddle several blocks.
+            key = "key020" if 10 <= i < 30 else f"key{i:03d}"
+            segment.append(key, None if i == 29 else f"value{i}".encode(), i + 1)
+        segment.close()
+        reopened = Segment(str(segment_file), index_interval=64)
+        assert reopened.max_sequence == 50
+        assert bytes(reopened.lookup("key020", 15)[1]) == b"value14"
+        assert bytes(reopened.lookup("key020", 11)[1]) == b"value10"
+        assert reopened.lookup("key020", 10) == (False, None)
+        assert reopened.lookup("key020") == (True, None)
+        assert bytes(reopened.lookup_many(["key005", "key020"], 20)["key020"]) == b"value19"
+
+    @pytest.mark.parametrize("cached", [False, True])
+    def test_older_snapshot_misses_are_not_false_positives(self, temp_dir, cached):
+        segment_file = temp_dir.join("segment.log")
+        segment = Segment(str(segment_file), index_interval=64)
+        for i in range(50):
+            segment.append(f"key{i:03d}", f"value{i}".encode(), i + 1)
+        segment.close()
+        reopened = Segment(str(segment_file), index_interval=64, block_cache=BlockCache(1 << 20) if cached else None)
+        # Every key is here, just newer than sequence 1.
+        assert reopened.lookup("key020", 1) == (False, None)
+        assert reopened.lookup_many(["key010", "key030"], 1) == {}
+        assert reopened.bloom_false_positives == 0
+
+    def test_block_cache_charges_decoded_entries(self, temp_dir):
+        segment_file = temp_dir.join("segment.log")
+        segment = Segment(str(segment_file))
+        for i in range(100):
+            segment.append(f"key{i:03d}", b"v")
+        segment.close()
+        cache = BlockCache(1 << 20)
+        reopened = Segment(str(segment_file), block_cache=cache)
+        assert reopened.read("key050") == b"v"
+        assert cache.size == BLOCK_OVERHEAD + 100 * (len("key050") + 1 + CACHED_ENTRY_OVERHEAD)
+        assert cache.size > 2 * reopened.data_end
+
+class TestCompressedSegment:
+    @pytest.mark.parametrize("compression", ["zlib", "lzma", "bz2"])
+    def test_round_trip(self, temp_dir, compression):
+        segment_file = temp_dir.join("segment.log")
+        segment = Segment(str(segment_file), index_interval=256, compression=compression)
+        for i in range(300):
+            segment.append(f"key{i:03d}", None if i % 10 == 0 else f"value{i}".encode() * 20, i + 1)
+        # Records of the block still being written are readable too.
+        assert segment.read("key299") == b"value299" * 20
+        segment.close()
+        assert segment.offset < segment.data_end
+
+        for remove_hints in (False, True):
+            if remove_hints:
+                os.remove(hint_path(str(segment_file)))
+            reopened = Segment(str(segment_file), index_interval=256)
+            assert reopened.codec.name == compression
+            assert reopened.loaded_from_hints != remove_hints
+            assert reopened.index_keys == segment.index_keys
+            assert reopened.index_offsets == segment.index_offsets
+            assert reopened.max_sequence == 300
+            assert reopened.lookup("key010") == (True, None)
+            assert reopened.read("key042") == b"value42" * 20
+            assert reopened.lookup_many(["key005", "key010", "key150", "key999"]).keys() == {"key005", "key010",
+                                                                                            "key150"}
+            assert [key for key, _ in reopened.iterate_entries("key250")] == [f"key{i:03d}" for i in range(250, 300)]
+            assert reopened.blocks_decoded > 0
+            reopened.close()
+
+    def test_append_after_reopen_starts_a_new_block(self, temp_dir):
+        segment_file = temp_dir.join("segment.log")
+        segment = Segment(str(segment_file), compression="zlib")
+        segment.append("key1", b"value1")
+        segment.close()
+        reopened = Segment(str(segment_file))
+        reopened.append("key2", b"value2")
+        reopened.close()
+
+        final = Segment(str(segment_file))
+        assert len(final.block_positions) == 2
+        assert list(final.iterate_entries()) == [("key1", b"value1"), ("key2", b"value2")]
+
+    def test_corrupt_block_is_detected(self, temp_dir):
+        segment_file = temp_dir.join("segment.log")
+        segment = Segment(str(segment_file), compression="zlib")
+        segment.append("key1", b"value1")
+        segment.close()
+        data = bytearray(segment_file.read_binary())
+        data[segment.offset - 3] ^= 0xFF
+        segment_file.write_binary(bytes(data))
+        with pytest.raises(ValueError):
+            Segment(str(segment_file)).read("key1")
+
+    def test_unknown_codec_is_rejected(self, temp_dir):
+        with pytest.raises(ValueError):
+            Segment(str(temp_dir.join("segment.log")), compression="snappy")
+
+class TestPrefixCompressedKeys:
+    def test_shared_prefixes_are_stored_once(self, temp_dir):
+        full = Segment(str(temp_dir.join("full.seg")), restart_interval=1)
+        shared = Segment(str(temp_dir.join("shared.seg")), restart_interval=16)
+        for segment in (full, shared):
+            for i in range(500):
+                segment.append(f"tenant-42/user:{i:06d}/profile", b"v")
+            segment.close()
+        assert shared.offset < full.offset * 0.75
+        reopened = Segment(str(temp_dir.join("shared.seg")))
+        assert reopened.read("tenant-42/user:000321/profile") == b"v"
+        assert [key for key, _ in reopened.iterate_entries()] == [f"tenant-42/user:{i:06d}/profile"
+                                                                  for i in range(500)]
+
+    def test_lookups_seek_through_restart_points(self, temp_dir):
+        segment_file = temp_dir.join("segment.seg")
+        segment = Segment(str(segment_file), index_interval=4096, restart_interval=4)
+        for i in range(60):
+            # Versions of key030 straddle restart points.
+            key = "key030" if 25 <= i < 35 else f"key{i:03d}"
+            segment.append(key, f"value{i}".encode(), i + 1)
+        assert len(segment.index_keys) == 1
+        for reopen in (False, True):
+            if reopen:
+                segment.close()
+            reopened = Segment(str(segment_file)) if reopen else segment
+            assert reopened.read("key012") == b"value12"
+            assert reopened.read("key030") == b"value34"
+            assert bytes(reopened.lookup("key030", 27)[1]) == b"value26"
+            assert reopened.lookup("key031") == (False, None)
+            assert {key: bytes(value) for key, value in reopened.lookup_many(["key000", "key030", "key059"]).items()} \
+                == {"key000": b"value0", "key030": b"value34", "key059": b"value59"}
+            assert [key for key, _ in reopened.iterate_entries("key040")] == [f"key{i:03d}" for i in range(40, 60)]
+
+    def test_read_at_rebuilds_the_key(self, temp_dir):
+        segment = Segment(str(temp_dir.join("segment.seg")), restart_interval=8)
+        offsets = [segment.append(f"prefix/{i:04d}", f"value{i}".encode()) for i in range(20)]
+        segment.close()
+        key, value = Segment(segment.file_path).read_at(offsets[13])
+        assert (key, bytes(value)) == ("prefix/0013", b"value13")
+        with pytest.raises(ValueError):
+            segment.read_at(offsets[13] + 1)
+
+class TestExpiringValues:
+    def test_round_trip(self, temp_dir):
+        segment = Segment(str(temp_dir.join("segment.log")))
+        segment.append("key1", ExpiringValue(b"value1", 1000))
+        segment.append("key2", b"value2")
+        segment.append("key3", ExpiringValue(b"value3", 3000))
+        segment.close()
+        reopened = Segment(str(temp_dir.join("segment.log")))
+        assert reopened.lookup("key1") == (True, ExpiringValue(b"value1", 1000))
+        assert reopened.read("key2") == b"value2"
+        assert [value for _, _, value in reopened.iterate_versions()][2] == ExpiringValue(b"value3", 3000)
+        assert (reopened.expiring_count, reopened.max_expires_at) == (2, 3000)
+        # One value never expires, so the segment is never wholly expired.
+        assert not reopened.expired(5000)
+
+    def test_expired_once_every_entry_is(self, temp_dir):
+        segment = Segment(str(temp_dir.join("segment.log")))
+        segment.append("key1", ExpiringValue(b"value1", 1000))
+        segment.append("key2", ExpiringValue(b"value2", 2000))
+        segment.close()
+        assert not segment.expired(1500)
+        assert segment.expired(2000)
@@ -0,0 +1,176 @@
+import asyncio
+import pytest
+import shutil
+import socket
+from src.log_structured_kvstore.async_log_structured_store import AsyncLogStructuredStore
+from src.log_structured_kvstore.client import Client, ServerError
+from src.log_structured_kvstore.config import Config
+from src.log_structured_kvstore.server import RequestParser, Server, encode_command
+
+@pytest.fixture
+def temp_dir(tmpdir):
+    yield tmpdir
+    shutil.rmtree(tmpdir)
+
+@pytest.fixture
+def config():
+    return Config.from_dict({
+        "segment_size": 4096,
+        "max_memtable_size": 2048,
+        "index_interval": 256,
+        "background_compaction": False,
+        "server_port": 0
+    })
+
+def serving(temp_dir, config, test):
+    # Runs test(server, client) against a live server on a free port.
+    async def run():
+        store = await AsyncLogStructuredStore.open(str(temp_dir), config)
+        server = Server(store, config)
+        await server.start()
+        client = await Client.connect("127.0.0.1", server.port)
+        try:
+            await test(server, client)
+        finally:
+            await client.close()
+            await server.close()
+            await store.close()
+    asyncio.run(run())
+
+class TestRequestParser:
+    def test_commands_split_across_reads(self):
+        data = encode_command(b"SET", b"key", b"value\r\nwith newline") + encode_command(b"GET", b"key")
+        parser = RequestParser()
+        commands = []
+        for i in range(len(data)):
+            parser.feed(data[i:i + 1])
+            commands.extend(parser.commands())
+        assert commands == [[b"SET", b"key", b"value\r\nwith newline"], [b"GET", b"key"]]
+
+    def test_inline_commands(self):
+        parser = RequestParser()
+        parser.feed(b"PING\r\n\r\nGET  key\r\n")
+        assert parser.commands() == [[b"PING"], [b"GET", b"key"]]
+
+    def test_protocol_error_keeps_earlier_commands(self):
+        parser = RequestParser()
+        parser.feed(encode_command(b"PING") + b"*1\r\n+oops\r\n")
+        assert parser.commands() == [[b"PING"]]
+        assert parser.error is not None
+
+    def test_negative_bulk_length_is_rejected(self):
+        for length in (b"-2", b"-1"):
+            parser = RequestParser()
+            parser.feed(b"*2\r\n$3\r\nGET\r\n$" + length + b"\r\n\r\n")
+            assert parser.commands() == []
+            assert parser.error == "invalid bulk length"
+
+    def test_invalid_multibulk_length_is_rejected(self):
+        for count in (b"-1", b"99999999"):
+            parser = RequestParser()
+            parser.feed(encode_command(b"PING") + b"*" + count + b"\r\n")
+            assert parser.commands() == [[b"PING"]]
+            assert parser.error == "invalid multibulk length"
+
+class TestServer:
+    def test_get_set_delete(self, temp_dir, config):
+        async def test(server, client):
+            await client.put("key1", b"value1")
+            assert await client.get("key1") == b"value1"
+            await client.delete("key1")
+            assert await client.get("key1") is None
+            assert await client.execute("PING") == "PONG"
+        serving(temp_dir, config, test)
+
+    def test_pipeline_is_batched(self, temp_dir, config):
+        async def test(server, client):
+            replies = await client.pipeline([("SET", f"key{i:04d}", f"value{i}") for i in range(2000)])
+            assert replies == ["OK"] * 2000
+            # Runs of pipelined writes share WAL records.
+            assert server.store.get_statistics()["wal_records"] < 100
+            replies = await client.pipeline([("GET", f"key{i:04d}") for i in range(2000)])
+            assert replies == [f"value{i}".encode() for i in range(2000)]
+            assert server.commands_processed == 4000
+        serving(temp_dir, config, test)
+
+    def test_pipeline_keeps_command_order(self, temp_dir, config):
+        async def test(server, client):
+            replies = await client.pipeline([("SET", "key", "1"), ("GET", "key"), ("DEL", "key", "other"),
+                                             ("GET", "key"), ("MSET", "a", "1", "b", "2"),
+                                             ("MGET", "a", "b", "key")])
+            assert replies == ["OK", b"1", 2, None, "OK", [b"1", b"2", None]]
+        serving(temp_dir, config, test)
+
+    def test_errors_do_not_break_the_pipeline(self, temp_dir, config):
+        async def test(server, client):
+            replies = await client.pipeline([("SET", "key"), ("SET", "key", "value"), ("NOPE",),
+                                             ("GET", "key"), ("MSET", "a"), ("GET", b"\xff")])
+            assert [type(reply) for reply in replies] == [ServerError, str, ServerError, bytes, ServerError,
+                                                          ServerError]
+            assert replies[3] == b"value"
+            with pytest.raises(ServerError):
+                await client.execute("GET")
+        serving(temp_dir, config, test)
+
+    def test_set_with_expiry(self, temp_dir, config):
+        async def test(server, client):
+            clock = [1_000_000]
+            server.store.store.clock = lambda: clock[0]
+            replies = await client.pipeline([("SET", "a", "1", "EX", "10"), ("SET", "b", "2", "px", "500"),
+                                             ("SET", "c", "3", "EX", "0"), ("SET", "c", "3", "EX"),
+                                             ("SET", "c", "3", "KEEPTTL")])
+            assert replies[:2] == ["OK", "OK"]
+            assert all(isinstance(reply, ServerError) for reply in replies[2:])
+            await client.put("d", b"4", ttl=2)
+            clock[0] += 1000
+            assert await client.multi_get(["a", "b", "c", "d"]) == {"a": b"1", "b": None, "c": None, "d": b"4"}
+            clock[0] += 1000
+            assert await client.get("d") is None
+        serving(temp_dir, config, test)
+
+    def test_multi_get(self, temp_dir, config):
+        async def test(server, client):
+            await client.execute("MSET", *[part for i in range(100) for part in (f"key{i:03d}", f"value{i}")])
+            found = await client.multi_get([f"key{i:03d}" for i in range(0, 200, 10)])
+            assert found == {f"key{i:03d}": f"value{i}".encode() if i < 100 else None for i in range(0, 200, 10)}
+        serving(temp_dir, config, test)
+
+    def test_connection_limit(self, temp_dir, config):
+        config.server_max_connections = 1
+        async def test(server, client):
+            await client.execute("PING")
+            other = await Client.connect("127.0.0.1", server.port)
+            with pytest.raises(ServerError):
+                await other.execute("PING")
+            await other.close()
+            assert server.rejected_connections == 1
+        serving(temp_dir, config, test)
+
+    def test_info_reports_store_and_server(self, temp_dir, config):
+        async def test(server, client):
+            info = (await client.execute("INFO")).decode()
+            assert "connected_clients:1" in info
+            assert "segment_count:" in info
+        serving(temp_dir, config, test)
+
+    def test_metrics(self, temp_dir, config):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            config.metrics_port = probe.getsockname()[1]
+        async def scrape(port, path):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET " + path + b" HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            response = await reader.read()
+            writer.close()
+            return response
+        async def test(server, client):
+            await client.put("key", b"value")
+            await client.get("key")
+            text = (await client.execute("METRICS")).decode()
+            assert "kvstore_commands_processed" in text
+            assert 'kvstore_operation_duration_seconds_count{operation="write_batch"} 1' in text
+            response = await scrape(server.metrics_port, b"/metrics")
+            assert response.startswith(b"HTTP/1.0 200 OK\r\n")
+            assert b"kvstore_segment_count 0" in response
+            assert (await scrape(server.metrics_port, b"/")).startswith(b"HTTP/1.0 404")
+        serving(temp_dir, config, test)
@@ -0,0 +1,93 @@
+import pytest
+import shutil
+import os
+from collections import Counter
+from src.log_structured_kvstore.sharded_store import HashRing, ShardedStore
+from src.log_structured_kvstore.config import Config
+
+@pytest.fixture
+def temp_dir(tmpdir):
+    yield tmpdir
+    shutil.rmtree(tmpdir)
+
+@pytest.fixture
+def config():
+    return Config.from_dict({
+        "segment_size": 4096,
+        "max_memtable_size": 2048,
+        "index_interval": 256,
+        "background_compaction": False,
+        "shard_count": 4
+    })
+
+class TestHashRing:
+    def test_spreads_keys_evenly(self):
+        ring = HashRing(4)
+        counts = Counter(ring.shard_for(f"key{i}") for i in range(10000))
+        assert sorted(counts) == [0, 1, 2, 3]
+        assert min(counts.values()) > 1500
+
+    def test_adding_a_shard_moves_few_keys(self):
+        before, after = HashRing(4), HashRing(5)
+        moved = sum(before.shard_for(f"key{i}") != after.shard_for(f"key{i}") for i in range(10000))
+        assert moved < 3000
+
+class TestShardedStore:
+    def test_routes_keys_to_subdirectories(self, temp_dir, config):
+        store = ShardedStore(str(temp_dir), config)
+        for i in range(400):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        store.delete("key007")
+        assert sorted(os.listdir(temp_dir)) == ["shard-000", "shard-001", "shard-002", "shard-003"]
+        assert all(stats > 0 for stats in store.get_statistics()["shard_entries"])
+        assert store.get("key123") == b"value123"
+        assert store.get("key007") is None
+        store.close()
+
+    def test_scan_batch_and_multi_get_span_shards(self, temp_dir, config):
+        store = ShardedStore(str(temp_dir), config)
+        store.write_batch([("put", f"key{i:03d}", b"v") for i in range(100)] + [("delete", "key050", None)])
+        assert [key for key, _ in store.scan("key045", "key053")] == \
+            ["key045", "key046", "key047", "key048", "key049", "key051", "key052"]
+        assert len(list(store.scan(limit=10))) == 10
+        assert store.multi_get(["key001", "key050", "key099"]) == {"key001": b"v", "key050": None, "key099": b"v"}
+        store.close()
+
+    def test_reopen_and_shard_count_mismatch(self, temp_dir, config):
+        store = ShardedStore(str(temp_dir), config)
+        for i in range(200):
+            store.put(f"key{i:03d}", b"v")
+        store.close()
+        reopened = ShardedStore(str(temp_dir), config)
+        assert all(reopened.get(f"key{i:03d}") == b"v" for i in range(200))
+        reopened.close()
+        config.shard_count = 3
+        with pytest.raises(ValueError):
+            ShardedStore(str(temp_dir), config)
+
+    def test_process_pool_flush_and_compaction(self, temp_dir, config):
+        config.process_pool_workers = 2
+        store = ShardedStore(str(temp_dir), config)
+        for i in range(600):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        for i in range(0, 600, 4):
+            store.delete(f"key{i:03d}")
+        store.compact()
+        assert all(len(shard.segments) == 1 for shard in store.shards)
+        for i in range(600):
+            assert store.get(f"key{i:03d}") == (None if i % 4 == 0 else f"value{i}".encode())
+        store.close()
+
+    def test_shards_share_one_block_cache(self, temp_dir, config):
+        config.block_cache_size = 64 * 1024
+        store = ShardedStore(str(temp_dir), config)
+        assert all(shard.block_cache is store.block_cache for shard in store.shards)
+        for i in range(600):
+            store.put(f"key{i:03d}", f"value{i}".encode())
+        store.flush()
+        for i in range(600):
+            assert store.get(f"key{i:03d}") == f"value{i}".encode()
+        stats = store.get_statistics()
+        assert 0 < stats["block_cache_bytes"] <= config.block_cache_size
+        assert stats["block_cache_misses"] == store.block_cache.misses
+        store.close()
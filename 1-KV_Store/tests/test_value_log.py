@@ -0,0 +1,67 @@
+import pytest
+import shutil
+from src.log_structured_kvstore.segment import Segment
+from src.log_structured_kvstore.value_log import (ValueLog, ValueLogWriter, ValuePointer, separate_values,
+                                                   value_log_id, value_log_path)
+
+@pytest.fixture
+def temp_dir(tmpdir):
+    yield tmpdir
+    shutil.rmtree(tmpdir)
+
+class TestValueLog:
+    def test_write_and_read(self, temp_dir):
+        path = value_log_path(str(temp_dir), 7)
+        assert value_log_id(path) == 7
+        writer = ValueLogWriter(path)
+        pointers = [writer.append(f"key{i}", bytes([i]) * 1000) for i in range(10)]
+        assert writer.close() == path
+        value_log = ValueLog(path)
+        assert value_log.data_bytes == sum(pointer.size for pointer in pointers)
+        assert all(pointer.file_id == 7 for pointer in pointers)
+        assert bytes(value_log.read(pointers[3])) == bytes([3]) * 1000
+        value_log.close()
+
+    def test_unused_writer_leaves_no_file(self, temp_dir):
+        writer = ValueLogWriter(value_log_path(str(temp_dir), 1))
+        assert writer.close() is None
+        assert temp_dir.listdir() == []
+
+    def test_corrupt_value_is_detected(self, temp_dir):
+        path = value_log_path(str(temp_dir), 1)
+        writer = ValueLogWriter(path)
+        pointer = writer.append("key", b"value" * 100)
+        writer.close()
+        with open(path, "r+b") as f:
+            f.seek(pointer.offset + pointer.size - 1)
+            f.write(b"!")
+        with pytest.raises(ValueError):
+            ValueLog(path).read(pointer)
+        with pytest.raises(ValueError):
+            ValueLog(path).read(pointer._replace(size=pointer.size + 1))
+
+    def test_separate_values(self, temp_dir):
+        writer = ValueLogWriter(value_log_path(str(temp_dir), 1))
+        old = ValuePointer(9, 16, 100)
+        versions = [("a", 1, b"small"), ("b", 2, b"x" * 200), ("c", 3, None), ("d", 4, old)]
+        separated = list(separate_values(versions, writer, 100))
+        assert separated[0] == ("a", 1, b"small")
+        assert isinstance(separated[1][2], ValuePointer) and separated[1][2].file_id == 1
+        assert separated[2:] == [("c", 3, None), ("d", 4, old)]
+
+        relocated = list(separate_values([("d", 4, old)], writer, 100, {9}, lambda pointer: b"moved"))
+        assert relocated[0][2].file_id == 1
+        writer.close()
+        assert bytes(ValueLog(writer.file_path).read(relocated[0][2])) == b"moved"
+
+    def test_segments_store_pointers(self, temp_dir):
+        path = str(temp_dir.join("segment.seg"))
+        segment = Segment(path)
+        pointer = ValuePointer(3, 16, 1000)
+        segment.append("key1", pointer, 1)
+        segment.append("key2", b"inline", 2)
+        segment.close()
+        assert segment.value_refs == {3: 1000}
+        reopened = Segment(path)
+        assert reopened.lookup("key1") == (True, pointer)
+        assert [value for _, _, value in reopened.iterate_versions()] == [pointer, b"inline"]
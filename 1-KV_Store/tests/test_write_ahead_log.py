@@ -1,5 +1,8 @@
 import pytest
+import os
 import shutil
+import threading
+from src.log_structured_kvstore.expiry import ExpiringValue
 from src.log_structured_kvstore.write_ahead_log import WriteAheadLog
 
 @pytest.fixture
@@ -12,14 +15,14 @@ class TestWriteAheadLog:
         wal = WriteAheadLog(str(temp_dir))
         wal.append("put", "key1", b"value1")
         wal.append("delete", "key2")
-        recovered = wal.recover()
+        recovered = list(wal.recover())
         assert recovered == [("put", "key1", b"value1"), ("delete", "key2", None)]
 
     def test_append_many_entries(self, temp_dir):
         wal = WriteAheadLog(str(temp_dir))
         for i in range(1000):
             wal.append("put", f"key{i}", f"value{i}".encode())
-        recovered = wal.recover()
+        recovered = list(wal.recover())
         assert len(recovered) == 1000
         assert recovered[500] == ("put", "key500", b"value500")
 
@@ -30,6 +33,114 @@ class TestWriteAheadLog:
 
         # Simulate a crash by creating a new WAL instance
         wal2 = WriteAheadLog(str(temp_dir))
-        recovered = wal2.recover()
+        recovered = list(wal2.recover())
         assert len(recovered) == 100
         assert recovered[50] == ("put", "key50", b"value50")
+
+    def test_group_commit_shares_fsyncs(self, temp_dir):
+        wal = WriteAheadLog(str(temp_dir), sync_policy="always")
+        barrier = threading.Barrier(8)
+
+        def writer(n):
+            barrier.wait()
+            for i in range(50):
+                wal.append("put", f"key{n}-{i}", b"value")
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert wal.record_count == 400
+        assert 0 < wal.sync_count <= 400
+        assert len(list(wal.recover())) == 400
+
+    def test_batch_policy_acknowledges_after_sync(self, temp_dir):
+        wal = WriteAheadLog(str(temp_dir), sync_policy="batch", sync_interval_ms=1)
+        lsn = wal.append("put", "key1", b"value1", wait=False)
+        wal.wait_for_sync(lsn)
+        wal2 = WriteAheadLog(str(temp_dir))
+        assert list(wal2.recover()) == [("put", "key1", b"value1")]
+        wal.close()
+
+    def test_batch_policy_syncs_on_byte_threshold(self, temp_dir):
+        wal = WriteAheadLog(str(temp_dir), sync_policy="batch", sync_interval_ms=60000, sync_bytes=64)
+        wal.append("put", "key1", b"x" * 100)
+        assert wal.sync_count == 1
+        wal.close()
+
+    def test_never_policy_writes_without_fsync(self, temp_dir):
+        wal = WriteAheadLog(str(temp_dir), sync_policy="never")
+        wal.append("put", "key1", b"value1")
+        assert wal.sync_count == 0
+        assert list(WriteAheadLog(str(temp_dir)).recover()) == [("put", "key1", b"value1")]
+
+    def test_unknown_sync_policy(self, temp_dir):
+        with pytest.raises(ValueError):
+            WriteAheadLog(str(temp_dir), sync_policy="sometimes")
+
+    def test_rolls_over_to_new_files(self, temp_dir):
+        wal = WriteAheadLog(str(temp_dir), file_size=256)
+        for i in range(100):
+            wal.append("put", f"key{i}", f"value{i}".encode())
+        assert len(wal.file_ids()) > 1
+        recovered = list(wal.recover())
+        assert len(recovered) == 100
+        assert recovered[-1] == ("put", "key99", b"value99")
+
+    def test_checkpoint_drops_covered_files(self, temp_dir):
+        wal = WriteAheadLog(str(temp_dir))
+        wal.append("put", "flushed", b"old")
+        checkpoint = wal.rotate()
+        wal.append("put", "pending", b"new")
+        wal.checkpoint(checkpoint)
+        assert list(wal.recover()) == [("put", "pending", b"new")]
+
+    def test_recover_streams_records(self, temp_dir):
+        wal = WriteAheadLog(str(temp_dir))
+        wal.append("put", "key1", b"value1")
+        recovered = wal.recover()
+        assert not isinstance(recovered, list)
+        assert next(recovered) == ("put", "key1", b"value1")
+
+    def test_torn_tail_does_not_hide_later_files(self, temp_dir):
+        wal1 = WriteAheadLog(str(temp_dir))
+        wal1.append("put", "key1", b"value1")
+        with open(wal1.file_path, "ab") as f:
+            f.write(b"\x01\x02\x03")
+        wal2 = WriteAheadLog(str(temp_dir))
+        wal2.append("put", "key2", b"value2")
+        assert list(wal2.recover()) == [("put", "key1", b"value1"), ("put", "key2", b"value2")]
+
+    def test_batch_is_one_record(self, temp_dir):
+        wal = WriteAheadLog(str(temp_dir))
+        operations = [("put", "key1", b"value1"), ("delete", "key2", None), ("put", "key3", b"")]
+        wal.append_batch(operations)
+        wal.append("put", "key4", b"value4")
+        assert wal.record_count == 2
+        assert list(wal.recover()) == operations + [("put", "key4", b"value4")]
+
+    def test_torn_batch_is_dropped_whole(self, temp_dir):
+        wal = WriteAheadLog(str(temp_dir))
+        wal.append("put", "key0", b"value0")
+        wal.append_batch([("put", f"key{i}", b"x" * 100) for i in range(1, 10)])
+        wal.close()
+        path = os.path.join(str(temp_dir), sorted(os.listdir(str(temp_dir)))[-1])
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) - 50)
+        assert list(WriteAheadLog(str(temp_dir)).recover()) == [("put", "key0", b"value0")]
+
+    def test_replay_restores_sequence_numbers(self, temp_dir):
+        wal = WriteAheadLog(str(temp_dir))
+        wal.append("put", "key1", b"value1", sequence=7)
+        wal.append_batch([("put", "key2", b"value2"), ("delete", "key1", None)], sequence=8)
+        assert list(wal.replay()) == [(7, "put", "key1", b"value1"), (8, "put", "key2", b"value2"),
+                                      (9, "delete", "key1", None)]
+
+    def test_expiring_puts_keep_their_expiry(self, temp_dir):
+        wal = WriteAheadLog(str(temp_dir))
+        wal.append("put", "key1", ExpiringValue(b"value1", 1234))
+        wal.append_batch([("put", "key2", ExpiringValue(b"", 5678)), ("put", "key3", b"value3")])
+        assert list(WriteAheadLog(str(temp_dir)).recover()) == [("put", "key1", ExpiringValue(b"value1", 1234)),
+                                                                ("put", "key2", ExpiringValue(b"", 5678)),
+                                                                ("put", "key3", b"value3")]